@@ -0,0 +1,4 @@
+"""Benchmarks of the TDAG analysis hot paths, run over synthetic traces of several sizes
+
+See README.md in this directory for usage.
+"""
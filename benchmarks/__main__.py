@@ -0,0 +1,211 @@
+"""
+Runs the benchmarks, or compares the results of two runs
+
+    python -m benchmarks run --output results.json
+    python -m benchmarks compare baseline.json results.json
+
+Every benchmark runs in a fresh interpreter, which reports the time of each repetition. The peak RSS of that process
+is recorded as well.
+"""
+
+from argparse import ArgumentParser, Namespace
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .suite import BENCHMARKS, DEFAULT_SIZES, SIZES, trace_path
+
+
+def _worker(args: Namespace) -> int:
+    benchmark = BENCHMARKS[args.benchmark]
+    times = []
+    for _ in range(args.repeat):
+        state = benchmark.setup(args.trace)
+        start = time.perf_counter()
+        benchmark.run(state)
+        times.append(time.perf_counter() - start)
+        del state
+    json.dump(times, sys.stdout)
+    return 0
+
+
+def _run_worker(name: str, trace: Path, repeat: int) -> Tuple[List[float], int]:
+    """Runs a benchmark in a new process, returns its times and peak RSS in bytes"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks", "_worker", name, str(trace), str(repeat)],
+        cwd=Path(__file__).parent.parent,
+        stdout=subprocess.PIPE,
+        env={**os.environ, "TQDM_DISABLE": "1"},
+    )
+    assert process.stdout is not None
+    output = process.stdout.read()
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"benchmark {name} failed with exit code {process.returncode}"
+        )
+    # ru_maxrss is in kilobytes on Linux, and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return json.loads(output), rusage.ru_maxrss * scale
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run(args: Namespace) -> int:
+    names = args.benchmarks or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.stderr.write(f"unknown benchmarks: {', '.join(unknown)}\n")
+        return 1
+    results = []
+    for size in args.sizes:
+        trace = trace_path(args.trace_dir, size)
+        for name in names:
+            times, peak_rss = _run_worker(name, trace, args.repeat)
+            results.append(
+                {
+                    "benchmark": name,
+                    "size": size,
+                    "times": times,
+                    "min": min(times),
+                    "median": statistics.median(times),
+                    "peak_rss": peak_rss,
+                }
+            )
+            sys.stderr.write(
+                f"{name:>20} {size:>8} {statistics.median(times) * 1000:12.2f} ms "
+                f"{peak_rss / (1 << 20):10.1f} MiB\n"
+            )
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def _compare(args: Namespace) -> int:
+    def load(path: Path) -> Dict[Tuple[str, str], dict]:
+        with open(path) as f:
+            return {(r["benchmark"], r["size"]): r for r in json.load(f)["results"]}
+
+    baseline = load(args.BASELINE)
+    current = load(args.CURRENT)
+    regressions = 0
+    print(f"{'benchmark':>20} {'size':>8} {'time':>9} {'peak rss':>9}")
+    for key in sorted(baseline.keys() & current.keys()):
+        old, new = baseline[key], current[key]
+        time_ratio = new["median"] / old["median"]
+        rss_ratio = new["peak_rss"] / old["peak_rss"]
+        slower = (
+            time_ratio > 1 + args.time_threshold
+            and new["median"] - old["median"] > args.noise
+        )
+        larger = rss_ratio > 1 + args.rss_threshold
+        flag = " REGRESSION" if slower or larger else ""
+        regressions += bool(flag)
+        print(f"{key[0]:>20} {key[1]:>8} {time_ratio:8.2f}x {rss_ratio:8.2f}x{flag}")
+    for key in sorted(baseline.keys() ^ current.keys()):
+        print(
+            f"{key[0]:>20} {key[1]:>8} only in {'baseline' if key in baseline else 'current'}"
+        )
+    if regressions:
+        sys.stderr.write(f"{regressions} regression(s)\n")
+        return 1
+    return 0
+
+
+def main() -> int:
+    parser = ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    commands = parser.add_subparsers(title="command", dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks")
+    run.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})",
+    )
+    run.add_argument(
+        "--sizes",
+        nargs="+",
+        choices=list(SIZES),
+        default=list(DEFAULT_SIZES),
+        help="trace sizes to run the benchmarks on (default: %(default)s)",
+    )
+    run.add_argument(
+        "--repeat", "-r", type=int, default=3, help="repetitions of each benchmark"
+    )
+    run.add_argument(
+        "--trace-dir",
+        type=Path,
+        default=Path(tempfile.gettempdir()) / "polytracker-benchmarks",
+        help="directory where the generated traces are kept (default: %(default)s)",
+    )
+    run.add_argument(
+        "--output", "-o", type=Path, help="write the results to this JSON file"
+    )
+    run.set_defaults(func=_run)
+
+    compare = commands.add_parser(
+        "compare", help="flag regressions between the results of two runs"
+    )
+    compare.add_argument("BASELINE", type=Path, help="results of the baseline")
+    compare.add_argument("CURRENT", type=Path, help="results to compare")
+    compare.add_argument(
+        "--time-threshold",
+        type=float,
+        default=0.1,
+        help="relative increase of the median time flagged (default: %(default)s)",
+    )
+    compare.add_argument(
+        "--rss-threshold",
+        type=float,
+        default=0.1,
+        help="relative increase of the peak RSS flagged (default: %(default)s)",
+    )
+    compare.add_argument(
+        "--noise",
+        type=float,
+        default=0.005,
+        help="time differences below this many seconds are never flagged (default: %(default)s)",
+    )
+    compare.set_defaults(func=_compare)
+
+    worker = commands.add_parser("_worker")
+    worker.add_argument("benchmark")
+    worker.add_argument("trace", type=Path)
+    worker.add_argument("repeat", type=int)
+    worker.set_defaults(func=_worker)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
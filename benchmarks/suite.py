@@ -0,0 +1,105 @@
+"""The benchmarks, and the synthetic traces they run on"""
+
+from pathlib import Path
+import subprocess
+import sys
+from typing import Any, Callable, Dict, NamedTuple
+
+from polytracker.mapping import InputOutputMapping
+from polytracker.synthetic import SyntheticTrace
+from polytracker.taint_dag import TDControlFlowLogSection, TDFile, TDProgramTrace
+
+SIZES: Dict[str, int] = {
+    "small": 1 << 16,
+    "medium": 1 << 20,
+    "large": 1 << 24,
+}
+"""Number of labels of the trace of each size."""
+
+DEFAULT_SIZES = ("small", "medium")
+
+
+def synthetic_trace(labels: int) -> SyntheticTrace:
+    """The synthetic trace of a size, with sinks and control flow proportional to its labels"""
+    return SyntheticTrace(
+        labels=labels,
+        sources=4,
+        sinks=labels // 64,
+        sink_run_length=8,
+        control_flow_records=labels // 4,
+        seed=0,
+    )
+
+
+def trace_path(trace_dir: Path, size: str) -> Path:
+    """Returns the trace of `size` in `trace_dir`, generating it first if needed"""
+    path = trace_dir / f"{size}.tdag"
+    if not path.exists():
+        trace_dir.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix(".partial")
+        with open(partial, "wb") as f:
+            synthetic_trace(SIZES[size]).write(f)
+        partial.rename(path)
+    return path
+
+
+class Benchmark(NamedTuple):
+    setup: Callable[[Path], Any]
+    """Prepares the argument of :attr:`run` from the trace path, not timed"""
+    run: Callable[[Any], Any]
+    """The timed operation"""
+
+
+def _open(path: Path) -> TDFile:
+    # The file is memory mapped by TDFile, so it does not need to stay open
+    with open(path, "rb") as f:
+        return TDFile(f)
+
+
+def _decode_nodes(tdfile: TDFile):
+    for label in range(1, min(tdfile.label_count, 1 << 20)):
+        tdfile.decode_node(label)
+
+
+def _consume(iterator):
+    for _ in iterator:
+        pass
+
+
+def _control_flow_log(tdfile: TDFile):
+    cflog = tdfile._get_section(TDControlFlowLogSection)
+    _consume(cflog)
+
+
+def _taint_forest(path: Path) -> TDProgramTrace:
+    # TDProgramTrace builds its TDTaintForest on construction
+    with open(path, "rb") as f:
+        return TDProgramTrace(f)
+
+
+# Equivalent to the `polytracker` console script
+_CLI = "import sys; from polytracker import main; sys.exit(main())"
+
+
+def _cli_startup(path: Path):
+    subprocess.run(
+        [sys.executable, "-c", _CLI, "info", "--help"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    "open": Benchmark(lambda path: path, _open),
+    "decode_node": Benchmark(_open, _decode_nodes),
+    "input_labels": Benchmark(_open, lambda tdfile: _consume(tdfile.input_labels())),
+    "sinks": Benchmark(_open, lambda tdfile: _consume(tdfile.sinks)),
+    "control_flow_log": Benchmark(_open, _control_flow_log),
+    "mapping": Benchmark(_open, lambda tdfile: InputOutputMapping(tdfile).mapping()),
+    "file_cavities": Benchmark(
+        _open, lambda tdfile: InputOutputMapping(tdfile).file_cavities()
+    ),
+    "taint_forest": Benchmark(lambda path: path, _taint_forest),
+    "cli_startup": Benchmark(lambda path: path, _cli_startup),
+}
+"""The benchmarks by name. Each one runs in its own process, so its peak RSS can be measured."""
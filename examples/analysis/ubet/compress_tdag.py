@@ -29,6 +29,7 @@ def compact_section(
     section_out.offset = section_in.align * round(starting_offset / section_in.align)
     section_out.align = section_in.align
     section_out.size = section_in.size
+    section_out.capacity = section_in.capacity
     section_out.tag = section_in.tag
     return section_out
 
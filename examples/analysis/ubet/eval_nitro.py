@@ -6,6 +6,12 @@ import sys
 from typing import Optional, Set, Iterator, Tuple, Dict
 from polytracker import PolyTrackerTrace, taint_dag
 from polytracker.taint_dag import TDFile, TDNode, TDSourceNode, TDUnionNode, TDRangeNode
+from polytracker.diffing import (
+    ControlFlowLogEncoding,
+    TDTraceDiff,
+    TDTraceSummary,
+    align_control_flow_logs,
+)
 from polytracker.mapping import InputOutputMapping
 from pathlib import Path
 
@@ -156,12 +162,9 @@ def enum_diff(dbg_tdfile, rel_tdfile):
         i += 1
 
 
-def compare_inputs_used(dbg_tdfile, rel_tdfile):
-    dbg_mapping = OutputInputMapping(dbg_tdfile).mapping()
-    rel_mapping = OutputInputMapping(rel_tdfile).mapping()
-    inputs_dbg = set(x[1] for x in dbg_mapping)
-    inputs_rel = set(x[1] for x in rel_mapping)
-    print(f"Input diffs: {sorted(inputs_rel-inputs_dbg)}")
+def compare_inputs_used(dbg_trace, rel_trace):
+    diff = TDTraceDiff(TDTraceSummary(dbg_trace), TDTraceSummary(rel_trace))
+    diff.write(sys.stdout, "DBG", "REL")
 
 
 def compare_run_trace(tdfdbg, tdfrel):
@@ -171,33 +174,6 @@ def compare_run_trace(tdfdbg, tdfrel):
         print(f"{e}: {fn}")
 
 
-def input_set(first_label: int, tdag) -> Set[int]:
-    q = [first_label]
-    ret = set()
-    seen = set()
-    while q:
-        label = q.pop()
-        if label in seen:
-            continue
-        seen.add(label)
-
-        n = tdag.decode_node(label)
-        if isinstance(n, taint_dag.TDSourceNode):
-            ret.add(n)
-        elif isinstance(n, taint_dag.TDUnionNode):
-            q.append(n.left)
-            q.append(n.right)
-        else:
-            for lbl in range(n.first, n.last + 1):
-                q.append(lbl)
-
-    return ret
-
-
-def input_offsets(first_label: int, tdag) -> Set[int]:
-    return sorted(map(lambda n: n.offset, input_set(first_label, tdag)))
-
-
 def run_nitro(is_debug, filename):
     args = [bin_path(is_debug), filename]
     return subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -266,82 +242,21 @@ def print_cols(dbg, release, additional=""):
 def compare_cflog(dbg_tdfile, rel_tdfile):
     import json
 
-    def get_cflog_entires(tdfile, is_debug):
+    def get_cflog_encoding(tdfile, is_debug):
         with open(function_id_path(is_debug)) as f:
             function_id = json.load(f)
-        cflog = tdfile._get_section(taint_dag.TDControlFlowLogSection)
-        cflog.function_id_mapping(list(map(cxxfilt.demangle, function_id)))
-        return list(
-            map(
-                lambda e: (input_offsets(e.label, tdfile), e.callstack),
-                filter(
-                    lambda e: isinstance(e, taint_dag.TDTaintedControlFlowEvent), cflog
-                ),
-            )
-        )
+        return ControlFlowLogEncoding(tdfile, list(map(cxxfilt.demangle, function_id)))
 
-    dbg = get_cflog_entires(dbg_tdfile, True)
-    rel = get_cflog_entires(rel_tdfile, False)
+    dbg = get_cflog_encoding(dbg_tdfile, True)
+    rel = get_cflog_encoding(rel_tdfile, False)
 
     print("COMPARE CONTROL FLOW LOGS")
-    n = max(len(dbg), len(rel))
-
-    len_dbg = len(dbg)
-    len_rel = len(rel)
-
-    dbgidx = 0
-    relidx = 0
-    while dbgidx < len_dbg or relidx < len_rel:
-        dbg_entry = dbg[dbgidx] if dbgidx < len_dbg else None
-        rel_entry = rel[relidx] if relidx < len_rel else None
-
-        if dbg_entry is None:
-            print_cols("", str(rel_entry), "")
-            relidx += 1
-            continue
-
-        if rel_entry is None:
-            print_cols(str(dbg_entry), "", "")
-            dbgidx += 1
-            continue
-
-        dbg_callstack = str(dbg_entry[1])
-        rel_callstack = str(rel_entry[1])
-
-        if dbg_entry[0] == rel_entry[0]:
-            print_cols(
-                str(dbg_entry[0]),
-                str(rel_entry[0]),
-                f" !!! DBG: {dbg_callstack} != REL: {rel_callstack}"
-                if dbg_callstack != rel_callstack
-                else "",
-            )
-            dbgidx += 1
-            relidx += 1
-        else:
-            # check if we should be stepping debug or release
-            # depending on shortest path
-            debug_steps = 0
-            release_steps = 0
-
-            while dbgidx + debug_steps < len_dbg:
-                if dbg[dbgidx + debug_steps][0] == rel_entry[0]:
-                    break
-                debug_steps += 1
-
-            while relidx + release_steps < len_rel:
-                if rel[relidx + release_steps][0] == dbg_entry[0]:
-                    break
-                release_steps += 1
-
-            if debug_steps < release_steps:
-                print_cols(str(dbg_entry[0]), "", dbg_callstack)
-                dbgidx += 1
-            else:
-                print_cols("", str(rel_entry[0]), rel_callstack)
-                relidx += 1
-
-    return
+    for divergence in align_control_flow_logs(dbg, rel):
+        print_cols(
+            f"[{divergence.first_begin}, {divergence.first_end})",
+            f"[{divergence.second_begin}, {divergence.second_end})",
+            f" DBG: {divergence.first_callstack} REL: {divergence.second_callstack}",
+        )
 
 
 def compare_input_output(dbg_tdfile, rel_tdfile):
@@ -393,7 +308,7 @@ def do_comparison(path: Path, args):
         compare_run_trace(dbg_tdfile, rel_tdfile)
 
     if args.inputsused:
-        compare_inputs_used(dbg_tdfile, rel_tdfile)
+        compare_inputs_used(dbg_trace, rel_trace)
 
     if args.enumdiff:
         enum_diff(dbg_tdfile, rel_tdfile)
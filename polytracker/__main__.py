@@ -2,7 +2,6 @@ import sys
 import argparse
 
 from .plugins import add_command_subparsers
-from . import polytracker
 
 
 def main():
@@ -20,13 +19,16 @@ def main():
         help="print PolyTracker's version and exit",
     )
 
-    add_command_subparsers(parser)
+    argv = sys.argv[1:]
+    add_command_subparsers(parser, argv)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if not hasattr(args, "func"):
         if args.version:
-            print(polytracker.version())
+            from .polytracker import version
+
+            print(version())
             return 0
 
         if sys.stdin.isatty() and sys.stdout.isatty():
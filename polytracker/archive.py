@@ -0,0 +1,244 @@
+"""A module implementing a seekable, block compressed container for TDAG sections.
+
+Each section of a TDAG is split into fixed size blocks that are compressed
+independently. A per-section block index records where each compressed block is
+stored, so reading any byte range of a section only requires decompressing the
+blocks overlapping it. Decompressed blocks are kept in an LRU cache.
+
+The layout of an archive is::
+
+    TDArchiveMeta
+    TDArchiveSectionMeta * section_count
+    compressed blocks
+    block index for each section: (block_count + 1) uint64 file offsets
+
+"""
+
+import lzma
+import zlib
+from ctypes import Structure, c_char, c_uint16, c_uint32, c_uint64, sizeof
+from enum import IntEnum
+from typing import BinaryIO, Iterable, List, Sequence, Tuple, Union
+
+from .cache import LRUCache
+
+ARCHIVE_MAGIC = b"TDAZ"
+ARCHIVE_VERSION = 1
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_CACHE_BLOCKS = 256
+
+
+class Codec(IntEnum):
+    ZLIB = 1
+    LZMA = 2
+
+    def compress(self, data: bytes) -> bytes:
+        if self == Codec.ZLIB:
+            return zlib.compress(data, 9)
+        return lzma.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        if self == Codec.ZLIB:
+            return zlib.decompress(data)
+        return lzma.decompress(data)
+
+
+class TDArchiveMeta(Structure):
+    """Archive header, describes the compression settings and section count"""
+
+    _fields_ = [
+        ("magic", c_char * 4),
+        ("version", c_uint16),
+        ("section_count", c_uint16),
+        # The magic of the TDAG file this archive was created from
+        ("tdag_magic", c_uint16),
+        ("codec", c_uint16),
+        ("block_size", c_uint32),
+    ]
+
+
+class TDArchiveSectionMeta(Structure):
+    """Describes a single archived section and where its block index is stored"""
+
+    _fields_ = [
+        ("tag", c_uint32),
+        ("align", c_uint32),
+        # Uncompressed size of the section
+        ("size", c_uint64),
+        ("block_count", c_uint64),
+        # File offset of the (block_count + 1) uint64 block offsets
+        ("index_offset", c_uint64),
+    ]
+
+
+def is_archive(buffer) -> bool:
+    return bytes(buffer[: len(ARCHIVE_MAGIC)]) == ARCHIVE_MAGIC
+
+
+def write_archive(
+    file: BinaryIO,
+    sections: Sequence[Tuple[int, int, Union[bytes, memoryview]]],
+    tdag_magic: int,
+    codec: Codec = Codec.ZLIB,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> int:
+    """Writes `sections`, a sequence of (tag, align, data), as an archive to `file`.
+
+    Returns the size of the archive in bytes.
+    """
+    meta = TDArchiveMeta(
+        ARCHIVE_MAGIC, ARCHIVE_VERSION, len(sections), tdag_magic, codec, block_size
+    )
+    offset = sizeof(TDArchiveMeta) + len(sections) * sizeof(TDArchiveSectionMeta)
+    file.write(bytes(meta))
+    # Section headers are written once the block indices are known
+    file.write(b"\0" * (len(sections) * sizeof(TDArchiveSectionMeta)))
+
+    indices: List[List[int]] = []
+    for _, _, data in sections:
+        index = [offset]
+        for start in range(0, len(data), block_size):
+            block = codec.compress(bytes(data[start : start + block_size]))
+            file.write(block)
+            offset += len(block)
+            index.append(offset)
+        indices.append(index)
+
+    headers = []
+    for (tag, align, data), index in zip(sections, indices):
+        headers.append(
+            TDArchiveSectionMeta(tag, align, len(data), len(index) - 1, offset)
+        )
+        file.write((c_uint64 * len(index))(*index))
+        offset += len(index) * sizeof(c_uint64)
+
+    file.seek(sizeof(TDArchiveMeta))
+    for hdr in headers:
+        file.write(bytes(hdr))
+    file.seek(offset)
+    return offset
+
+
+class TDArchiveSectionView:
+    """A read only view of (part of) an archived section.
+
+    Supports `len()` and indexing. Slicing returns the uncompressed bytes,
+    decompressing only the blocks that overlap the requested range.
+    """
+
+    def __init__(self, archive: "TDArchive", section: int, start: int, stop: int):
+        self.archive: TDArchive = archive
+        self.section: int = section
+        self.start: int = start
+        self.stop: int = stop
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[int, bytes]:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            data = self.archive.read(
+                self.section, self.start + start, self.start + stop
+            )
+            return data if step == 1 else data[::step]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("archive section index out of range")
+        return self.archive.read(self.section, self.start + key, self.start + key + 1)[
+            0
+        ]
+
+    def __bytes__(self) -> bytes:
+        return self.archive.read(self.section, self.start, self.stop)
+
+
+class TDArchive:
+    """Reads an archive created by `write_archive`.
+
+    The archive behaves like the uncompressed, tightly packed TDAG it was
+    created from: `section_headers` holds the (tag, align, offset, size) of each
+    section in that virtual layout, and slicing the archive with a range inside
+    a section returns a lazily decompressing `TDArchiveSectionView`.
+    """
+
+    def __init__(self, buffer, cache_blocks: int = DEFAULT_CACHE_BLOCKS):
+        self.buffer = buffer
+        self.meta = TDArchiveMeta.from_buffer_copy(buffer)
+        if self.meta.magic != ARCHIVE_MAGIC:
+            raise ValueError("Not a TDAG archive")
+        if self.meta.version != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported TDAG archive version {self.meta.version}")
+        self.codec = Codec(self.meta.codec)
+        self.block_size: int = self.meta.block_size
+        self.cache: LRUCache[Tuple[int, int], bytes] = LRUCache(max_size=cache_blocks)
+
+        self.sections: List[TDArchiveSectionMeta] = []
+        self.indices: List[Sequence[int]] = []
+        for i in range(self.meta.section_count):
+            hdr = TDArchiveSectionMeta.from_buffer_copy(
+                buffer, sizeof(TDArchiveMeta) + i * sizeof(TDArchiveSectionMeta)
+            )
+            self.sections.append(hdr)
+            self.indices.append(
+                (c_uint64 * (hdr.block_count + 1)).from_buffer_copy(
+                    buffer, hdr.index_offset
+                )
+            )
+
+        # taint_dag imports this module, so its headers are imported here
+        from .taint_dag import TDFileMeta, TDSectionMeta
+
+        # Offsets of the sections in the uncompressed layout
+        self.section_headers: List[Tuple[int, int, int, int]] = []
+        offset = sizeof(TDFileMeta) + len(self.sections) * sizeof(TDSectionMeta)
+        for hdr in self.sections:
+            offset += -offset % max(hdr.align, 1)
+            self.section_headers.append((hdr.tag, hdr.align, offset, hdr.size))
+            offset += hdr.size
+
+    @property
+    def tdag_magic(self) -> int:
+        return self.meta.tdag_magic
+
+    def block(self, section: int, index: int) -> bytes:
+        """Returns the uncompressed block `index` of `section`"""
+        key = (section, index)
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        offsets = self.indices[section]
+        data = self.codec.decompress(self.buffer[offsets[index] : offsets[index + 1]])
+        self.cache[key] = data
+        return data
+
+    def read(self, section: int, start: int, stop: int) -> bytes:
+        """Returns the uncompressed bytes [start, stop) of `section`"""
+        stop = min(stop, self.sections[section].size)
+        if start >= stop:
+            return b""
+        first = start // self.block_size
+        last = (stop - 1) // self.block_size
+        base = first * self.block_size
+        if first == last:
+            return self.block(section, first)[start - base : stop - base]
+        data = b"".join(self.block(section, i) for i in range(first, last + 1))
+        return data[start - base : stop - base]
+
+    def __getitem__(self, key: slice) -> TDArchiveSectionView:
+        if not isinstance(key, slice):
+            raise TypeError("TDArchive only supports slicing")
+        for i, (_, _, offset, size) in enumerate(self.section_headers):
+            if offset <= key.start and key.stop <= offset + size:
+                return TDArchiveSectionView(
+                    self, i, key.start - offset, key.stop - offset
+                )
+        raise IndexError("slice does not refer to a single section")
+
+    def iter_blocks(self, section: int) -> Iterable[bytes]:
+        """Yields the uncompressed blocks of `section` in order, bypassing the cache"""
+        offsets = self.indices[section]
+        for i in range(self.sections[section].block_count):
+            yield self.codec.decompress(self.buffer[offsets[i] : offsets[i + 1]])
@@ -1,9 +1,14 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import subprocess
 import os
 import json
 from pathlib import Path
-from typing import List, Dict, Tuple
+import shutil
+import sys
+import tempfile
+from typing import Any, Callable, Iterable, List, Dict, Optional, Sequence, Tuple
 
 from .plugins import Command
 
@@ -33,6 +38,118 @@ def _default_blight_journal_path() -> Path:
     return Path.cwd() / "blight_journal.jsonl"
 
 
+def _default_cache_path() -> Path:
+    cache = os.getenv("POLYTRACKER_CACHE_DIR", default="")
+    if cache:
+        return Path(cache)
+    return Path.home() / ".cache" / "polytracker"
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """A content-addressed store of the outputs of instrumentation stages
+
+    An output is stored under a key that hashes the name of the stage, the
+    contents of its input files and its parameters, so a stage only needs to
+    run again when one of them changes.
+    """
+
+    def __init__(self, root: Path):
+        self.root: Path = root
+
+    def key(self, stage: str, inputs: Iterable[Path], params: Any) -> str:
+        digest = hashlib.sha256(stage.encode())
+        for path in inputs:
+            digest.update(_file_digest(path).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:]
+
+    def fetch(self, key: str, output: Path) -> bool:
+        """Copies the artifact stored under `key` to `output`, returns whether it exists"""
+        stored = self.path(key)
+        if not stored.exists():
+            return False
+        shutil.copy2(stored, output)
+        return True
+
+    def store(self, key: str, output: Path) -> None:
+        stored = self.path(key)
+        stored.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so concurrent builds never see a partial artifact
+        fd, tmp = tempfile.mkstemp(dir=stored.parent)
+        os.close(fd)
+        shutil.copy2(output, tmp)
+        os.replace(tmp, stored)
+
+
+def _run_stage(
+    cache: Optional[ArtifactCache],
+    stage: str,
+    inputs: List[Path],
+    params: Any,
+    output: Path,
+    build: Callable[[], None],
+    extra_outputs: Sequence[Path] = (),
+) -> None:
+    """Runs `build` to produce `output`, and `extra_outputs` for stages that write more than one file, unless `cache`
+    already holds their results"""
+    if cache is None:
+        build()
+        return
+    key = cache.key(stage, inputs, params)
+    outputs = [output, *extra_outputs]
+    keys = [key, *(f"{key}.{i}" for i in range(1, len(outputs)))]
+    if all(cache.fetch(k, path) for k, path in zip(keys, outputs)):
+        return
+    build()
+    for k, path in zip(keys, outputs):
+        cache.store(k, path)
+
+
+def _opt_version() -> str:
+    """The version of the `opt` every bitcode stage runs"""
+    try:
+        return subprocess.run(
+            ["opt", "--version"], capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _executable_digest(name: str) -> str:
+    """Hashes the contents of executable `name` on the PATH"""
+    path = shutil.which(name)
+    return _file_digest(Path(path)) if path is not None else ""
+
+
+def _toolchain_fingerprint() -> List[Tuple[str, str]]:
+    """Identifies the polytracker passes, runtime libraries and `opt` instrumentation depends on
+
+    Files are identified by their contents, as checkouts and containers do not
+    preserve modification times.
+    """
+    paths = [
+        _compiler_dir_path() / "pass" / "libPolytrackerPass.so",
+        _compiler_dir_path() / "lib" / "libPolytracker.a",
+        _cxx_dir_path() / "poly_build" / "lib" / "libc++.a",
+        _cxx_dir_path() / "poly_build" / "lib" / "libc++abi.a",
+        Path(os.getenv("DFSAN_LIB_PATH", default="")),
+    ]
+    result = [(str(path), _file_digest(path)) for path in paths if path.is_file()]
+    result.append(("opt", _opt_version()))
+    return result
+
+
 def _handle_cmd(build_cmd: List[str], blight_journal: Path) -> None:
     ARTIFACT_STORE_PATH_ENV: str = _ensure_env_set("WLLVM_ARTIFACT_STORE")
     ARTIFACT_STORE_PATH: Path = _ensure_path_exists(Path(ARTIFACT_STORE_PATH_ENV))
@@ -147,7 +264,14 @@ def _optimize_bitcode(input_bitcode: Path, output_bitcode: Path) -> None:
     subprocess.check_call(cmd)
 
 
-def _preopt_instrument_bitcode(input_bitcode: Path, output_bitcode: Path) -> None:
+def _function_ids_path(stem: str) -> Path:
+    """The function names by id written for the control flow log of target `stem`"""
+    return Path(f"{stem}.functionid.json")
+
+
+def _preopt_instrument_bitcode(
+    input_bitcode: Path, output_bitcode: Path, function_ids: Path
+) -> None:
     POLY_PASS_PATH: Path = _ensure_path_exists(
         _compiler_dir_path() / "pass" / "libPolytrackerPass.so"
     )
@@ -159,12 +283,15 @@ def _preopt_instrument_bitcode(input_bitcode: Path, output_bitcode: Path) -> Non
         "-load-pass-plugin",
         str(POLY_PASS_PATH),
         "-passes=pt-tcf",
-        str(input_bitcode),
+        str(input_bitcode.resolve()),
         "-o",
-        str(output_bitcode),
+        str(output_bitcode.resolve()),
     ]
-    # execute `cmd`
-    subprocess.check_call(cmd)
+    # The pass writes functionid.json to its working directory, which is private
+    # to this target so that targets instrumented in parallel do not collide
+    with tempfile.TemporaryDirectory() as workdir:
+        subprocess.check_call(cmd, cwd=workdir)
+        shutil.move(str(Path(workdir) / "functionid.json"), str(function_ids))
 
 
 def _instrument_bitcode(
@@ -246,6 +373,98 @@ def _read_blight_journal(journal_path: Path) -> List[Dict]:
     return result
 
 
+def _instrument_target(
+    target_cmd: Dict,
+    target_path: Path,
+    ignore_lists: List[str],
+    add_taint_tracking: bool,
+    add_function_tracing: bool,
+    add_cflog: bool,
+    cache: Optional[ArtifactCache],
+) -> Path:
+    """Runs every instrumentation stage for a build target, returns the instrumented binary"""
+    # The tools each stage runs are only identified for the cache keys
+    toolchain: List[Tuple[str, str]] = []
+    opt_version = get_bc_digest = ""
+    if cache is not None:
+        toolchain = _toolchain_fingerprint()
+        opt_version = _opt_version()
+        get_bc_digest = _executable_digest("get-bc")
+    bc_path = target_path.with_suffix(".bc")
+    _run_stage(
+        cache,
+        "extract-bc",
+        [target_path],
+        get_bc_digest,
+        bc_path,
+        lambda: _extract_bitcode(target_path, bc_path),
+    )
+
+    input_bc = bc_path
+    if add_cflog:
+        # Control affecting data flow logging happens before optimization
+        input_bc = bc_path.with_suffix(".cflog.bc")
+        function_ids = _function_ids_path(bc_path.stem)
+        _run_stage(
+            cache,
+            "preopt-instrument-bc",
+            [bc_path],
+            toolchain,
+            input_bc,
+            lambda: _preopt_instrument_bitcode(bc_path, input_bc, function_ids),
+            [function_ids],
+        )
+
+    opt_bc = bc_path.with_suffix(".opt.bc")
+    _run_stage(
+        cache,
+        "opt-bc",
+        [input_bc],
+        opt_version,
+        opt_bc,
+        lambda: _optimize_bitcode(input_bc, opt_bc),
+    )
+
+    inst_bc_path = Path(f"{bc_path.stem}.instrumented.bc")
+    abi_path = _compiler_dir_path() / "abi_lists"
+    _run_stage(
+        cache,
+        "instrument-bc",
+        [
+            opt_bc,
+            # The ABI lists _instrument_bitcode always passes
+            abi_path / "polytracker_abilist.txt",
+            abi_path / "dfsan_abilist.txt",
+            *(abi_path / item for item in ignore_lists),
+        ],
+        [toolchain, ignore_lists, add_taint_tracking, add_function_tracing],
+        inst_bc_path,
+        lambda: _instrument_bitcode(
+            opt_bc,
+            inst_bc_path,
+            ignore_lists,
+            add_taint_tracking,
+            add_function_tracing,
+        ),
+    )
+
+    output = Path(inst_bc_path.stem)
+    libs = [
+        Path(i["path"])
+        for i in target_cmd["FindInputs"]["inputs"]
+        if i["kind"] in ["static", "shared"]
+    ]
+    _run_stage(
+        cache,
+        "lower-bc",
+        [inst_bc_path, *(lib for lib in libs if lib.is_file())],
+        [toolchain, target_cmd],
+        output,
+        lambda: _lower_bitcode(inst_bc_path, output, target_cmd),
+    )
+    return output
+
+
 class Build(Command):
     name = "build"
     help = "runs a build command with blight instrumentation"
@@ -424,24 +643,57 @@ class InstrumentTargets(Command):
             help="instrument with control affecting dataflow logging",
         )
 
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            default=os.cpu_count(),
+            help="number of targets to instrument in parallel (default: number of CPUs)",
+        )
+
+        parser.add_argument(
+            "--cache-dir",
+            type=Path,
+            default=_default_cache_path(),
+            help="directory of the cache of instrumentation stage outputs (default: $POLYTRACKER_CACHE_DIR "
+            "or ~/.cache/polytracker)",
+        )
+
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="run every instrumentation stage, without reading or writing the cache",
+        )
+
     def run(self, args: argparse.Namespace):
-        for target in args.targets:
-            blight_cmds = _read_blight_journal(args.journal_path)
-            target_cmd, target_path = _find_target(target, blight_cmds)
-            bc_path = target_path.with_suffix(".bc")
-            opt_bc = bc_path.with_suffix(".opt.bc")
-            _extract_bitcode(target_path, bc_path)
-            if args.cflog:
-                # Control affecting data flow logging happens before optimization
-                _preopt_instrument_bitcode(bc_path, bc_path)
-
-            _optimize_bitcode(bc_path, opt_bc)
-            inst_bc_path = Path(f"{bc_path.stem}.instrumented.bc")
-            _instrument_bitcode(
-                opt_bc,
-                inst_bc_path,
-                args.ignore_lists,
-                args.taint,
-                args.ftrace,
-            )
-            _lower_bitcode(inst_bc_path, Path(inst_bc_path.stem), target_cmd)
+        blight_cmds = _read_blight_journal(args.journal_path)
+        cache = None if args.no_cache else ArtifactCache(args.cache_dir)
+        failed = False
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [
+                (
+                    target,
+                    executor.submit(
+                        _instrument_target,
+                        *_find_target(target, blight_cmds),
+                        args.ignore_lists,
+                        args.taint,
+                        args.ftrace,
+                        args.cflog,
+                        cache,
+                    ),
+                )
+                for target in args.targets
+            ]
+            for target, future in futures:
+                try:
+                    output = future.result()
+                    if args.cflog and len(args.targets) == 1:
+                        # A single target also gets the functionid.json the pass writes
+                        shutil.copy2(_function_ids_path(output.stem), "functionid.json")
+                    print(f"Instrumented {target}: {output}")
+                except (subprocess.CalledProcessError, OSError, RuntimeError) as e:
+                    sys.stderr.write(f"Failed to instrument {target}: {e}\n")
+                    failed = True
+        if failed:
+            return 1
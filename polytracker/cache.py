@@ -94,3 +94,35 @@ class LRUCache(Generic[R, V], MutableMapping):
             self._items.move_to_end(key, last=True)
             yield key
             yielded.add(id(key))
+
+
+class SizedLRUCache(LRUCache[R, V]):
+    """An LRU cache bounded by the total cost of its values rather than their number
+
+    `cost` returns the cost of a value, e.g. its size. The least recently used
+    items are evicted until the total cost is at most `max_cost`, but the most
+    recently set item is never evicted.
+    """
+
+    def __init__(self, max_cost: Optional[int], cost: Callable[[V], int]):
+        super().__init__(max_size=None)
+        self.max_cost: Optional[int] = max_cost
+        self.cost: Callable[[V], int] = cost
+        self.total_cost: int = 0
+
+    def __setitem__(self, k: R, v: V) -> None:
+        if k in self._items:
+            self.total_cost -= self.cost(self._items[k])
+        self._items[k] = v
+        self._items.move_to_end(k, last=True)
+        self.total_cost += self.cost(v)
+        while (
+            self.max_cost is not None
+            and self.total_cost > self.max_cost
+            and len(self._items) > 1
+        ):
+            _, evicted = self._items.popitem(last=False)
+            self.total_cost -= self.cost(evicted)
+
+    def __delitem__(self, k: R) -> None:
+        self.total_cost -= self.cost(self._items.pop(k))
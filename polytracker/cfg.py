@@ -13,6 +13,7 @@ from typing import (
 
 import cxxfilt
 import graphviz
+import numpy as np
 import os
 
 from .graphs import DiGraph
@@ -22,17 +23,24 @@ class FunctionInfo:
     def __init__(
         self,
         name: str,
-        cmp_bytes: Dict[str, List[int]],
+        cmp_bytes: Optional[Dict[str, List[int]]] = None,
         input_bytes: Optional[Dict[str, List[int]]] = None,
         called_from: Iterable[str] = (),
+        cmp_intervals: Optional[Dict[str, np.ndarray]] = None,
     ):
+        """Either `cmp_bytes` or `cmp_intervals` describes the bytes compared by the function
+
+        `cmp_intervals` maps each source to an (n, 2) array of sorted, disjoint
+        [begin, end) byte intervals. The byte offset lists are only expanded from
+        the intervals when they are accessed.
+        """
         self.name: str = name
         self.called_from: FrozenSet[str] = frozenset(called_from)
-        self._cmp_bytes: Dict[str, List[int]] = cmp_bytes
-        if input_bytes is None:
-            self._input_bytes: Dict[str, List[int]] = cmp_bytes
-        else:
-            self._input_bytes = input_bytes
+        self._cmp_intervals: Optional[Dict[str, np.ndarray]] = cmp_intervals
+        if cmp_bytes is None and cmp_intervals is None:
+            cmp_bytes = {}
+        self._cmp_bytes: Optional[Dict[str, List[int]]] = cmp_bytes
+        self._input_bytes: Optional[Dict[str, List[int]]] = input_bytes
         self._demangled_name: Optional[str] = None
 
     @property
@@ -49,6 +57,8 @@ class FunctionInfo:
             raise KeyError(source)
         elif os.path.exists(source):
             return os.stat(source).st_size
+        elif self._input_bytes is None and self._cmp_intervals is not None:
+            return int(self._cmp_intervals[source][-1, 1]) - 1
         else:
             # find the largest byte this trace touched
             return max(self.input_bytes[source])
@@ -58,14 +68,27 @@ class FunctionInfo:
 
     @property
     def input_bytes(self) -> Dict[str, List[int]]:
+        if self._input_bytes is None:
+            return self.cmp_bytes
         return self._input_bytes
 
     @property
     def cmp_bytes(self) -> Dict[str, List[int]]:
+        if self._cmp_bytes is None:
+            self._cmp_bytes = {
+                source: [
+                    offset
+                    for begin, end in intervals.tolist()
+                    for offset in range(begin, end)
+                ]
+                for source, intervals in self._cmp_intervals.items()  # type: ignore
+            }
         return self._cmp_bytes
 
     @property
     def taint_sources(self) -> KeysView[str]:
+        if self._input_bytes is None and self._cmp_intervals is not None:
+            return self._cmp_intervals.keys()
         return self.input_bytes.keys()
 
     @staticmethod
@@ -83,11 +106,19 @@ class FunctionInfo:
             yield start_offset, last_offset + 1  # type: ignore
 
     def input_chunks(self) -> Iterator[Tuple[str, Tuple[int, int]]]:
+        if self._input_bytes is None:
+            yield from self.cmp_chunks()
+            return
         for source, byte_offsets in self.input_bytes.items():
             for start, end in FunctionInfo.tainted_chunks(byte_offsets):
                 yield source, (start, end)
 
     def cmp_chunks(self) -> Iterator[Tuple[str, Tuple[int, int]]]:
+        if self._cmp_intervals is not None:
+            for source, intervals in self._cmp_intervals.items():
+                for start, end in intervals.tolist():
+                    yield source, (start, end)
+            return
         for source, byte_offsets in self.cmp_bytes.items():
             for start, end in FunctionInfo.tainted_chunks(byte_offsets):
                 yield source, (start, end)
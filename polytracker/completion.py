@@ -0,0 +1,85 @@
+"""Tab completion for the PolyTracker REPL."""
+
+from typing import Iterable, Optional, Set
+
+from prompt_toolkit.completion import Completer, Completion
+
+from .repl import PolyTrackerREPL, REPLCommand
+
+
+class PolyTrackerCompleter(Completer):
+    def __init__(self, repl: "PolyTrackerREPL"):
+        self.repl: PolyTrackerREPL = repl
+        self.current_help: Optional[str] = None
+
+    @staticmethod
+    def _get_completions(
+        partial: str,
+        options: Iterable[str],
+        already_completed: Set[str],
+        style: str = "",
+    ):
+        for var in options:
+            if (
+                var not in already_completed
+                and var.startswith(partial)
+                and var != partial
+            ):
+                yield Completion(var, start_position=-len(partial), style=style)
+                already_completed.add(var)
+
+    def rprompt(self):
+        return None
+
+    def bottom_toolbar(self):
+        if self.current_help is not None:
+            return self.current_help
+        else:
+            return ""
+
+    def get_completions(self, document, complete_event):
+        if self.repl.multi_line and document.text == "":
+            # we are in a multi-line statement, and the user pressed TAB in order to indent
+            return
+        partial = document.text_before_cursor
+        already_yielded = set()
+        if partial == document.text:
+            # we are at the start of the line, so complete for commands:
+            yield from PolyTrackerCompleter._get_completions(
+                partial, PolyTrackerREPL.commands, already_yielded, "fg:ansiblue"
+            )
+        args = document.text.split(" ")
+        if args[0] in PolyTrackerREPL.commands:
+            # We are completing a command
+            # TODO: Parse options and add their help to self.current_help
+            self.current_help = None
+        else:
+            self.current_help = None
+
+        yield from PolyTrackerCompleter._get_completions(
+            partial,
+            (var for var in self.repl.state if var not in self.repl.builtins),
+            already_yielded,
+        )
+        yield from PolyTrackerCompleter._get_completions(
+            partial, self.repl.builtins, already_yielded, "fg:ansigreen"
+        )
+        if "__builtins__" in self.repl.state:
+            builtins = self.repl.state["__builtins__"]
+        else:
+            builtins = __builtins__
+        yield from PolyTrackerCompleter._get_completions(
+            partial, builtins, already_yielded, "fg:ansigreen"
+        )
+        if "." in partial:
+            portions = partial.split(".")
+            varname = portions[-2]
+            to_complete = portions[-1]
+            if varname in self.repl.state:
+                attr = self.repl.state[varname]
+                if not isinstance(attr, REPLCommand):
+                    yield from PolyTrackerCompleter._get_completions(
+                        to_complete,
+                        (a for a in dir(attr) if not a.startswith("_")),
+                        already_yielded,
+                    )
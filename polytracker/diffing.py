@@ -1,14 +1,37 @@
 from argparse import ArgumentParser, Namespace
-from collections import defaultdict
 from io import StringIO
+import itertools
+import json
 import os
-from typing import Dict, FrozenSet, Iterable, Iterator, Optional, TextIO, Tuple
-
-from intervaltree import Interval, IntervalTree
+from pathlib import Path
+import sys
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+)
+
+import numpy as np
 from tqdm import tqdm
 
+from .cache import LRUCache
 from .plugins import Command
-from .tracing import Function, Input, ProgramTrace, TaintDiff, TaintedRegion
+from .taint_dag import (
+    TDControlFlowLogSection,
+    TDFile,
+    TDLabelArrays,
+    TDProgramTrace,
+    reachable_labels,
+    sink_bitmaps,
+    source_bitmaps,
+)
+from .tracing import Function, ProgramTrace, TaintDiff, TaintedRegion, Taints
 from .visualizations import file_diff, Image, temporal_animation
 
 
@@ -124,18 +147,18 @@ class TraceDiff:
         self.trace2: ProgramTrace = trace2
         self._functions_only_in_first: Optional[FrozenSet[Function]] = None
         self._functions_only_in_second: Optional[FrozenSet[Function]] = None
-        self._bytes_only_in_first: Optional[Dict[Input, IntervalTree]] = None
-        self._bytes_only_in_second: Optional[Dict[Input, IntervalTree]] = None
-        self._first_intervals: Dict[Input, IntervalTree] = defaultdict(IntervalTree)
-        self._second_intervals: Dict[Input, IntervalTree] = defaultdict(IntervalTree)
+        self._bytes_only_in_first: Optional[Taints] = None
+        self._bytes_only_in_second: Optional[Taints] = None
+        self._first_intervals: Taints = Taints(())
+        self._second_intervals: Taints = Taints(())
 
     @property
-    def first_intervals(self) -> Dict[Input, IntervalTree]:
+    def first_intervals(self) -> Taints:
         self._diff_bytes()
         return self._first_intervals
 
     @property
-    def second_intervals(self) -> Dict[Input, IntervalTree]:
+    def second_intervals(self) -> Taints:
         self._diff_bytes()
         return self._second_intervals
 
@@ -180,107 +203,56 @@ class TraceDiff:
         with tqdm(
             desc="Diffing tainted byte regions", leave=False, unit=" trace", total=2
         ) as t:
-            for func in tqdm(
-                self.trace1.functions,
-                desc="Trace 1",
-                unit=" functions",
-                leave=False,
-            ):
-                for region in func.get_taints().regions():
-                    self._first_intervals[region.source].add(
-                        Interval(region.offset, region.offset + region.length)
+            self._first_intervals = Taints(()).union(
+                *(
+                    func.taints()
+                    for func in tqdm(
+                        self.trace1.functions,
+                        desc="Trace 1",
+                        unit=" functions",
+                        leave=False,
                     )
-            for interval in self._first_intervals.values():
-                interval.merge_overlaps()
+                )
+            )
             t.update(1)
-            for func in tqdm(
-                self.trace2.functions,
-                desc="Trace 2",
-                unit=" functions",
-                leave=False,
-            ):
-                for region in func.get_taints().regions():
-                    self._second_intervals[region.source].add(
-                        Interval(region.offset, region.offset + region.length)
+            self._second_intervals = Taints(()).union(
+                *(
+                    func.taints()
+                    for func in tqdm(
+                        self.trace2.functions,
+                        desc="Trace 2",
+                        unit=" functions",
+                        leave=False,
                     )
-            for interval in self._second_intervals.values():
-                interval.merge_overlaps()
-            t.update(2)
-            self._bytes_only_in_first = {}
-            self._bytes_only_in_second = {}
-            for source in self._first_intervals.keys() & self._second_intervals.keys():
-                # shared sources
-                self._bytes_only_in_first[source] = self._first_intervals[source].copy()
-                for interval in tqdm(
-                    self._second_intervals[source],
-                    desc="Removing Trace 1 Overlap",
-                    unit=" intervals",
-                    leave=False,
-                ):
-                    self._bytes_only_in_first[source].remove_overlap(
-                        interval.begin, interval.end
-                    )
-                self._bytes_only_in_second[source] = self._second_intervals[
-                    source
-                ].copy()
-                for interval in tqdm(
-                    self._first_intervals[source],
-                    desc="Removing Trace 2 Overlap",
-                    unit=" intervals",
-                    leave=False,
-                ):
-                    self._bytes_only_in_second[source].remove_overlap(
-                        interval.begin, interval.end
-                    )
-                assert (
-                    len(
-                        self._bytes_only_in_first[source]
-                        & self._bytes_only_in_second[source]
-                    )
-                    == 0
                 )
-            for source in self._first_intervals.keys() - self._second_intervals.keys():
-                # sources only in first
-                self._bytes_only_in_first[source] = self._first_intervals[source]
-            for source in self._second_intervals.keys() - self._first_intervals.keys():
-                # sources only in second
-                self._bytes_only_in_second[source] = self._second_intervals[source]
+            )
+            t.update(2)
+            self._bytes_only_in_first = self._first_intervals - self._second_intervals
+            self._bytes_only_in_second = self._second_intervals - self._first_intervals
 
     @property
     def input_chunks_only_in_first(self) -> Iterator[TaintedRegion]:
         if self._bytes_only_in_first is None:
             self._diff_bytes()
-        for source, tree in self._bytes_only_in_first.items():  # type: ignore
-            for interval in sorted(tree):
-                yield TaintedRegion(
-                    source=source,
-                    offset=interval.begin,
-                    length=interval.end - interval.begin,
-                )
+        yield from self._bytes_only_in_first.regions()  # type: ignore
 
     @property
     def input_chunks_only_in_second(self) -> Iterator[TaintedRegion]:
         if self._bytes_only_in_second is None:
             self._diff_bytes()
-        for source, tree in self._bytes_only_in_second.items():  # type: ignore
-            for interval in sorted(tree):
-                yield TaintedRegion(
-                    source=source,
-                    offset=interval.begin,
-                    length=interval.end - interval.begin,
-                )
+        yield from self._bytes_only_in_second.regions()  # type: ignore
 
     @property
     def has_input_chunks_only_in_first(self) -> bool:
         if self._bytes_only_in_first is None:
             self._diff_bytes()
-        return any(len(tree) > 0 for tree in self._bytes_only_in_first.values())  # type: ignore
+        return bool(self._bytes_only_in_first)
 
     @property
     def has_input_chunks_only_in_second(self) -> bool:
         if self._bytes_only_in_second is None:
             self._diff_bytes()
-        return any(len(tree) > 0 for tree in self._bytes_only_in_second.values())  # type: ignore
+        return bool(self._bytes_only_in_second)
 
     def to_image(self) -> Image:
         self._diff_bytes()
@@ -289,10 +261,8 @@ class TraceDiff:
             num_bytes = source.size
             return file_diff(
                 num_bytes,
-                lambda offset: source in self._first_intervals
-                and self._first_intervals[source].overlaps(offset),
-                lambda offset: source in self._second_intervals
-                and self._second_intervals[source].overlaps(offset),
+                self._first_intervals.bitmap(source, num_bytes),
+                self._second_intervals.bitmap(source, num_bytes),
             )
 
     def __bool__(self):
@@ -322,11 +292,7 @@ class TraceDiff:
             for region in self.input_chunks_only_in_first:
                 print_chunk_info((region,))
                 for func in self.trace1.functions:
-                    if IntervalTree.from_tuples(
-                        (r.offset, r.offset + r.length)
-                        for r in func.taints().regions()
-                        if r.source == region.source
-                    ).overlaps(region.offset, region.offset + region.length):
+                    if func.taints() & Taints((region,)):
                         # find the control flows that could have caused the diff
                         cfd = ControlFlowDiff(self.trace1, self.trace2, func.name)
                         if cfd:
@@ -375,11 +341,7 @@ class TraceDiff:
             for region in self.input_chunks_only_in_second:
                 print_chunk_info((region,))
                 for func in self.trace2.functions:
-                    if IntervalTree.from_tuples(
-                        (r.offset, r.offset + r.length)
-                        for r in func.taints().regions()
-                        if r.source == region.source
-                    ).overlaps(region.offset, region.offset + region.length):
+                    if func.taints() & Taints((region,)):
                         # find the control flows that could have caused the diff
                         cfd = ControlFlowDiff(self.trace1, self.trace2, func.name)
                         if cfd:
@@ -457,35 +419,591 @@ class TraceDiff:
         return status.getvalue()
 
 
-# TODO (msurovic): Re-enable once TDProgramTrace.access_sequence() is implemented
+def bitmap_intervals(bitmap: np.ndarray) -> np.ndarray:
+    """Returns the (n, 2) array of [begin, end) intervals of the set bits of a boolean array"""
+    padded = np.concatenate(([False], bitmap, [False]))
+    return np.flatnonzero(padded[1:] != padded[:-1]).reshape(-1, 2)
+
+
+def _bitmap_difference(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Returns the bits set in `first` but not in `second`, which may be shorter or longer"""
+    common = min(len(first), len(second))
+    result = first.copy()
+    result[:common] &= ~second[:common]
+    return result
+
+
+class TDTraceSummary:
+    """The parts of a TDAG trace compared by :class:`TDTraceDiff`, as bitmaps
+
+    The bitmaps are boolean arrays indexed by byte offset, keyed by the path of
+    their source or sink.
+    """
+
+    def __init__(self, trace: TDProgramTrace):
+        tdfile = trace.tdfile
+        arrays = TDLabelArrays(tdfile)
+        self.control_flow: Dict[Path, np.ndarray] = source_bitmaps(
+            tdfile, arrays, arrays.affects_control_flow
+        )
+        """The input bytes that affected control flow"""
+        self.sinks, sink_labels = sink_bitmaps(tdfile)
+        """The output bytes that were written to sinks"""
+        self.sink_reachable: Dict[Path, np.ndarray] = source_bitmaps(
+            tdfile, arrays, reachable_labels(arrays, sink_labels)
+        )
+        """The input bytes that flowed to an output"""
+        index = trace.event_index
+        entries = np.frombuffer(index.kinds, dtype=np.uint8) == index.FUNCTION_ENTRY
+        self.functions: FrozenSet[str] = frozenset(
+            trace.function_name(function_id)
+            for function_id in np.unique(
+                np.frombuffer(index.functions, dtype=np.int32)[entries]
+            ).tolist()
+        )
+        """The names of the functions that were called"""
+
+
+class TDTraceDiff:
+    """A diff of two TDAG traces
+
+    Compares the input bytes that affected control flow, the input bytes that
+    flowed to an output, the output bytes and the called functions of two
+    traces. Sources and sinks are matched by path.
+    """
+
+    BITMAPS = {
+        "control_flow": "input bytes that affected control flow",
+        "sink_reachable": "input bytes that flowed to an output",
+        "sinks": "output bytes",
+    }
+
+    def __init__(self, first: TDTraceSummary, second: TDTraceSummary):
+        self.first: TDTraceSummary = first
+        self.second: TDTraceSummary = second
+
+    @staticmethod
+    def _only_in(
+        bitmaps: Dict[Path, np.ndarray], other: Dict[Path, np.ndarray]
+    ) -> Dict[Path, np.ndarray]:
+        result = {}
+        for path, bitmap in bitmaps.items():
+            if path in other:
+                bitmap = _bitmap_difference(bitmap, other[path])
+            intervals = bitmap_intervals(bitmap)
+            if len(intervals):
+                result[path] = intervals
+        return result
+
+    def only_in_first(self, bitmaps: str) -> Dict[Path, np.ndarray]:
+        """Returns the (n, 2) [begin, end) intervals per path of the bytes of `bitmaps` only in the first trace
+
+        `bitmaps` is the name of one of the bitmaps of a :class:`TDTraceSummary`, see :attr:`TDTraceDiff.BITMAPS`.
+        """
+        return self._only_in(
+            getattr(self.first, bitmaps), getattr(self.second, bitmaps)
+        )
+
+    def only_in_second(self, bitmaps: str) -> Dict[Path, np.ndarray]:
+        """Returns the (n, 2) [begin, end) intervals per path of the bytes of `bitmaps` only in the second trace"""
+        return self._only_in(
+            getattr(self.second, bitmaps), getattr(self.first, bitmaps)
+        )
 
-# class TraceDiffCommand(Command):
-#     name = "diff"
-#     help = "compute a diff of two program traces"
+    @property
+    def functions_only_in_first(self) -> FrozenSet[str]:
+        return self.first.functions - self.second.functions
 
-#     def __init_arguments__(self, parser: ArgumentParser):
-#         parser.add_argument(
-#             "trace1", type=str, help="the output database from the first trace"
-#         )
-#         parser.add_argument(
-#             "trace2", type=str, help="the output database from the second trace"
-#         )
-#         parser.add_argument(
-#             "--image",
-#             type=str,
-#             default=None,
-#             help="path to optionally output a visualization of the" "diff",
-#         )
+    @property
+    def functions_only_in_second(self) -> FrozenSet[str]:
+        return self.second.functions - self.first.functions
 
-#     def run(self, args: Namespace):
-#         from . import PolyTrackerTrace
+    def __bool__(self):
+        return (
+            any(
+                self.only_in_first(bitmaps) or self.only_in_second(bitmaps)
+                for bitmaps in self.BITMAPS
+            )
+            or bool(self.functions_only_in_first)
+            or bool(self.functions_only_in_second)
+        )
+
+    def write(
+        self, output: TextIO, first_name: str = "first", second_name: str = "second"
+    ):
+        """Writes a report of the differences"""
+        for bitmaps, description in self.BITMAPS.items():
+            for name, regions in (
+                (first_name, self.only_in_first(bitmaps)),
+                (second_name, self.only_in_second(bitmaps)),
+            ):
+                for path, intervals in regions.items():
+                    output.write(
+                        f"{description} only in {name}: {path}: "
+                        f"{int((intervals[:, 1] - intervals[:, 0]).sum())} bytes\n"
+                    )
+                    for begin, end in intervals.tolist():
+                        output.write(f"\t[{begin}, {end})\n")
+        for name, functions in (
+            (first_name, self.functions_only_in_first),
+            (second_name, self.functions_only_in_second),
+        ):
+            for function in sorted(functions):
+                output.write(f"function only called in {name}: {function}\n")
+
+
+def matching_blocks(
+    a: Sequence[int], b: Sequence[int], max_distance: Optional[int] = None
+) -> List[Tuple[int, int, int]]:
+    """Returns the (i, j, n) blocks of a longest common subsequence, where a[i : i + n] == b[j : j + n]
+
+    Uses the linear space variant of Myers' O(ND) diff algorithm, which
+    recursively splits both sequences at the middle snake of a shortest edit
+    script. The blocks are ordered and not adjacent to each other.
+
+    The search costs O((N + M) * D) for an edit distance of D. If `max_distance`
+    is given and the sequences are further apart than that, the search stops
+    early and no blocks are returned.
+    """
+    blocks: List[Tuple[int, int, int]] = []
+    # Ranges (alo, ahi, blo, bhi) still to align, and blocks found in between,
+    # as (i, j, n), in reverse order
+    tasks: List[Tuple[int, ...]] = [(0, len(a), 0, len(b))]
+    distance = 0
+    while tasks:
+        task = tasks.pop()
+        if len(task) == 3:
+            blocks.append(task)  # type: ignore
+            continue
+        alo, ahi, blo, bhi = task
+        prefix = 0
+        while (
+            alo + prefix < ahi
+            and blo + prefix < bhi
+            and a[alo + prefix] == b[blo + prefix]
+        ):
+            prefix += 1
+        suffix = 0
+        while (
+            alo + prefix < ahi - suffix
+            and blo + prefix < bhi - suffix
+            and a[ahi - suffix - 1] == b[bhi - suffix - 1]
+        ):
+            suffix += 1
+        if suffix:
+            tasks.append((ahi - suffix, bhi - suffix, suffix))
+        if alo + prefix < ahi - suffix and blo + prefix < bhi - suffix:
+            snake = _middle_snake(
+                a,
+                alo + prefix,
+                ahi - suffix,
+                b,
+                blo + prefix,
+                bhi - suffix,
+                max_distance,
+            )
+            if snake is None:
+                return []
+            x, y, u, v = snake
+            tasks.append((u, ahi - suffix, v, bhi - suffix))
+            if u > x:
+                tasks.append((x, y, u - x))
+            tasks.append((alo + prefix, x, blo + prefix, y))
+        else:
+            # Only insertions or deletions are left in this range
+            distance += ahi - alo + bhi - blo - 2 * (prefix + suffix)
+            if max_distance is not None and distance > max_distance:
+                return []
+        if prefix:
+            tasks.append((alo, blo, prefix))
+
+    merged: List[Tuple[int, int, int]] = []
+    for i, j, n in blocks:
+        if (
+            merged
+            and merged[-1][0] + merged[-1][2] == i
+            and merged[-1][1] + merged[-1][2] == j
+        ):
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + n)
+        else:
+            merged.append((i, j, n))
+    return merged
+
+
+def _middle_snake(
+    a: Sequence[int],
+    alo: int,
+    ahi: int,
+    b: Sequence[int],
+    blo: int,
+    bhi: int,
+    max_distance: Optional[int] = None,
+) -> Optional[Tuple[int, int, int, int]]:
+    """Finds the middle snake of a shortest edit script of a[alo:ahi] and b[blo:bhi]
+
+    Both ranges must be non-empty, and their first and last elements must
+    differ. Returns the snake as (x, y, u, v), where a[x:u] == b[y:v], or None
+    if the edit script is longer than `max_distance`.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    delta = n - m
+    odd = (n + m) % 2
+    size = 2 * min(n, m) + 2
+    forward = [0] * size
+    backward = [0] * size
+    if max_distance is None:
+        max_distance = n + m
+    # Pass h of the search finds edit scripts of length 2h - 1, then 2h
+    for h in range(min(n + m + 1, max_distance + 1) // 2 + 1):
+        for is_forward in (True, False):
+            if 2 * h - is_forward > max_distance:
+                return None
+            if is_forward:
+                v, other = forward, backward
+            else:
+                v, other = backward, forward
+            for k in range(-(h - 2 * max(0, h - m)), h - 2 * max(0, h - n) + 1, 2):
+                if k == -h or (k != h and v[(k - 1) % size] < v[(k + 1) % size]):
+                    x = v[(k + 1) % size]
+                else:
+                    x = v[(k - 1) % size] + 1
+                y = x - k
+                start_x, start_y = x, y
+                if is_forward:
+                    while x < n and y < m and a[alo + x] == b[blo + y]:
+                        x += 1
+                        y += 1
+                else:
+                    while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                        x += 1
+                        y += 1
+                v[k % size] = x
+                z = delta - k
+                bound = h - is_forward
+                if (
+                    odd == is_forward
+                    and -bound <= z <= bound
+                    and x + other[z % size] >= n
+                ):
+                    if is_forward:
+                        return alo + start_x, blo + start_y, alo + x, blo + y
+                    return (
+                        alo + n - x,
+                        blo + m - y,
+                        alo + n - start_x,
+                        blo + m - start_y,
+                    )
+    return None
+
+
+class ControlFlowLogEncoding:
+    """Encodes the control flow log of a trace as chunks of integer arrays
+
+    Every record of the log is encoded as a key that hashes its kind, its
+    function and, for tainted control flow, the source bytes its label is
+    derived from. Labels differ between runs even where the data flow is the
+    same, so records of two runs are compared by their source bytes instead.
+    Sources are identified by the order in which they were opened.
+    Functions are compared by name if `function_names` is given, and by id
+    otherwise.
+
+    The callstack of each record is interned, :attr:`contexts` holds the
+    callstack of each context id.
+    """
+
+    def __init__(
+        self,
+        tdfile: TDFile,
+        function_names: Optional[Sequence[str]] = None,
+        chunk_size: int = 1 << 16,
+    ):
+        self.tdfile: TDFile = tdfile
+        self.function_names: Optional[Sequence[str]] = function_names
+        self.chunk_size: int = chunk_size
+        self.contexts: List[Tuple[int, ...]] = []
+        self._context_ids: Dict[Tuple[int, ...], int] = {}
+        self._label_hashes: LRUCache[int, int] = LRUCache(max_size=1 << 16)
+
+    def function_name(self, function_id: int) -> str:
+        if self.function_names is not None and function_id < len(self.function_names):
+            return self.function_names[function_id]
+        return f"function_{function_id}"
+
+    def context_id(self, callstack: Tuple[int, ...]) -> int:
+        if callstack not in self._context_ids:
+            self._context_ids[callstack] = len(self.contexts)
+            self.contexts.append(callstack)
+        return self._context_ids[callstack]
+
+    def label_hash(self, label: int) -> int:
+        if label not in self._label_hashes:
+            self._label_hashes[label] = hash(self.tdfile.resolver.resolve(label))
+        return self._label_hashes[label]
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yields chunks of (keys, context ids) arrays"""
+        cflog = self.tdfile._get_section(TDControlFlowLogSection)
+        assert isinstance(cflog, TDControlFlowLogSection)
+        keys: List[int] = []
+        contexts: List[int] = []
+        callstack: List[int] = []
+        context = self.context_id(())
+        for event, function_id, label in cflog.records():
+            if event == TDControlFlowLogSection.ENTER_FUNCTION:
+                callstack.append(function_id)
+                context = self.context_id(tuple(callstack))
+            elif function_id in callstack and callstack[-1] != function_id:
+                # Align the callstack in case leave events are missing
+                while callstack[-1] != function_id:
+                    callstack.pop()
+                context = self.context_id(tuple(callstack))
+            function = (
+                function_id
+                if self.function_names is None
+                else self.function_name(function_id)
+            )
+            if event == TDControlFlowLogSection.TAINTED_CONTROL_FLOW:
+                keys.append(hash((event, function, self.label_hash(label))))
+            else:
+                keys.append(hash((event, function)))
+            contexts.append(context)
+            if (
+                event == TDControlFlowLogSection.LEAVE_FUNCTION
+                and callstack
+                and callstack[-1] == function_id
+            ):
+                callstack.pop()
+                context = self.context_id(tuple(callstack))
+            if len(keys) == self.chunk_size:
+                yield np.array(keys, dtype=np.int64), np.array(contexts, dtype=np.int32)
+                keys.clear()
+                contexts.clear()
+        if keys:
+            yield np.array(keys, dtype=np.int64), np.array(contexts, dtype=np.int32)
+
+    def callstack(self, context_id: int) -> Tuple[str, ...]:
+        """Returns the names of the functions of the callstack with id `context_id`"""
+        return tuple(map(self.function_name, self.contexts[context_id]))
+
+
+class ControlFlowDivergence:
+    """Records `first_begin` to `first_end` of the first log that align with `second_begin` to `second_end`
+    of the second log, but differ
+
+    `first_callstack` and `second_callstack` are the callstacks at the start of the divergence.
+    """
+
+    def __init__(
+        self,
+        first_begin: int,
+        first_end: int,
+        second_begin: int,
+        second_end: int,
+        first_callstack: Tuple[str, ...],
+        second_callstack: Tuple[str, ...],
+    ):
+        self.first_begin: int = first_begin
+        self.first_end: int = first_end
+        self.second_begin: int = second_begin
+        self.second_end: int = second_end
+        self.first_callstack: Tuple[str, ...] = first_callstack
+        self.second_callstack: Tuple[str, ...] = second_callstack
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({self.first_begin!r}, {self.first_end!r}, "
+            f"{self.second_begin!r}, {self.second_end!r}, {self.first_callstack!r}, "
+            f"{self.second_callstack!r})"
+        )
+
+
+class _EncodedStream:
+    """A buffered reader of the chunks of a :class:`ControlFlowLogEncoding`"""
+
+    def __init__(self, encoding: ControlFlowLogEncoding):
+        self.encoding: ControlFlowLogEncoding = encoding
+        self.chunks: Iterator[Tuple[np.ndarray, np.ndarray]] = iter(encoding)
+        self.keys: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.contexts: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.position: int = 0
+        """The index in the log of the first buffered record"""
+        self.last_context: int = encoding.context_id(())
+        self.exhausted: bool = False
+
+    def fill(self, size: int):
+        """Buffers at least `size` records, unless the log ends before"""
+        pending_keys = [self.keys]
+        pending_contexts = [self.contexts]
+        buffered = len(self.keys)
+        while buffered < size and not self.exhausted:
+            try:
+                keys, contexts = next(self.chunks)
+            except StopIteration:
+                self.exhausted = True
+                break
+            pending_keys.append(keys)
+            pending_contexts.append(contexts)
+            buffered += len(keys)
+        if len(pending_keys) > 1:
+            self.keys = np.concatenate(pending_keys)
+            self.contexts = np.concatenate(pending_contexts)
+
+    def consume(self, n: int):
+        if n:
+            self.last_context = int(self.contexts[n - 1])
+            self.keys = self.keys[n:]
+            self.contexts = self.contexts[n:]
+            self.position += n
+
+    def context(self) -> Tuple[str, ...]:
+        """The callstack of the next record, or of the last record at the end of the log"""
+        if len(self.contexts):
+            return self.encoding.callstack(int(self.contexts[0]))
+        return self.encoding.callstack(self.last_context)
+
+
+def align_control_flow_logs(
+    first: ControlFlowLogEncoding,
+    second: ControlFlowLogEncoding,
+    window: int = 4096,
+    sync: int = 8,
+    max_distance: Optional[int] = None,
+) -> Iterator[ControlFlowDivergence]:
+    """Aligns two control flow logs and yields where they diverge, in order
+
+    Equal stretches are skipped by comparing a chunk of both logs at a time.
+    At a difference, the next `window` records of both logs are aligned with
+    :func:`matching_blocks`, and the logs are back in sync at the first common
+    stretch of at least `sync` records. Only about `window` records of each log
+    are held in memory, so logs of any size can be compared.
+
+    Windows that differ in more than `max_distance` edits, by default
+    2 * sync * log2(window), are not aligned and diverge as a whole, which
+    bounds the time spent on each window.
+    """
+    if max_distance is None:
+        max_distance = 2 * sync * max(1, window.bit_length() - 1)
+    a = _EncodedStream(first)
+    b = _EncodedStream(second)
+    while True:
+        a.fill(window)
+        b.fill(window)
+        if not len(a.keys) and not len(b.keys):
+            return
+        common = min(len(a.keys), len(b.keys))
+        if common:
+            equal = a.keys[:common] == b.keys[:common]
+            skip = common if equal.all() else int(np.argmin(equal))
+            a.consume(skip)
+            b.consume(skip)
+            if skip:
+                continue
 
-#         trace1 = PolyTrackerTrace.load(args.trace1)
-#         trace2 = PolyTrackerTrace.load(args.trace2)
-#         diff = TraceDiff(trace1, trace2)
-#         print(str(diff))
-#         if args.image is not None:
-#             diff.to_image().save(args.image)
+        if not len(a.keys) or not len(b.keys):
+            # One of the logs ended, the rest of the other one diverges
+            divergence = ControlFlowDivergence(
+                a.position, a.position, b.position, b.position, a.context(), b.context()
+            )
+            for stream in (a, b):
+                while len(stream.keys):
+                    stream.consume(len(stream.keys))
+                    stream.fill(window)
+            divergence.first_end = a.position
+            divergence.second_end = b.position
+            yield divergence
+            return
+
+        window_a = a.keys[:window].tolist()
+        window_b = b.keys[:window].tolist()
+        ends_a = a.exhausted and len(a.keys) <= window
+        ends_b = b.exhausted and len(b.keys) <= window
+        split_a, split_b = len(window_a), len(window_b)
+        for i, j, n in matching_blocks(window_a, window_b, max_distance):
+            if (
+                n >= sync
+                or (ends_a and i + n == len(window_a))
+                or (ends_b and j + n == len(window_b))
+            ):
+                split_a, split_b = i, j
+                break
+        divergence = ControlFlowDivergence(
+            a.position,
+            a.position + split_a,
+            b.position,
+            b.position + split_b,
+            a.context(),
+            b.context(),
+        )
+        a.consume(split_a)
+        b.consume(split_b)
+        yield divergence
+
+
+class TraceDiffCommand(Command):
+    name = "diff"
+    help = "compute a diff of two trace files"
+
+    def __init_arguments__(self, parser: ArgumentParser):
+        parser.add_argument("trace1", type=str, help="the first trace file")
+        parser.add_argument("trace2", type=str, help="the second trace file")
+        parser.add_argument(
+            "--function-ids",
+            "-f",
+            type=str,
+            nargs="+",
+            default=[],
+            help="the functionid.json written by the instrumentation of each trace, to name functions; "
+            "a single file is used for both traces",
+        )
+        parser.add_argument(
+            "--control-flow",
+            "-c",
+            type=int,
+            nargs="?",
+            const=10,
+            default=None,
+            metavar="MAX_DIVERGENCES",
+            help="also align the control flow logs and report where they diverge (at most 10 divergences "
+            "unless given)",
+        )
+
+    def run(self, args: Namespace):
+        if len(args.function_ids) > 2:
+            sys.stderr.write("at most two --function-ids files can be given\n")
+            return 1
+        names = []
+        for path in args.function_ids:
+            with open(path) as f:
+                names.append(json.load(f))
+        summaries = []
+        encodings = []
+        for i, path in enumerate((args.trace1, args.trace2)):
+            with open(path, "rb") as f:
+                trace = TDProgramTrace(f)
+            function_names = names[min(i, len(names) - 1)] if names else None
+            cflog = trace.tdfile.sections_by_type.get(TDControlFlowLogSection)
+            if function_names and isinstance(cflog, TDControlFlowLogSection):
+                cflog.function_id_mapping(function_names)
+            summaries.append(TDTraceSummary(trace))
+            encodings.append(ControlFlowLogEncoding(trace.tdfile, function_names))
+        diff = TDTraceDiff(*summaries)
+        if diff:
+            diff.write(sys.stdout, args.trace1, args.trace2)
+        else:
+            print("Traces do not differ")
+        if args.control_flow is not None:
+            divergences = itertools.islice(
+                align_control_flow_logs(*encodings), args.control_flow
+            )
+            for divergence in divergences:
+                print(
+                    f"control flow diverges: {args.trace1} records "
+                    f"[{divergence.first_begin}, {divergence.first_end}) in "
+                    f"{'>'.join(divergence.first_callstack)}, {args.trace2} records "
+                    f"[{divergence.second_begin}, {divergence.second_end}) in "
+                    f"{'>'.join(divergence.second_callstack)}"
+                )
 
 
 # class TemporalVisualization(Command):
@@ -1,11 +1,14 @@
 from abc import ABCMeta, abstractmethod
 from argparse import ArgumentParser, Namespace
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
 import itertools
 from logging import getLogger
+from pathlib import Path
 from typing import (
     Any,
     cast,
+    Deque,
     Dict,
     FrozenSet,
     Iterable,
@@ -33,6 +36,7 @@ from .parsing import (
     ParseTree,
     Start,
     Terminal,
+    TerminalTrie,
     trace_to_non_generalized_tree,
 )
 from .plugins import Command
@@ -169,8 +173,13 @@ class Production:
         else:
             return None
 
-    def partial_match(self, sentence: bytes) -> Iterator["PartialMatch"]:
-        """Enumerates all partial parse trees and remaining symbols that match the given sentence"""
+    def partial_match(
+        self, sentence: bytes, trie: Optional[TerminalTrie] = None
+    ) -> Iterator["PartialMatch"]:
+        """Enumerates all partial parse trees and remaining symbols that match the given sentence
+
+        `trie` holds the terminals of the grammar, it is built if not provided.
+        """
         if not self.rules or not sentence:
             yield PartialMatch(
                 tree=ImmutableParseTree(self),
@@ -178,13 +187,24 @@ class Production:
                 remaining_bytes=sentence,
             )
             return
+        if trie is None:
+            trie = self.grammar.terminal_trie()
+        # The remaining bytes are always a suffix of the sentence, so the terminals
+        # they start with can be cached by their length
+        prefixes: Dict[int, Set[bytes]] = {}
+
+        def starts_with(remaining: bytes, terminal: bytes) -> bool:
+            if len(remaining) not in prefixes:
+                prefixes[len(remaining)] = trie.prefixes(remaining)  # type: ignore
+            return terminal in prefixes[len(remaining)]
+
         for rule in self.rules:
 
             def make_tree() -> (
                 Tuple[ParseTree[ParseTreeValue], ParseTree[ParseTreeValue]]
             ):
                 root: ParseTree[ParseTreeValue] = ImmutableParseTree(self)
-                rtree: ParseTree[ParseTreeValue] = ImmutableParseTree(rule)
+                rtree: ParseTree[ParseTreeValue] = MutableParseTree(rule)
                 root.children.append(rtree)  # type: ignore
                 return root, rtree
 
@@ -207,7 +227,10 @@ class Production:
                 else:
                     next_symbol = remaining_symbols[0]
                     if isinstance(next_symbol, Terminal):
-                        if remaining_bytes == next_symbol.terminal:
+                        if not starts_with(remaining_bytes, next_symbol.terminal):
+                            # the terminal didn't match the input sentence
+                            pass
+                        elif len(remaining_bytes) == len(next_symbol.terminal):
                             root_tree, rule_tree = make_tree()
                             rule_tree.children = trees + [ImmutableParseTree(next_symbol)]  # type: ignore
                             yield PartialMatch(
@@ -215,7 +238,7 @@ class Production:
                                 remaining_symbols=tuple(remaining_symbols[1:]),
                                 remaining_bytes=b"",
                             )
-                        elif remaining_bytes.startswith(next_symbol.terminal):
+                        else:
                             stack.append(
                                 (
                                     remaining_bytes[len(next_symbol.terminal) :],
@@ -223,13 +246,10 @@ class Production:
                                     remaining_symbols[1:],
                                 )
                             )
-                        else:
-                            # the terminal didn't match the input sentence
-                            pass
                     else:
                         # this is a non-terminal
                         for match in self.grammar[next_symbol].partial_match(
-                            remaining_bytes
+                            remaining_bytes, trie
                         ):
                             if not match.remaining_bytes or (
                                 not match.remaining_symbols
@@ -703,6 +723,9 @@ class EarleyParser:
         ]
         self.parsed: bool = False
         self.start_states: FrozenSet[Prediction] = frozenset()
+        self.trie: TerminalTrie = grammar.terminal_trie()
+        # the terminals the sentence contains at an offset, by offset
+        self.terminals_at: Dict[int, Set[bytes]] = {}
 
     @property
     def end_states(self) -> Iterator[EarleyState]:
@@ -791,7 +814,9 @@ class EarleyParser:
     def _scan(self, state: EarleyState, k: int) -> bool:
         expected_element = state.next_element
         terminal = expected_element.terminal  # type: ignore
-        if not self.sentence[k:].startswith(terminal):
+        if k not in self.terminals_at:
+            self.terminals_at[k] = self.trie.prefixes(self.sentence, k)
+        if terminal not in self.terminals_at[k]:
             return False
         new_state = ScannedTerminal(
             prediction=state.prediction,
@@ -951,8 +976,8 @@ class _Node:
 
 
 class Match:
-    def __init__(self, parser: EarleyParser):
-        self.parser: EarleyParser = parser
+    def __init__(self, parser: Union[EarleyParser, "CompiledEarleyParser"]):
+        self.parser: Union[EarleyParser, CompiledEarleyParser] = parser
         self._is_match: Optional[bool] = None
 
     @property
@@ -979,6 +1004,348 @@ class Match:
         return self.parser.parse_trees()
 
 
+class CompiledGrammar:
+    """A grammar lowered into integer tables for the compiled Earley parser
+
+    Productions are numbered by their position in the grammar and terminals by
+    their distinct byte strings. A rule is a tuple of symbols, where a
+    nonterminal is its production number and a terminal is the bitwise inverse
+    of its terminal number. Each rule position (a "dotted item") also gets a
+    number, so an Earley state is packed into a single integer, see
+    `CompiledEarleyParser`.
+
+    Productions that cannot produce a terminal match the empty string, as in
+    `EarleyParser`. Empty terminals are dropped from rules.
+
+    The tables are a snapshot: compile the grammar again after modifying it.
+    """
+
+    def __init__(self, grammar: "Grammar"):
+        self.grammar: Grammar = grammar
+        self.productions: List[Production] = list(grammar)
+        self.production_index: Dict[NonTerminal, int] = {
+            prod.name: i for i, prod in enumerate(self.productions)
+        }
+        self.terminals: List[bytes] = []
+        terminal_index: Dict[bytes, int] = {}
+
+        self.rules: List[Tuple[int, ...]] = []
+        self.rule_objects: List[Rule] = []
+        self.rule_lhs: List[int] = []
+        self.production_rules: List[List[int]] = []
+        self.empty: List[bool] = []
+        for i, prod in enumerate(self.productions):
+            self.empty.append(not prod.can_produce_terminal)
+            rule_ids: List[int] = []
+            self.production_rules.append(rule_ids)
+            if self.empty[-1]:
+                continue
+            for rule in prod.rules:
+                symbols: List[int] = []
+                for symbol in rule.sequence:
+                    if isinstance(symbol, Terminal):
+                        if not symbol.terminal:
+                            continue
+                        if symbol.terminal not in terminal_index:
+                            terminal_index[symbol.terminal] = len(self.terminals)
+                            self.terminals.append(symbol.terminal)
+                        symbols.append(~terminal_index[symbol.terminal])
+                    else:
+                        symbols.append(self.production_index[symbol])
+                rule_ids.append(len(self.rules))
+                self.rules.append(tuple(symbols))
+                self.rule_objects.append(rule)
+                self.rule_lhs.append(i)
+
+        self.trie: TerminalTrie = TerminalTrie(self.terminals)
+
+        # item_symbol[item] is the symbol after the dot, or None if the rule is complete
+        self.rule_items: List[int] = []
+        self.item_symbol: List[Optional[int]] = []
+        self.item_rule: List[int] = []
+        for rule_id, symbols in enumerate(self.rules):
+            self.rule_items.append(len(self.item_symbol))
+            self.item_symbol.extend(symbols)
+            self.item_symbol.append(None)
+            self.item_rule.extend([rule_id] * (len(symbols) + 1))
+
+        self.nullable: List[bool] = list(self.empty)
+        changed = True
+        while changed:
+            changed = False
+            for rule_id, symbols in enumerate(self.rules):
+                lhs = self.rule_lhs[rule_id]
+                if not self.nullable[lhs] and all(
+                    s >= 0 and self.nullable[s] for s in symbols
+                ):
+                    self.nullable[lhs] = changed = True
+
+        # FIRST sets are bitmasks of the byte values a rule or production can start with
+        self.first: List[int] = [0] * len(self.productions)
+        self.rule_first: List[int] = [0] * len(self.rules)
+        changed = True
+        while changed:
+            changed = False
+            for rule_id, symbols in enumerate(self.rules):
+                first = 0
+                for s in symbols:
+                    if s < 0:
+                        first |= 1 << self.terminals[~s][0]
+                        break
+                    first |= self.first[s]
+                    if not self.nullable[s]:
+                        break
+                if first != self.rule_first[rule_id]:
+                    self.rule_first[rule_id] = first
+                    lhs = self.rule_lhs[rule_id]
+                    self.first[lhs] |= first
+                    changed = True
+
+        self.rule_nullable: List[bool] = [
+            all(s >= 0 and self.nullable[s] for s in symbols) for symbols in self.rules
+        ]
+
+    def match(
+        self, sentence: Union[str, bytes], start: Optional[Production] = None
+    ) -> Match:
+        return Match(CompiledEarleyParser(self, sentence, start))
+
+
+class CompiledEarleyParser:
+    """An Earley parser over a `CompiledGrammar`
+
+    States are packed as `item * width + origin`, where `width` is one more than
+    the length of the sentence, so advancing a state over a symbol adds `width`.
+    Nullable symbols are skipped when predicted (Aycock and Horspool), and rules
+    are only predicted if the next input byte is in their FIRST set.
+
+    Only the first parse tree is reconstructed. Its nodes are productions, each
+    with the rule it was matched by as its only child, which in turn has a child
+    per symbol in the rule.
+    """
+
+    def __init__(
+        self,
+        compiled: CompiledGrammar,
+        sentence: Union[str, bytes],
+        start: Optional[Production] = None,
+    ):
+        self.compiled: CompiledGrammar = compiled
+        if isinstance(sentence, str):
+            self.sentence: bytes = sentence.encode("utf-8")
+        else:
+            self.sentence = sentence
+        if start is None:
+            if compiled.grammar.start is None:
+                raise ValueError(
+                    "Either the grammar must have a start production or one must be provided"
+                )
+            start = compiled.grammar.start
+        self.start: int = compiled.production_index[start.name]
+        self.width: int = len(self.sentence) + 1
+        self.chart: List[Set[int]] = []
+        # completed[k][production] is the set of origins of completions at k
+        self.completed: List[Dict[int, Set[int]]] = []
+        self.parsed: bool = False
+        self.tree: Optional[ParseTree[ParseTreeValue]] = None
+
+    def _recognize(self):
+        c = self.compiled
+        sentence = self.sentence
+        width = self.width
+        item_symbol = c.item_symbol
+        item_rule = c.item_rule
+        rule_lhs = c.rule_lhs
+        rule_items = c.rule_items
+        rule_first = c.rule_first
+        rule_nullable = c.rule_nullable
+        production_rules = c.production_rules
+        nullable = c.nullable
+        terminals = c.terminals
+        trie = c.trie
+
+        charts: List[Set[int]] = [set() for _ in range(width)]
+        queues: List[List[int]] = [[] for _ in range(width)]
+        waiting: List[Dict[int, List[int]]] = [{} for _ in range(width)]
+        completed: List[Dict[int, Set[int]]] = [{} for _ in range(width)]
+
+        def predict(symbol: int, k: int, chart: Set[int], queue: List[int]):
+            next_byte = 1 << sentence[k] if k < len(sentence) else 0
+            for rule_id in production_rules[symbol]:
+                if rule_first[rule_id] & next_byte or rule_nullable[rule_id]:
+                    state = rule_items[rule_id] * width + k
+                    if state not in chart:
+                        chart.add(state)
+                        queue.append(state)
+
+        predict(self.start, 0, charts[0], queues[0])
+        last_k_with_match = -1
+        for k in trange(width, leave=False, desc="Parsing", unit=" bytes"):
+            chart = charts[k]
+            queue = queues[k]
+            waiting_k = waiting[k]
+            completed_k = completed[k]
+            # states waiting to scan, by terminal
+            scanning: Dict[int, List[int]] = {}
+            i = 0
+            while i < len(queue):
+                state = queue[i]
+                i += 1
+                item, origin = divmod(state, width)
+                symbol = item_symbol[item]
+                if symbol is None:
+                    lhs = rule_lhs[item_rule[item]]
+                    origins = completed_k.setdefault(lhs, set())
+                    if origin in origins:
+                        continue
+                    origins.add(origin)
+                    for waiting_state in waiting[origin].get(lhs, ()):
+                        advanced = waiting_state + width
+                        if advanced not in chart:
+                            chart.add(advanced)
+                            queue.append(advanced)
+                elif symbol >= 0:
+                    waiters = waiting_k.get(symbol)
+                    if waiters is None:
+                        waiting_k[symbol] = [state]
+                        predict(symbol, k, chart, queue)
+                    else:
+                        waiters.append(state)
+                    if nullable[symbol]:
+                        advanced = state + width
+                        if advanced not in chart:
+                            chart.add(advanced)
+                            queue.append(advanced)
+                else:
+                    scanning.setdefault(~symbol, []).append(state)
+            if scanning:
+                # scanning only adds states to later positions, so all states
+                # waiting for a terminal are scanned with a single trie walk
+                for terminal in trie.matches(sentence, k):
+                    if terminal not in scanning:
+                        continue
+                    end = k + len(terminals[terminal])
+                    last_k_with_match = max(last_k_with_match, end - 1)
+                    for state in scanning[terminal]:
+                        advanced = state + width
+                        if advanced not in charts[end]:
+                            charts[end].add(advanced)
+                            queues[end].append(advanced)
+            queues[k] = []
+
+        self.chart = charts
+        self.completed = completed
+        if last_k_with_match < len(sentence) - 1:
+            offset = last_k_with_match + 1
+            raise ValueError(
+                f"Unexpected byte {sentence[offset:offset+1]!r} at offset "
+                f"{offset}\n{highlight_offset(sentence, offset)}"
+            )
+
+    def _splits(
+        self, rule_id: int, start: int, end: int
+    ) -> Iterator[List[Tuple[int, int, int]]]:
+        """Enumerates the ways the symbols of a rule can span [start, end)
+
+        Yields a list of (symbol, start, end) for each symbol of the rule.
+        """
+        c = self.compiled
+        symbols = c.rules[rule_id]
+        first_item = c.rule_items[rule_id]
+        width = self.width
+        stack: List[Tuple[int, int, List[Tuple[int, int, int]]]] = [
+            (len(symbols), end, [])
+        ]
+        while stack:
+            dot, right, spans = stack.pop()
+            if dot == 0:
+                if right == start:
+                    yield spans[::-1]
+                continue
+            prefix = (first_item + dot - 1) * width + start
+            symbol = symbols[dot - 1]
+            if symbol < 0:
+                left = right - len(c.terminals[~symbol])
+                if left >= start and prefix in self.chart[left]:
+                    stack.append((dot - 1, left, spans + [(symbol, left, right)]))
+                continue
+            if c.empty[symbol]:
+                lefts: Iterable[int] = (right,)
+            else:
+                lefts = self.completed[right].get(symbol, ())
+            for left in lefts:
+                if left >= start and prefix in self.chart[left]:
+                    stack.append((dot - 1, left, spans + [(symbol, left, right)]))
+
+    def _build_tree(self) -> Optional[ParseTree[ParseTreeValue]]:
+        c = self.compiled
+        n = len(self.sentence)
+        if 0 not in self.completed[n].get(self.start, ()):
+            return None
+        root: MutableParseTree[ParseTreeValue] = MutableParseTree(
+            c.productions[self.start]
+        )
+        # (tree, production, start, end, productions on the path spanning the same range)
+        stack: List[
+            Tuple[MutableParseTree[ParseTreeValue], int, int, int, Tuple[int, ...]]
+        ] = [(root, self.start, 0, n, (self.start,))]
+        while stack:
+            tree, prod, start, end, same_span = stack.pop()
+            if c.empty[prod]:
+                continue
+            for rule_id in c.production_rules[prod]:
+                if (
+                    c.rule_items[rule_id] + len(c.rules[rule_id])
+                ) * self.width + start not in self.chart[end]:
+                    continue
+                for spans in self._splits(rule_id, start, end):
+                    if not any(
+                        s >= 0 and (left, right) == (start, end) and s in same_span
+                        for s, left, right in spans
+                    ):
+                        break
+                else:
+                    continue
+                break
+            else:
+                raise ValueError(
+                    f"Unable to reconstruct {c.productions[prod].name} spanning [{start}, {end})"
+                )
+            rule_tree: MutableParseTree[ParseTreeValue] = MutableParseTree(
+                c.rule_objects[rule_id]
+            )
+            tree.children = [rule_tree]
+            for symbol, left, right in spans:
+                if symbol < 0:
+                    rule_tree.add_child(
+                        MutableParseTree(Terminal(c.terminals[~symbol]))
+                    )
+                    continue
+                child: MutableParseTree[ParseTreeValue] = MutableParseTree(
+                    c.productions[symbol]
+                )
+                rule_tree.add_child(child)
+                if (left, right) == (start, end):
+                    stack.append((child, symbol, left, right, same_span + (symbol,)))
+                else:
+                    stack.append((child, symbol, left, right, (symbol,)))
+        return root
+
+    def parse(self) -> Iterator[ParseTree[ParseTreeValue]]:
+        if not self.parsed:
+            self.parsed = True
+            self._recognize()
+            self.tree = self._build_tree()
+        return self.parse_trees()
+
+    def parse_trees(self) -> Iterator[ParseTree[ParseTreeValue]]:
+        if not self.parsed:
+            yield from self.parse()
+            return
+        if self.tree is not None:
+            yield self.tree
+
+
 class Grammar:
     def __init__(self):
         self.productions: Dict[NonTerminal, Production] = {}
@@ -986,11 +1353,36 @@ class Grammar:
         self.start: Optional[Production] = None
 
     def match(
-        self, sentence: Union[str, bytes], start: Optional[Production] = None
+        self,
+        sentence: Union[str, bytes],
+        start: Optional[Production] = None,
+        compiled: bool = False,
     ) -> Match:
+        """Matches the sentence against the grammar
+
+        With `compiled`, the grammar is lowered into a `CompiledGrammar` and
+        matched by the much faster `CompiledEarleyParser`, which only
+        reconstructs the first parse tree. Use `compile` directly to match
+        many sentences against the same grammar.
+        """
+        if compiled:
+            return self.compile().match(sentence, start)
         parser = EarleyParser(grammar=self, sentence=sentence, start=start)
         return Match(parser)
 
+    def compile(self) -> CompiledGrammar:
+        return CompiledGrammar(self)
+
+    def terminal_trie(self) -> TerminalTrie:
+        """Returns a trie of all terminals used in the grammar"""
+        return TerminalTrie(
+            symbol
+            for prod in self.productions.values()
+            for rule in prod.rules
+            for symbol in rule.sequence
+            if isinstance(symbol, Terminal)
+        )
+
     def find_partial_trees(
         self, sentence: bytes, start: Optional[Production] = None
     ) -> Iterator[ParseTree[ParseTreeValue]]:
@@ -1091,88 +1483,103 @@ class Grammar:
                     )
 
     def simplify(self) -> bool:
+        """Simplifies the grammar until no more simplifications apply
+
+        Removable productions that cannot produce a terminal are removed, and
+        removable productions with a single rule are replaced by that rule
+        wherever they are used. Productions are kept on a worklist, and only the
+        users of a production that was removed or inlined are revisited, so the
+        work done is proportional to the number of simplifications made.
+        """
         modified = False
+        worklist: Deque[NonTerminal] = deque(self.productions)
+        queued: Set[NonTerminal] = set(worklist)
         with tqdm(
-            desc="garbage collecting", unit=" productions", leave=False, unit_divisor=1
+            desc="simplifying", unit=" productions", leave=False, unit_divisor=1
         ) as status:
-            for prod in tqdm(
-                list(self.productions.values()),
-                desc="simplifying trivial productions",
-                unit=" productions",
-                leave=False,
-                unit_divisor=1,
-            ):
+            while worklist:
+                name = worklist.popleft()
+                queued.discard(name)
+                if name not in self:
+                    continue
+                prod = self[name]
                 # remove any rules in the production that just recursively call the same production
-                prod.remove_recursive_rules()
-                if prod.removable and len(prod.rules) == 1:
+                if prod.remove_recursive_rules():
+                    modified = True
+                if not prod.removable:
+                    continue
+                users = [user for user in self.used_by[name] if user != name]
+                if not prod.can_produce_terminal:
+                    self.remove(prod)
+                elif len(prod.rules) == 1 and name not in prod.first_rule().sequence:  # type: ignore
                     # this production has a single rule, so replace all uses with that rule
-                    for user in list(prod.used_by):
-                        user.replace_sub_production(prod.name, prod.first_rule())  # type: ignore
+                    rule = prod.first_rule()
+                    for user in users:
+                        self[user].replace_sub_production(name, rule)  # type: ignore
                     self.remove(prod)
-                    modified = True
-                    # print(f"replaced {prod} with {prod.first_rule()}")
-                    # self.verify(test_disconnection=False)
-                    status.update(1)
-            for prod in tqdm(
-                list(self.productions.values()),
-                desc="removing empty productions",
-                unit=" productions",
-                leave=False,
-                unit_divisor=1,
-            ):
-                if prod.removable and not prod.can_produce_terminal:
-                    removed = self.remove(prod)
-                    assert removed
-                    # print(f"removed {prod} because it was empty")
-                    # self.verify(test_disconnection=False)
-                    status.update(1)
-                    modified = True
+                else:
+                    continue
+                modified = True
+                status.update(1)
+                # the rules of the users changed, so they might now be simplified
+                for user in users:
+                    if user not in queued:
+                        queued.add(user)
+                        worklist.append(user)
         return modified
-        modified = False
-        modified_last_pass = True
-        with tqdm(
-            desc="garbage collecting", unit=" productions", leave=False, unit_divisor=1
-        ) as status:
-            while modified_last_pass:
-                modified_last_pass = False
-                for prod in list(self.productions.values()):
-                    # remove any rules in the production that just recursively call the same production
-                    recursive_rules = prod.remove_recursive_rules()
-                    modified_last_pass = bool(recursive_rules)
-                    if not prod.can_produce_terminal and prod is not self.start:
-                        # remove any produtions that only produce empty strings
-                        removed = self.remove(prod)
-                        assert removed
-                        # print(f"removed {prod} because it was empty")
-                        # self.verify(test_disconnection=False)
-                        status.update(1)
-                        modified_last_pass = True
-                    elif len(prod.rules) == 1 and prod is not self.start:
-                        # this production has a single rule, so replace all uses with that rule
-                        for user in list(prod.used_by):
-                            user.replace_sub_production(prod.name, prod.first_rule())  # type: ignore
-                        self.remove(prod)
-                        # print(f"replaced {prod} with {prod.first_rule()}")
-                        # self.verify(test_disconnection=False)
-                        status.update(1)
-                        modified_last_pass = True
-                modified = modified or modified_last_pass
-            # traverse the productions from the least dominant up
-            dominators = self.dependency_graph().dominator_forest
-            ordered_productions: List[Production] = list(
-                nx.dfs_postorder_nodes(dominators, source=self.start)
-            )
-            # see if any of the productions are equivalent. if so, combine them
-            for p1, p2 in itertools.combinations(ordered_productions, 2):
-                if p1 == p2:
-                    # p2 dominates p1 in the grammar, so replace p1 with p2
-                    for user in list(p1.used_by):
-                        user.replace_sub_production(p1.name, p2.name)  # type: ignore
-                    self.remove(p1)
-                    status.update(1)
-                    modified = True
 
-            return modified
+    def merge(self, other: "Grammar") -> "Grammar":
+        """Adds the productions and rules of `other` to this grammar and returns this grammar
+
+        Productions are matched by name and rules are deduplicated by their hash, so
+        merging grammars extracted from traces of the same program only adds the
+        rules that were not already present.
+        """
+        for prod in other.productions.values():
+            rules = [Rule(self, *rule.sequence) for rule in prod.rules]
+            if prod.name in self:
+                existing = self[prod.name]
+                for rule in rules:
+                    existing.add(rule)
+                existing.removable = existing.removable and prod.removable
+            else:
+                Production(self, prod.name, *rules).removable = prod.removable
+        # new rules can make productions able to produce terminals
+        for prod in self.productions.values():
+            prod._can_produce_terminal = None
+        if self.start is None and other.start is not None:
+            self.start = self[other.start.name]
+        return self
+
+    def deduplicate(self) -> bool:
+        """Replaces removable productions that have identical rules with a single production
+
+        Productions are grouped by the structural hash of their rule sets, and every
+        production in a group is replaced by the first one by name. Replacing a
+        production can make its users identical, so this repeats until no duplicates
+        remain.
+        """
+        modified = False
+        while True:
+            canonical: Dict[FrozenSet[Tuple[Symbol, ...]], NonTerminal] = {}
+            duplicates: List[Tuple[NonTerminal, NonTerminal]] = []
+            for name in sorted(self.productions):
+                prod = self.productions[name]
+                if not prod.removable or prod is self.start:
+                    continue
+                key = frozenset(rule.sequence for rule in prod.rules)
+                if key in canonical:
+                    duplicates.append((name, canonical[key]))
+                else:
+                    canonical[key] = name
+            if not duplicates:
+                return modified
+            for name, replacement in duplicates:
+                for user in list(self.used_by[name]):
+                    if user != name:
+                        self[user].replace_sub_production(name, replacement)
+                self.remove(name)
+            modified = True
 
     def __len__(self):
         return len(self.productions)
@@ -1331,49 +1738,103 @@ def trace_to_grammar(trace: ProgramTrace) -> Grammar:
     return grammar
 
 
+def trace_grammar(trace: ProgramTrace) -> Grammar:
+    """Extracts the unsimplified grammar of a single trace"""
+    inputs = list(trace.inputs)
+    if len(inputs) == 0:
+        raise ValueError(f"Trace {trace} did not load any taints")
+    source = inputs[0]
+    if len(inputs) > 1:
+        log.warning(f"Trace {trace} operated on multiple inputs; using {source}")
+    properties = trace.input_properties(source)
+    if properties.unused_byte_offsets:
+        log.warning(
+            "Warning: The following byte offsets were never recorded as being read in the trace: "
+            f"        {[(offset, source.content[offset:offset+1]) for offset in properties.unused_byte_offsets]!r}"
+        )
+    if properties.out_of_order_byte_offsets:
+        log.warning(
+            "Warning: The trace read the following bytes out of order (implying that the trace is of a parser that "
+            f"is not a pure recursive descent parser): {', '.join(map(str, properties.out_of_order_byte_offsets))}"
+        )
+    if properties.file_seeks:
+        # this should only ever happen if properties.out_of_order_byte_offsets is also populated
+        seeks = [
+            f"⎆{i}:⎗{from_offset}→{to_offset}⎘"
+            for i, from_offset, to_offset in properties.file_seeks
+        ]
+        log.info(
+            f"The parser backtracked from one offset to another at the following event indexes: {', '.join(seeks)}"
+        )
+    tree = trace_to_non_generalized_tree(trace)
+    match_before = tree.matches()
+    tree.simplify()
+    assert match_before == tree.matches() == source.content
+    return parse_tree_to_grammar(tree)
+
+
+def _load_trace_grammar(trace: Union[ProgramTrace, str, Path]) -> Grammar:
+    if not isinstance(trace, ProgramTrace):
+        from .taint_dag import TDProgramTrace
+
+        trace = TDProgramTrace.load(trace)
+    return trace_grammar(trace)
+
+
+def _merge_pair(first: Grammar, second: Grammar) -> Grammar:
+    return first.merge(second)
+
+
+def merge_grammars(
+    grammars: Iterable[Grammar], executor: Optional[Executor] = None
+) -> Grammar:
+    """Merges grammars pairwise in a tree reduction
+
+    Each level of the reduction halves the number of grammars, so the merges of a
+    level are independent and are run on `executor` if one is provided.
+    """
+    level: List[Grammar] = list(grammars)
+    if not level:
+        return Grammar()
+    while len(level) > 1:
+        pairs = list(zip(level[::2], level[1::2]))
+        if executor is None:
+            merged = [_merge_pair(first, second) for first, second in pairs]
+        else:
+            merged = list(executor.map(_merge_pair, *zip(*pairs)))
+        if len(level) % 2:
+            merged.append(level[-1])
+        level = merged
+    return level[0]
+
+
 @PolyTrackerREPL.register("extract_grammar")
-def extract(traces: Iterable[ProgramTrace], simplify: bool = False) -> Grammar:
-    """extract a grammar from a set of traces"""
-    trace_iter: Iterable[ProgramTrace] = tqdm(
+def extract(
+    traces: Iterable[Union[ProgramTrace, str, Path]],
+    simplify: bool = False,
+    jobs: int = 1,
+) -> Grammar:
+    """extract a grammar from a set of traces
+
+    Traces can be given as loaded traces or as paths to TDAG files. With more than
+    one job, traces are converted to grammars in a process pool (which requires
+    the traces to be picklable, so pass paths) and merged in a tree reduction.
+    Productions with identical rules are deduplicated after merging.
+    """
+    trace_iter: Iterable[Union[ProgramTrace, str, Path]] = tqdm(
         traces, unit=" trace", desc="extracting traces", leave=False
     )
-    for trace in trace_iter:
-        inputs = list(trace.inputs)
-        if len(inputs) == 0:
-            raise ValueError(f"Trace {trace} did not load any taints")
-        source = inputs[0]
-        if len(inputs) > 1:
-            log.warning(f"Trace {trace} operated on multiple inputs; using {source}")
-        properties = trace.input_properties(source)
-        if properties.unused_byte_offsets:
-            log.warning(
-                "Warning: The following byte offsets were never recorded as being read in the trace: "
-                f"        {[(offset, source.content[offset:offset+1]) for offset in properties.unused_byte_offsets]!r}"
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            grammar = merge_grammars(
+                executor.map(_load_trace_grammar, trace_iter), executor
             )
-        if properties.out_of_order_byte_offsets:
-            log.warning(
-                "Warning: The trace read the following bytes out of order (implying that the trace is of a parser that "
-                f"is not a pure recursive descent parser): {', '.join(map(str, properties.out_of_order_byte_offsets))}"
-            )
-        if properties.file_seeks:
-            # this should only ever happen if properties.out_of_order_byte_offsets is also populated
-            seeks = [
-                f"⎆{i}:⎗{from_offset}→{to_offset}⎘"
-                for i, from_offset, to_offset in properties.file_seeks
-            ]
-            log.info(
-                f"The parser backtracked from one offset to another at the following event indexes: {', '.join(seeks)}"
-            )
-        tree = trace_to_non_generalized_tree(trace)
-        match_before = tree.matches()
-        tree.simplify()
-        assert match_before == tree.matches() == source.content
-        # TODO: Merge the grammars
-        grammar = parse_tree_to_grammar(tree)
-        if simplify:
-            grammar.simplify()
-        return grammar
-    return Grammar()
+    else:
+        grammar = merge_grammars(map(_load_trace_grammar, trace_iter))
+    grammar.deduplicate()
+    if simplify:
+        grammar.simplify()
+    return grammar
 
 
 def to_dot(graph: DiGraph, comment: Optional[str] = None) -> graphviz.Digraph:
@@ -1396,48 +1857,36 @@ def to_dot(graph: DiGraph, comment: Optional[str] = None) -> graphviz.Digraph:
     return dot
 
 
-# TODO (msurovic): Re-enable once TDProgramTrace.functions() is implemented
-
-# class ExtractGrammarCommand(Command):
-#     name = "grammar"
-#     help = "extract a grammar from one or more program traces"
-
-#     def __init__(self, *args, **kwargs):
-#         super().__init__(*args, **kwargs)
-#         self.traces: List[ProgramTrace] = []
-#         self.grammar: Optional[Grammar] = None
-
-#     def __init_arguments__(self, parser: ArgumentParser):
-#         parser.add_argument(
-#             "TRACES",
-#             nargs="+",
-#             type=str,
-#             help="extract a grammar from the provided PolyTracker trace databases",
-#         )
-#         parser.add_argument(
-#             "--simplify", "-s", action="store_true", help="simplify the grammar"
-#         )
-
-#     def run(self, args: Namespace):
-#         self.traces = []
-#         try:
-#             for trace_db_path in args.TRACES:
-#                 trace = PolyTrackerTrace.load(trace_db_path)
-#                 # to_dot(trace.cfg).save("cfg.dot")
-#                 # print(f"num nodes {trace.cfg.number_of_nodes()}")
-#                 # if not trace.is_cfg_connected():
-#                 #     roots = list(trace.cfg_roots())
-#                 #     if len(roots) == 0:
-#                 #         log.error(f"Basic block trace of {trace_db_path} has no roots!\n\n")
-#                 #     else:
-#                 #         root_names = "".join(f"\t{r!s}\n" for r in roots)
-#                 #         log.error(
-#                 #             f"Basic block trace of {trace_db_path} has multiple roots:\n{root_names}"
-#                 #         )
-#                 #     exit(1)
-#                 self.traces.append(trace)
-#         except ValueError as e:
-#             log.error(f"{e!s}\n\n")
-#             exit(1)
-#         self.grammar = extract(self.traces, args.simplify)
-#         print(str(self.grammar))
+class ExtractGrammarCommand(Command):
+    name = "grammar"
+    help = "extract a grammar from one or more program traces"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.grammar: Optional[Grammar] = None
+
+    def __init_arguments__(self, parser: ArgumentParser):
+        parser.add_argument(
+            "TRACES",
+            nargs="+",
+            type=str,
+            help="extract a grammar from the provided PolyTracker TDAG files",
+        )
+        parser.add_argument(
+            "--simplify", "-s", action="store_true", help="simplify the grammar"
+        )
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            default=1,
+            help="number of traces to process in parallel (default: 1)",
+        )
+
+    def run(self, args: Namespace):
+        try:
+            self.grammar = extract(args.TRACES, args.simplify, args.jobs)
+        except ValueError as e:
+            log.error(f"{e!s}\n\n")
+            return 1
+        print(str(self.grammar))
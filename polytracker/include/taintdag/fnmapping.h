@@ -33,6 +33,7 @@ public:
   static constexpr uint8_t tag{6};
   static constexpr size_t allocation_size{std::numeric_limits<index_t>::max() *
                                           sizeof(Function)};
+  static constexpr size_t max_allocation_size{allocation_size};
 
   template <typename OF>
   Functions(SectionArg<OF> of)
@@ -10,6 +10,7 @@
 
 #include "taintdag/encoding.h"
 #include "taintdag/labeldeq.h"
+#include "taintdag/runtime_stats.h"
 #include "taintdag/section.h"
 #include "taintdag/taint.h"
 #include "taintdag/union.h"
@@ -21,6 +22,8 @@ struct Labels : public FixedSizeAlloc<storage_t> {
   static constexpr uint8_t tag{2};
   static constexpr size_t allocation_size{sizeof(storage_t) *
                                           (static_cast<size_t>(max_label) + 1)};
+  // Labels beyond max_label can't be represented
+  static constexpr size_t max_allocation_size{allocation_size};
 
   // How many labels to scan backwards to detect if the same Taint is about to
   // be produced.
@@ -53,15 +56,20 @@ struct Labels : public FixedSizeAlloc<storage_t> {
 
   // Create a taint union
   label_t union_taint(label_t l, label_t r) {
+    increment(union_counters.requested);
     // TODO (hbrodin): Might already be covered by DFSAN
-    if (l == r)
+    if (l == r) {
+      increment(union_counters.identical);
       return l;
+    }
 
     auto lval = read_label(l);
     auto rval = read_label(r);
     auto result = union_::compute(l, lval, r, rval);
-    if (auto lbl = std::get_if<label_t>(&result))
+    if (auto lbl = std::get_if<label_t>(&result)) {
+      increment(union_counters.short_circuited);
       return *lbl;
+    }
 
     // At this point we should add a new taint, before doing so,
     // scan backwards to see if an identical taint was recently added
@@ -69,12 +77,16 @@ struct Labels : public FixedSizeAlloc<storage_t> {
 
     auto hilbl = std::max(l, r);
     auto dup = duplicate_check(hilbl, encoded);
-    if (dup)
+    if (dup) {
+      increment(union_counters.deduplicated);
       return dup.value();
+    }
 
     // Nothing left to check, just add the new taint.
-    if (auto ret = construct(encoded); ret)
+    if (auto ret = construct(encoded); ret) {
+      increment(union_counters.created);
       return index(ret->t);
+    }
 
     error_exit("Failed to construct taint union.");
     return 0; // NOTE(hbrodin): Never reached due to error_exit that terminates.
@@ -176,6 +188,9 @@ struct Labels : public FixedSizeAlloc<storage_t> {
     }
   }
 
+  // Outcomes of union_taint, recorded in the RuntimeStats section at exit
+  UnionCounters union_counters;
+
 private:
   // TODO(hbrodin): This relies on the fact that we know that storage is aligned
   // uint64_t memory that can atomically be replaced. This implementation could
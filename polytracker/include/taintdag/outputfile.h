@@ -8,11 +8,20 @@
 
 #pragma once
 
+#include <algorithm>
+#include <array>
 #include <concepts>
+#include <cstring>
 #include <filesystem>
+#include <limits>
+#include <memory>
+#include <mutex>
+#include <numeric>
 #include <span>
 #include <tuple>
+#include <vector>
 
+#include "taintdag/section.h"
 #include "taintdag/storage.h"
 #include "taintdag/util.h"
 
@@ -34,6 +43,15 @@ concept Section = requires(T a) {
   { a.size() } -> std::convertible_to<std::size_t>;
 };
 
+// Number of bytes to reserve for each section, indexed by section tag. Zero
+// reserves the section's allocation_size.
+//
+// A section may declare a `max_allocation_size` it can address, the capacity
+// is then limited to it. The capacity is rounded down to a multiple of the
+// section's `align_of` and, if declared, its `granularity`.
+using SectionCapacities =
+    std::array<size_t, size_t{std::numeric_limits<uint8_t>::max()} + 1>;
+
 // Need a single arg to create instances of the Section type in place
 // to prevent requirements on copyable/moveable sections.
 // This is needed because sections need to store non-copyable/moveable
@@ -69,6 +87,10 @@ public:
 
     // Size, in bytes, of the section
     uint64_t size{0};
+
+    // Number of bytes reserved for the section when the file was created.
+    // Recorded up front, so it is known even if the run aborts.
+    uint64_t capacity{0};
   };
 
   // File header information, followed by section_count SectionMeta.
@@ -86,22 +108,33 @@ public:
     uint16_t section_count{sizeof...(Sections)};
   };
 
+  // Maximum number of extents that can be added to the file, see add_extent
+  static constexpr size_t max_extents{32};
+
   // The FileHeader is constructed at offset zero of the mapped memory (file).
   // It contains the metadata required to parse a TDAG file. Initially each
-  // section is assumed to be 0 bytes in size. On destruction of
+  // section is assumed to be 0 bytes in size, and its capacity is recorded as
+  // it is allocated. On destruction of
   // the OutputFile instance the size field of each section is updated to
-  // reflect the actual, used size.
+  // reflect the actual, used size. The SectionMeta of extents follow those of
+  // the sections, only the first meta.section_count entries are in use.
   struct FileHeader {
     FileMeta meta;
-    SectionMeta sections[sizeof...(Sections)] = {
+    SectionMeta sections[sizeof...(Sections) + max_extents] = {
         (SectionMeta{.tag = Sections::tag,
                      .align = Sections::align_of,
                      .offset = 0,
-                     .size = 0})...};
+                     .size = 0,
+                     .capacity = 0})...};
   };
 
-  OutputFile(std::filesystem::path const &filename)
-      : mapped_memory_{std::move(filename), required_allocation_size()},
+  // If `compact` is set, sections are moved to be tightly packed when the
+  // OutputFile is destroyed, see `compact()`. `capacities` overrides the
+  // number of bytes reserved for sections.
+  OutputFile(std::filesystem::path const &filename, bool compact = false,
+             SectionCapacities const &capacities = {})
+      : compact_{compact}, capacities_{capacity<Sections>(capacities)...},
+        mapped_memory_{std::move(filename), required_allocation_size()},
         file_header_{new (mapped_memory_.begin) FileHeader},
         alloc_ptr_{mapped_memory_.begin + sizeof(FileHeader)},
         sections_{(SectionArg<OutputFile>{
@@ -126,8 +159,16 @@ public:
             .size = std::get<Sections>(sections_).size()...};
 
     (void)_;
+    for (size_t i = 0; i < extents_.size(); ++i) {
+      file_header_->sections[sizeof...(Sections) + i].size =
+          extents_[i].section->size();
+    }
     // TODO(hbrodin): Is there a need to notify the sections about shutdown in
     // progress?
+
+    if (compact_) {
+      compact();
+    }
   }
 
   // Accessor for a specific section in the OutputFile.
@@ -136,27 +177,145 @@ public:
     return std::get<T>(sections_);
   }
 
+  // Returns the number of bytes reserved for section T.
+  template <typename T>
+  size_t section_capacity() const
+      requires(std::is_same_v<T, Sections> || ...) {
+    return capacities_[util::TypeIndex<T, std::tuple<Sections...>>::index];
+  }
+
+  // Grows section T, that exhausted its reserved memory, by an extent of
+  // `size` bytes mapped at the end of the file. Readers concatenate the
+  // extents of a section in file order. The extent is managed as a
+  // T::extent_t, which is returned, or nullptr if max_extents is reached.
+  template <typename T>
+  typename T::extent_t *add_extent(size_t size)
+      requires(std::is_same_v<T, Sections> || ...) {
+    std::unique_lock<std::mutex> l{extents_m_};
+    if (extents_.size() == max_extents) {
+      return nullptr;
+    }
+    auto [offset, range] = mapped_memory_.extend(size);
+    auto extent = std::make_shared<typename T::extent_t>(range);
+    auto &meta = file_header_->meta;
+    file_header_->sections[meta.section_count++] =
+        SectionMeta{.tag = T::tag,
+                    .align = T::align_of,
+                    .offset = offset,
+                    .size = 0,
+                    .capacity = size};
+    extents_.push_back(
+        Extent{.tag = T::tag, .capacity = size, .section = extent});
+    return extent.get();
+  }
+
+  // Invokes f(tag, used, capacity) for each section in file order, where used
+  // is the number of bytes currently used by the section and capacity the
+  // number of bytes reserved for it, both including its extents.
+  template <typename F> void for_each_section(F &&f) {
+    std::unique_lock<std::mutex> l{extents_m_};
+    (f(Sections::tag,
+       std::get<Sections>(sections_).size() + extents_used(Sections::tag),
+       section_capacity<Sections>() + extents_capacity(Sections::tag)),
+     ...);
+  }
+
 private:
+  // An extent of a section, see add_extent
+  struct Extent {
+    uint8_t tag;
+    size_t capacity;
+    std::shared_ptr<SectionBase> section;
+  };
+
+  // Returns the number of bytes used by the extents of section `tag`
+  size_t extents_used(uint8_t tag) const {
+    size_t used = 0;
+    for (auto const &extent : extents_) {
+      if (extent.tag == tag) {
+        used += extent.section->size();
+      }
+    }
+    return used;
+  }
+
+  // Returns the number of bytes reserved by the extents of section `tag`
+  size_t extents_capacity(uint8_t tag) const {
+    size_t capacity = 0;
+    for (auto const &extent : extents_) {
+      if (extent.tag == tag) {
+        capacity += extent.capacity;
+      }
+    }
+    return capacity;
+  }
+
+  // Moves every section to directly follow the previous one (respecting
+  // alignment), updates the section offsets and truncates the file to the
+  // resulting size. Sections are allocated in increasing offset order, so
+  // moving them front to back never overwrites data not yet moved.
+  // Extents are moved as well, after mapping the whole file as one range.
+  // NOTE: Must only be invoked when no more writes to the sections will occur.
+  void compact() {
+    mapped_memory_.map_whole_file();
+    file_header_ = reinterpret_cast<FileHeader *>(mapped_memory_.begin);
+    auto dst = mapped_memory_.begin + sizeof(FileHeader);
+    auto sections = std::span{file_header_->sections}.first(
+        file_header_->meta.section_count);
+    for (auto &section : sections) {
+      auto misalignment = reinterpret_cast<uintptr_t>(dst) % section.align;
+      if (misalignment != 0) {
+        dst += section.align - misalignment;
+      }
+      auto src = mapped_memory_.begin + section.offset;
+      if (src != dst) {
+        std::memmove(dst, src, section.size);
+      }
+      section.offset = dst - mapped_memory_.begin;
+      dst += section.size;
+    }
+    mapped_memory_.truncate(dst - mapped_memory_.begin);
+  }
+
+  // Returns the number of bytes to reserve for section T, see
+  // SectionCapacities.
+  template <typename T>
+  static size_t capacity(SectionCapacities const &capacities) {
+    size_t size = capacities[T::tag] != 0 ? capacities[T::tag]
+                                          : T::allocation_size;
+    if constexpr (requires { T::max_allocation_size; }) {
+      size = std::min(size, size_t{T::max_allocation_size});
+    }
+    size_t granularity = T::align_of;
+    if constexpr (requires { T::granularity; }) {
+      granularity = std::lcm(granularity, size_t{T::granularity});
+    }
+    return size - size % granularity;
+  }
+
   // Splits the larger pool of mmap:ed memory into smaller sections
   // and returns a span for each section type T
   template <typename T> std::span<uint8_t> do_allocation() {
     constexpr auto idx = util::TypeIndex<T, std::tuple<Sections...>>::index;
     constexpr auto align = T::align_of;
-    auto begin = alloc_ptr_ + (reinterpret_cast<uintptr_t>(alloc_ptr_) % align);
-    auto end = alloc_ptr_ = begin + T::allocation_size;
+    auto misalignment = reinterpret_cast<uintptr_t>(alloc_ptr_) % align;
+    auto begin = alloc_ptr_ + (misalignment != 0 ? align - misalignment : 0);
+    auto end = alloc_ptr_ = begin + capacities_[idx];
     file_header_->sections[idx].offset = begin - mapped_memory_.begin;
+    file_header_->sections[idx].capacity = capacities_[idx];
     return {begin, end};
   }
 
-  // Computes the required allocation size based on the requested allocation and
+  // Computes the required allocation size based on the capacities and
   // alignment requirements of the sections. The resulting layout might not be
   // optimally compact.
-  constexpr size_t required_allocation_size() const {
+  size_t required_allocation_size() const {
     // NOTE(hbrodin): This implementation assumes no alignment compensation is
     // needed for the FileHeader. It is placed first in the mmap-ed region. It
     // is assumed that mmap returns page aligned memory.
     constexpr auto header_size = sizeof(FileHeader);
-    constexpr auto sections_accumulated = (Sections::allocation_size + ...);
+    auto sections_accumulated =
+        std::accumulate(capacities_.begin(), capacities_.end(), size_t{0});
     constexpr auto alignment_accumulated =
         (Sections::align_of + ...) -
         sizeof...(Sections); // each section might require align_of -1 bytes to
@@ -164,10 +323,16 @@ private:
     return header_size + sections_accumulated + alignment_accumulated;
   }
 
+  bool compact_;
+  // Number of bytes reserved for each section, in file order
+  std::array<size_t, sizeof...(Sections)> capacities_;
   MMapFile mapped_memory_;
   FileHeader *file_header_;
   uint8_t *alloc_ptr_;
   std::tuple<Sections...> sections_;
+  // Extents of sections, in file order
+  std::vector<Extent> extents_;
+  std::mutex extents_m_;
 };
 
 } // namespace taintdag
@@ -8,6 +8,7 @@
 
 #pragma once
 
+#include <chrono>
 #include <filesystem>
 #include <span>
 
@@ -16,6 +17,8 @@
 #include "taintdag/fnmapping.h"
 #include "taintdag/fntrace.h"
 #include "taintdag/labels.h"
+#include "taintdag/outputfile.h"
+#include "taintdag/runtime_stats.h"
 #include "taintdag/sink.h"
 #include "taintdag/stream_offset.h"
 #include "taintdag/string_table.h"
@@ -29,7 +32,15 @@ namespace taintdag {
 class PolyTracker {
 
 public:
-  PolyTracker(std::filesystem::path const &outputfile = "polytracker.tdag");
+  // If `compact_output` is set, the sections of the output file are tightly
+  // packed and the file truncated to its used size on destruction.
+  // `capacities` overrides the number of bytes reserved for sections.
+  PolyTracker(std::filesystem::path const &outputfile = "polytracker.tdag",
+              bool compact_output = false,
+              SectionCapacities const &capacities = {});
+
+  // Records the RuntimeStats of the run before the output file is closed
+  ~PolyTracker();
 
   label_t union_labels(label_t l1, label_t l2);
 
@@ -94,10 +105,15 @@ private:
   // template. It determines the current layout of TDAG file in terms of which
   // sections and in which order they appear.
   using ConcreteOutputFile =
-      OutputFile<Sources, Labels, StringTable, TaintSink,
-                 SourceLabelIndexSection, Functions, Events, ControlFlowLog>;
+      OutputFile<Sources, Labels, StringTable, TaintSinkRuns,
+                 SourceLabelIndexSection, Functions, Events, ControlFlowLog,
+                 RuntimeStats>;
   ConcreteOutputFile output_file_;
 
+  // Start of the run, for the RuntimeStats
+  std::chrono::system_clock::time_point start_time_;
+  std::chrono::steady_clock::time_point start_;
+
   // Tracking source offsets for streams (where offsets can be determined by
   // ftell) per source/sink index.
   static constexpr size_t offset_capacity = size_t{max_source_index} + 1;
@@ -0,0 +1,120 @@
+/*
+ * Copyright (c) 2022-present, Trail of Bits, Inc.
+ * All rights reserved.
+ *
+ * This source code is licensed in accordance with the terms specified in
+ * the LICENSE file found in the root directory of this source tree.
+ */
+
+#pragma once
+
+#include <algorithm>
+#include <atomic>
+#include <cstdint>
+#include <span>
+
+#include "taintdag/error.h"
+#include "taintdag/outputfile.h"
+#include "taintdag/section.h"
+
+namespace taintdag {
+
+// Counters of the outcomes of Labels::union_taint. Every requested union is
+// counted once as requested, and once by its outcome.
+struct UnionCounters {
+  // Calls to union_taint
+  std::atomic<uint64_t> requested{0};
+  // Unions of a label with itself
+  std::atomic<uint64_t> identical{0};
+  // Unions where union_::compute returned one of the operands
+  std::atomic<uint64_t> short_circuited{0};
+  // Unions where duplicate_check found an identical, recently created label
+  std::atomic<uint64_t> deduplicated{0};
+  // Unions that created a new label
+  std::atomic<uint64_t> created{0};
+};
+
+// Counters are only ever summed, so no ordering is needed
+inline void increment(std::atomic<uint64_t> &counter) {
+  counter.fetch_add(1, std::memory_order_relaxed);
+}
+
+// Statistics of a run, corresponds to TDRuntimeStats in taint_dag.py
+struct RuntimeStatsHeader {
+  // Start of the run, in nanoseconds since the Unix epoch
+  uint64_t start_time_ns{0};
+  // Wall clock duration of the run, in nanoseconds
+  uint64_t duration_ns{0};
+
+  uint64_t unions_requested{0};
+  uint64_t unions_identical{0};
+  uint64_t unions_short_circuited{0};
+  uint64_t unions_deduplicated{0};
+  uint64_t unions_created{0};
+
+  // Number of SectionUsage entries following the header
+  uint64_t section_count{0};
+};
+
+// How much of its reserved memory a section used, corresponds to
+// TDSectionUsage in taint_dag.py
+struct SectionUsage {
+  uint32_t tag{0};
+  uint32_t reserved{0};
+  // Bytes used by the section
+  uint64_t used{0};
+  // Bytes reserved for the section
+  uint64_t capacity{0};
+};
+
+// Records statistics of a run, written once when the run ends: a
+// RuntimeStatsHeader followed by the SectionUsage of every section.
+class RuntimeStats : public SectionBase {
+public:
+  static constexpr uint8_t tag{10};
+  static constexpr size_t max_sections{32};
+  static constexpr size_t align_of{alignof(RuntimeStatsHeader)};
+  static constexpr size_t allocation_size{
+      sizeof(RuntimeStatsHeader) + max_sections * sizeof(SectionUsage)};
+
+  template <typename OF>
+  RuntimeStats(SectionArg<OF> of) : SectionBase(of.range) {}
+
+  void record(RuntimeStatsHeader header,
+              std::span<SectionUsage const> sections) {
+    auto count = std::min(sections.size(), max_sections);
+    header.section_count = count;
+    auto total = sizeof(RuntimeStatsHeader) + count * sizeof(SectionUsage);
+    if (auto wctx = write(total)) {
+      auto dst = wctx->mem.begin();
+      std::copy_n(reinterpret_cast<uint8_t const *>(&header),
+                  sizeof(RuntimeStatsHeader), dst);
+      std::copy_n(reinterpret_cast<uint8_t const *>(sections.data()),
+                  count * sizeof(SectionUsage),
+                  dst + sizeof(RuntimeStatsHeader));
+    } else {
+      error_exit("Failed to write runtime statistics, they were already "
+                 "recorded.");
+    }
+  }
+
+  // Returns the recorded header, or nullptr if no statistics were recorded
+  RuntimeStatsHeader const *header() const {
+    if (size() < sizeof(RuntimeStatsHeader)) {
+      return nullptr;
+    }
+    return reinterpret_cast<RuntimeStatsHeader const *>(&*mem_.begin());
+  }
+
+  // Returns the recorded usage of each section
+  std::span<SectionUsage const> sections() const {
+    auto hdr = header();
+    if (hdr == nullptr) {
+      return {};
+    }
+    return {reinterpret_cast<SectionUsage const *>(hdr + 1),
+            static_cast<size_t>(hdr->section_count)};
+  }
+};
+
+} // namespace taintdag
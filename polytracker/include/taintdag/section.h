@@ -105,6 +105,8 @@ private:
 // Convenience base for allocation of fixed size entries
 template <typename T> struct FixedSizeAlloc : SectionBase {
   static constexpr size_t align_of = alignof(T);
+  // The allocation must hold a whole number of entries
+  static constexpr size_t granularity = sizeof(T);
 
   FixedSizeAlloc(SectionBase::span_t rng) : SectionBase{rng} {
     if (reinterpret_cast<uintptr_t>(&*rng.begin()) % align_of != 0)
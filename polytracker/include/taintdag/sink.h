@@ -8,6 +8,14 @@
 
 #pragma once
 
+#include <algorithm>
+#include <functional>
+#include <limits>
+#include <mutex>
+#include <vector>
+
+#include "taintdag/error.h"
+#include "taintdag/outputfile.h"
 #include "taintdag/section.h"
 #include "taintdag/taint.h"
 
@@ -22,6 +30,67 @@ struct SinkLogEntry {
   sink_index_t sink;
 };
 
+// Grows a sink section that exhausted its reserved memory.
+//
+// Entries that don't fit are written to extents mapped at the end of the
+// output file, see OutputFile::add_extent. Each extent is as large as all
+// memory reserved for the section before it, so the capacity doubles with
+// every extent.
+template <typename Entry> class SinkExtents {
+public:
+  using extent_t = FixedSizeAlloc<Entry>;
+  // Adds an extent of the given number of bytes, nullptr if the file can't
+  // grow any further
+  using add_extent_t = std::function<extent_t *(size_t)>;
+
+  // Extents are at least this large
+  static constexpr size_t min_extent_size{0x1000 * sizeof(Entry)};
+
+  SinkExtents(add_extent_t add_extent, size_t reserved)
+      : add_extent_{std::move(add_extent)}, reserved_{reserved} {}
+
+  // Constructs an Entry in the last extent, adding an extent if needed.
+  // Returns false if the section can't grow any further.
+  template <typename... Args> bool construct(Args &&...args) {
+    std::unique_lock<std::mutex> l{m_};
+    while (extents_.empty() || !extents_.back()->construct(args...)) {
+      auto size = std::max(reserved_, min_extent_size);
+      auto extent = add_extent_(size);
+      if (extent == nullptr) {
+        return false;
+      }
+      extents_.push_back(extent);
+      reserved_ += size;
+    }
+    return true;
+  }
+
+  // Invokes f(entry) for each entry in the extents, in order
+  template <typename F> void for_each(F &&f) const {
+    std::unique_lock<std::mutex> l{m_};
+    for (auto extent : extents_) {
+      std::for_each(extent->begin(), extent->end(), f);
+    }
+  }
+
+  // Returns the number of entries in the extents
+  size_t count() const {
+    std::unique_lock<std::mutex> l{m_};
+    size_t n = 0;
+    for (auto extent : extents_) {
+      n += extent->count();
+    }
+    return n;
+  }
+
+private:
+  add_extent_t add_extent_;
+  // Bytes reserved for the section, including extents
+  size_t reserved_;
+  std::vector<extent_t *> extents_;
+  mutable std::mutex m_;
+};
+
 template <size_t Tag = 4, size_t AllocationCount = 0x100000>
 struct TaintSinkBase : public FixedSizeAlloc<SinkLogEntry> {
 
@@ -29,14 +98,151 @@ struct TaintSinkBase : public FixedSizeAlloc<SinkLogEntry> {
   static constexpr size_t allocation_size{AllocationCount *
                                           sizeof(SinkLogEntry)};
 
+  using extent_t = SinkExtents<SinkLogEntry>::extent_t;
+
   template <typename OF>
-  TaintSinkBase(SectionArg<OF> of) : FixedSizeAlloc{of.range} {}
+  TaintSinkBase(SectionArg<OF> of)
+      : FixedSizeAlloc{of.range},
+        extents{[&file = of.output_file](size_t size) {
+                  return file.template add_extent<TaintSinkBase>(size);
+                },
+                of.range.size()} {}
 
   void log_single(sink_offset_t offset, label_t label, sink_index_t idx) {
-    construct(offset, label, idx);
+    if (!construct(offset, label, idx) &&
+        !extents.construct(offset, label, idx)) {
+      error_exit("Failed to log sink byte at offset ", offset);
+    }
   }
+
+  // Entries logged after the reserved memory was exhausted
+  SinkExtents<SinkLogEntry> extents;
 };
 
 using TaintSink = TaintSinkBase<>;
 
+// A run of consecutive sink bytes. Byte i of the run was written to
+// `offset + i` and carries the label `first_label + i * stride`. A stride of
+// zero means all bytes in the run share the same label.
+struct SinkRunEntry {
+  sink_offset_t offset;
+  uint32_t length;
+  label_t first_label;
+  int32_t stride;
+  sink_index_t sink;
+};
+
+template <size_t Tag = 9, size_t AllocationCount = 0x100000>
+struct TaintSinkRunsBase : public FixedSizeAlloc<SinkRunEntry> {
+
+  static constexpr uint8_t tag{Tag};
+  static constexpr size_t allocation_size{AllocationCount *
+                                          sizeof(SinkRunEntry)};
+
+  using extent_t = SinkExtents<SinkRunEntry>::extent_t;
+
+  template <typename OF>
+  TaintSinkRunsBase(SectionArg<OF> of)
+      : FixedSizeAlloc{of.range},
+        extents{[&file = of.output_file](size_t size) {
+                  return file.template add_extent<TaintSinkRunsBase>(size);
+                },
+                of.range.size()} {}
+
+  void log_run(sink_offset_t offset, uint32_t length, label_t first_label,
+               int32_t stride, sink_index_t idx) {
+    if (!construct(offset, length, first_label, stride, idx) &&
+        !extents.construct(offset, length, first_label, stride, idx)) {
+      error_exit("Failed to log sink run of ", length, " bytes at offset ",
+                 offset);
+    }
+  }
+
+  // Runs logged after the reserved memory was exhausted
+  SinkExtents<SinkRunEntry> extents;
+};
+
+using TaintSinkRuns = TaintSinkRunsBase<>;
+
+// Accumulates the labels of consecutively written sink bytes into runs.
+//
+// Bytes are added in increasing offset order. A run is extended as long as the
+// offset is adjacent to the previous byte and the label differs from the
+// previous label by the run's stride. Untainted bytes (label zero) are not
+// logged and terminate the current run. Any pending run is logged on flush or
+// destruction.
+template <typename Sink> class SinkRunEncoder {
+public:
+  SinkRunEncoder(Sink &sink, sink_index_t idx) : sink_{sink}, idx_{idx} {}
+
+  SinkRunEncoder(SinkRunEncoder const &) = delete;
+  SinkRunEncoder &operator=(SinkRunEncoder const &) = delete;
+
+  ~SinkRunEncoder() { flush(); }
+
+  void add(sink_offset_t offset, label_t label) {
+    if (label == 0) {
+      flush();
+      return;
+    }
+
+    if (length_ > 0 && offset == offset_ + length_ &&
+        length_ < std::numeric_limits<uint32_t>::max()) {
+      auto delta = static_cast<int64_t>(label) - static_cast<int64_t>(last_);
+      if (length_ == 1) {
+        // The second byte of a run determines its stride
+        stride_ = static_cast<int32_t>(delta);
+        last_ = label;
+        ++length_;
+        return;
+      }
+      if (delta == stride_) {
+        last_ = label;
+        ++length_;
+        return;
+      }
+    }
+
+    flush();
+    offset_ = offset;
+    first_ = last_ = label;
+    stride_ = 0;
+    length_ = 1;
+  }
+
+  // Add `length` bytes, starting at `offset`, that all share `label`
+  void add_repeated(sink_offset_t offset, label_t label, size_t length) {
+    if (label == 0) {
+      flush();
+      return;
+    }
+    flush();
+    while (length > 0) {
+      auto n = static_cast<uint32_t>(std::min<size_t>(
+          length, std::numeric_limits<uint32_t>::max()));
+      sink_.log_run(offset, n, label, 0, idx_);
+      offset += n;
+      length -= n;
+    }
+  }
+
+  void flush() {
+    if (length_ > 0) {
+      sink_.log_run(offset_, length_, first_, stride_, idx_);
+      length_ = 0;
+    }
+  }
+
+private:
+  Sink &sink_;
+  sink_index_t idx_;
+
+  // The run currently being accumulated, valid if length_ > 0
+  sink_offset_t offset_{0};
+  uint32_t length_{0};
+  label_t first_{0};
+  label_t last_{0};
+  int32_t stride_{0};
+};
+
 } // namespace taintdag
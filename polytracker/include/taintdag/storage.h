@@ -10,6 +10,9 @@
 
 #include <cstddef>
 #include <filesystem>
+#include <span>
+#include <utility>
+#include <vector>
 
 #include <fcntl.h>
 #include <sys/mman.h>
@@ -56,13 +59,16 @@ struct FixedSizeFile {
 };
 
 /// Represents a Memory Mapped File RAII style.
+///
+/// The file is mapped as a single range [begin, end). It can be grown by
+/// extents that are mapped separately, see `extend`.
 struct MMapFile {
   FixedSizeFile file_;
   std::uint8_t *begin{nullptr};
   std::uint8_t *end{nullptr};
 
   MMapFile(std::filesystem::path f, std::size_t wanted_size)
-      : file_{std::move(f), wanted_size} {
+      : file_{std::move(f), wanted_size}, file_size_{wanted_size} {
     auto ret = mmap(nullptr, wanted_size, PROT_READ | PROT_WRITE, MAP_SHARED,
                     file_.fd, 0);
     if (ret == MAP_FAILED) {
@@ -72,7 +78,61 @@ struct MMapFile {
     end = begin + wanted_size;
   }
 
-  ~MMapFile() {
+  // Grows the file by an extent of `size` bytes, starting at the next page
+  // boundary, and maps it. Returns the file offset of the extent and its
+  // memory, which remains mapped until the MMapFile is destroyed.
+  std::pair<std::size_t, std::span<std::uint8_t>> extend(std::size_t size) {
+    auto page_size = static_cast<std::size_t>(sysconf(_SC_PAGESIZE));
+    auto offset = (file_size_ + page_size - 1) / page_size * page_size;
+    if (ftruncate(file_.fd, offset + size) == -1) {
+      error_exit("Failed to grow output file to ", offset + size, " bytes.");
+    }
+    auto ret = mmap(nullptr, size, PROT_READ | PROT_WRITE, MAP_SHARED,
+                    file_.fd, offset);
+    if (ret == MAP_FAILED) {
+      error_exit("Failed to mmap extent of output file");
+    }
+    file_size_ = offset + size;
+    extents_.emplace_back(reinterpret_cast<std::uint8_t *>(ret), size);
+    return {offset, extents_.back()};
+  }
+
+  // Maps the whole file, including any extents, as the single range
+  // [begin, end). Memory previously returned by `extend`, and any pointers into
+  // the previous range, must not be accessed afterwards.
+  void map_whole_file() {
+    if (extents_.empty()) {
+      return;
+    }
+    unmap();
+    auto ret = mmap(nullptr, file_size_, PROT_READ | PROT_WRITE, MAP_SHARED,
+                    file_.fd, 0);
+    if (ret == MAP_FAILED) {
+      error_exit("Failed to mmap output file");
+    }
+    begin = reinterpret_cast<std::uint8_t *>(ret);
+    end = begin + file_size_;
+  }
+
+  // Truncates the backing file to `size` bytes. The mapping itself is left
+  // intact, but memory beyond `size` must not be accessed afterwards.
+  void truncate(std::size_t size) {
+    if (ftruncate(file_.fd, size) == -1) {
+      error_exit("Failed to truncate output file to ", size, " bytes.");
+    }
+    file_size_ = size;
+  }
+
+  ~MMapFile() { unmap(); }
+
+private:
+  void unmap() {
+    for (auto extent : extents_) {
+      if (munmap(extent.data(), extent.size()) == -1) {
+        error_exit("Failed to unmap output file extent");
+      }
+    }
+    extents_.clear();
     if (begin) {
       auto ret = munmap(begin, end - begin);
       if (ret == -1) {
@@ -82,6 +142,11 @@ struct MMapFile {
       end = nullptr;
     }
   }
+
+  // Current size of the backing file
+  std::size_t file_size_;
+  // Memory mapped by `extend`
+  std::vector<std::span<std::uint8_t>> extents_;
 };
 
 } // namespace taintdag
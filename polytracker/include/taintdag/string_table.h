@@ -37,6 +37,7 @@ struct StringTableBase : public SectionBase {
 
   static constexpr uint8_t tag{Tag};
   static constexpr size_t allocation_size{AllocationSize};
+  static constexpr size_t max_allocation_size{max_offset};
   static constexpr size_t align_of = alignof(length_t);
 
   template <typename OF>
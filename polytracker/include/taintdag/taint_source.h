@@ -58,6 +58,7 @@ struct Sources : public FixedSizeAlloc<SourceEntry> {
   static constexpr uint8_t tag{1};
   static constexpr size_t allocation_size{std::numeric_limits<index_t>::max() *
                                           sizeof(SourceEntry)};
+  static constexpr size_t max_allocation_size{allocation_size};
 
   template <typename OF>
   Sources(SectionArg<OF> of)
@@ -2,14 +2,39 @@
 This module maps input byte offsets to output byte offsets
 """
 
+import json
 from collections import defaultdict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Iterator, List, Optional, Set, Tuple
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+import numpy as np
 from tqdm import tqdm
 
 from .plugins import Command
-from .taint_dag import TDFile, TDNode, TDRangeNode, TDSourceNode, TDUnionNode
-
+from .profiling import count, METRICS, phase
+from .taint_dag import (
+    TDControlFlowLogSection,
+    TDFile,
+    TDLabelResolver,
+    TDNode,
+    TDRangeNode,
+    TDSourceNode,
+    TDUnionNode,
+)
+
+if TYPE_CHECKING:
+    from .cfg import FunctionInfo
 
 LabelType = int
 OffsetType = int
@@ -17,6 +42,21 @@ FileOffsetType = Tuple[Path, OffsetType]
 CavityType = Tuple[OffsetType, OffsetType]
 
 
+@contextmanager
+def analysis_phase(tdfile: TDFile, name: str) -> Iterator[None]:
+    """Times a phase of an analysis of `tdfile`, counting the labels it decoded and resolved"""
+    if not METRICS.enabled:
+        yield
+        return
+    resolver = tdfile.resolver
+    decoded, hits, misses = len(tdfile.raw_nodes), resolver.hits, resolver.misses
+    with phase(name):
+        yield
+    count("tdag.labels_decoded", len(tdfile.raw_nodes) - decoded)
+    count("resolver.cache_hits", resolver.hits - hits)
+    count("resolver.cache_misses", resolver.misses - misses)
+
+
 class InputOutputMapping:
     def __init__(self, f: TDFile):
         self.tdfile: TDFile = f
@@ -50,14 +90,31 @@ class InputOutputMapping:
             elif isinstance(n, TDRangeNode):
                 stack.extend(range(n.first, n.last + 1))
 
+    def source_offsets(self, label: LabelType) -> Iterator[FileOffsetType]:
+        """Yields the source bytes `label` was derived from"""
+        for idx, begin, end in self.tdfile.resolver.resolve(label):
+            path = self.tdfile.fd_headers[idx][0]
+            for offset in range(begin, end):
+                yield (path, offset)
+
     def mapping(self) -> Dict[FileOffsetType, Set[FileOffsetType]]:
         result: Dict[FileOffsetType, Set[FileOffsetType]] = defaultdict(set)
-        for s in tqdm(list(self.tdfile.sinks)):
-            for _, n in self.dfs_walk(s.label):
-                if isinstance(n, TDSourceNode):
-                    sp = self.tdfile.fd_headers[s.fdidx][0]
-                    np = self.tdfile.fd_headers[n.idx][0]
-                    result[(np, n.offset)].add((sp, s.offset))
+        with analysis_phase(self.tdfile, "mapping.read_sinks"):
+            runs = list(self.tdfile.sink_runs)
+        count("mapping.sink_runs", len(runs))
+        with analysis_phase(self.tdfile, "mapping.resolve_sinks"):
+            for run in tqdm(runs):
+                sp = self.tdfile.fd_headers[run.fdidx][0]
+                if run.stride == 0:
+                    # Every byte of the run shares the same label, so its sources
+                    # are resolved once and mapped to the whole output range.
+                    outputs = [(sp, offset) for offset in run.offsets()]
+                    for source in self.source_offsets(run.first_label):
+                        result[source].update(outputs)
+                else:
+                    for s in run:
+                        for source in self.source_offsets(s.label):
+                            result[source].add((sp, s.offset))
 
         return result
 
@@ -87,68 +144,84 @@ class InputOutputMapping:
         # iterating over sinks as any taint node that affects control flow will
         # already have all of its source taints affecting control flow, and thus
         # be in the marker array already.
-        with tqdm(desc="indexing taint sources", unit="labels", leave=False) as t:
-            for source_label in self.tdfile.input_labels():
-                t.update(1)
-                source_node = self.tdfile.decode_node(source_label)
-                assert isinstance(source_node, TDSourceNode)
-                source_index = source_node.idx
-                source_offset = source_node.offset
-
-                if source_index not in markers:
-                    # Attempt to get the size of the file, to prevent reallocation of the markers array.
-                    # Use whatever size is greater (size hint will be zero for failures) to allocate the
-                    # array.
-                    fdheader = self.tdfile.fd_headers[source_index][1]
-                    size = (
-                        source_offset + 1 if fdheader.invalid_size() else fdheader.size
-                    )
-                    markers[source_index] = bytearray(size)
-
-                marker = markers[source_index]
-                if source_offset >= len(marker):
-                    marker = marker.ljust(source_offset + 1, b"\0")
-                    markers[source_index] = marker
-
-                if source_node.affects_control_flow:
-                    marker[source_offset] = 1
+        input_labels = 0
+        with analysis_phase(self.tdfile, "cavities.index_sources"):
+            with tqdm(desc="indexing taint sources", unit="labels", leave=False) as t:
+                for source_label in self.tdfile.input_labels():
+                    t.update(1)
+                    input_labels += 1
+                    source_node = self.tdfile.decode_node(source_label)
+                    assert isinstance(source_node, TDSourceNode)
+                    source_index = source_node.idx
+                    source_offset = source_node.offset
+
+                    if source_index not in markers:
+                        # Attempt to get the size of the file, to prevent reallocation of the markers array.
+                        # Use whatever size is greater (size hint will be zero for failures) to allocate the
+                        # array.
+                        fdheader = self.tdfile.fd_headers[source_index][1]
+                        size = (
+                            source_offset + 1
+                            if fdheader.invalid_size()
+                            else fdheader.size
+                        )
+                        markers[source_index] = bytearray(size)
+
+                    marker = markers[source_index]
+                    if source_offset >= len(marker):
+                        marker = marker.ljust(source_offset + 1, b"\0")
+                        markers[source_index] = marker
+
+                    if source_node.affects_control_flow:
+                        marker[source_offset] = 1
+        count("cavities.input_labels", input_labels)
 
         # Now, iterate all taint labels written to outputs (sinks). Walk them backwards to reach
         # source nodes and mark any source offset contributing to outputs. If a node affects
         # control flow, it can be disregarded as that would already have spilled into the source
         # node (see above).
-        for s in tqdm(list(self.tdfile.sinks)):
-            sn = self.tdfile.decode_node(s.label)
-            if sn.affects_control_flow:
-                continue
-
-            # If it is a source node add it (unless it affects control flow as it was already
-            # set by the initial sweep).
-            if isinstance(sn, TDSourceNode) and not sn.affects_control_flow:
-                markers[sn.idx][sn.offset] = 1
-            else:
-                for lbl, n in self.dfs_walk(s.label, seen):
-                    if isinstance(n, TDSourceNode):
-                        markers[n.idx][n.offset] = 1
-                    elif n.affects_control_flow:
-                        if isinstance(n, TDUnionNode):
-                            seen.add(n.left)
-                            seen.add(n.right)
-                        elif isinstance(n, TDRangeNode):
-                            seen.update(range(n.first, n.last + 1))
+        # Only the distinct labels of each sink run need to be visited, the output
+        # offsets they were written to do not matter for cavity detection.
+        with analysis_phase(self.tdfile, "cavities.walk_sinks"):
+            for run in tqdm(list(self.tdfile.sink_runs)):
+                for label in run.labels():
+                    if label in seen:
+                        continue
+
+                    sn = self.tdfile.decode_node(label)
+                    if sn.affects_control_flow:
+                        continue
+
+                    # If it is a source node add it (unless it affects control flow as it was already
+                    # set by the initial sweep).
+                    if isinstance(sn, TDSourceNode) and not sn.affects_control_flow:
+                        markers[sn.idx][sn.offset] = 1
+                    else:
+                        for lbl, n in self.dfs_walk(label, seen):
+                            if isinstance(n, TDSourceNode):
+                                markers[n.idx][n.offset] = 1
+                            elif n.affects_control_flow:
+                                if isinstance(n, TDUnionNode):
+                                    seen.add(n.left)
+                                    seen.add(n.right)
+                                elif isinstance(n, TDRangeNode):
+                                    seen.update(range(n.first, n.last + 1))
+        count("cavities.sink_labels_visited", len(seen))
 
         # Flatten all files by name in case files are opened multiple times
         merged: Dict[Path, bytes] = {}
 
-        for k, v in markers.items():
-            fname = self.tdfile.fd_headers[k][0]
-            if fname in merged:
-                merged[fname] = bytes(a | b for (a, b) in zip(merged[fname], v))
-            else:
-                merged[fname] = bytes(v)
+        with phase("cavities.merge_markers"):
+            for k, v in markers.items():
+                fname = self.tdfile.fd_headers[k][0]
+                if fname in merged:
+                    merged[fname] = bytes(a | b for (a, b) in zip(merged[fname], v))
+                else:
+                    merged[fname] = bytes(v)
 
         # Convert the source index to the source path and marker bit arrays to ranges
-        return {k: self.marker_to_ranges(v) for (k, v) in merged.items()}
+        with phase("cavities.find_ranges"):
+            return {k: self.marker_to_ranges(v) for (k, v) in merged.items()}
 
 
 class MapInputsToOutputs(Command):
@@ -160,7 +233,152 @@ class MapInputsToOutputs(Command):
 
     def run(self, args):
         with open(args.POLYTRACKER_TF, "rb") as f:
-            print(InputOutputMapping(TDFile(f)).mapping())
+            mapping = InputOutputMapping(TDFile(f)).mapping()
+            with phase("mapping.output"):
+                print(mapping)
+
+
+class FunctionAttribution:
+    """Attributes the input bytes that affected control flow to functions and callstacks
+
+    A single pass over the control flow log collects the distinct labels of the
+    tainted control flow in every function and callstack. Each distinct label is
+    then resolved to source byte intervals using the `TDLabelResolver` of the
+    file.
+    The bytes of a function or callstack are stored per source path as an
+    (n, 2) array of sorted, disjoint [begin, end) intervals.
+    """
+
+    def __init__(self, f: TDFile, function_names: Optional[Sequence[str]] = None):
+        self.tdfile: TDFile = f
+        self.function_names: Optional[Sequence[str]] = function_names
+        self.resolver: TDLabelResolver = f.resolver
+        self.function_labels: Dict[int, Set[LabelType]] = defaultdict(set)
+        self.callstack_labels: Dict[Tuple[int, ...], Set[LabelType]] = defaultdict(set)
+        self.callers: Dict[int, Set[int]] = defaultdict(set)
+
+        cflog = f._get_section(TDControlFlowLogSection)
+        assert isinstance(cflog, TDControlFlowLogSection)
+        with phase("functions.read_control_flow_log"):
+            self._read_control_flow_log(cflog)
+
+    def _read_control_flow_log(self, cflog: TDControlFlowLogSection):
+        callstack: List[int] = []
+        key: Optional[Tuple[int, ...]] = ()
+        for event, function_id, label in tqdm(
+            cflog.records(), desc="reading control flow log", unit=" events"
+        ):
+            if event == TDControlFlowLogSection.ENTER_FUNCTION:
+                if callstack:
+                    self.callers[function_id].add(callstack[-1])
+                callstack.append(function_id)
+                key = None
+                continue
+            if function_id in callstack:
+                # Align the callstack in case leave events are missing
+                while callstack[-1] != function_id:
+                    callstack.pop()
+                    key = None
+            if event == TDControlFlowLogSection.LEAVE_FUNCTION:
+                if callstack and callstack[-1] == function_id:
+                    callstack.pop()
+                    key = None
+            else:
+                if key is None:
+                    key = tuple(callstack)
+                self.function_labels[function_id].add(label)
+                self.callstack_labels[key].add(label)
+
+    def function_name(self, function_id: int) -> str:
+        if self.function_names is not None and function_id < len(self.function_names):
+            return self.function_names[function_id]
+        return f"function_{function_id}"
+
+    def intervals(self, labels: Iterable[LabelType]) -> Dict[Path, np.ndarray]:
+        """Returns the source byte intervals of `labels`, per source path"""
+        by_path: Dict[Path, List[Tuple[int, int]]] = defaultdict(list)
+        with analysis_phase(self.tdfile, "functions.resolve"):
+            resolved = self.resolver.resolve_all(labels)
+        for idx, begin, end in resolved:
+            by_path[self.tdfile.fd_headers[idx][0]].append((begin, end))
+        result: Dict[Path, np.ndarray] = {}
+        for path, intervals in by_path.items():
+            # Sources opened more than once share a path, so merge their intervals
+            merged: List[List[int]] = []
+            for begin, end in sorted(intervals):
+                if merged and begin <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([begin, end])
+            result[path] = np.array(merged, dtype=np.int64).reshape(-1, 2)
+        return result
+
+    def functions(self) -> Dict[str, Dict[Path, np.ndarray]]:
+        return {
+            self.function_name(function_id): self.intervals(labels)
+            for function_id, labels in self.function_labels.items()
+        }
+
+    def callstacks(self) -> Dict[Tuple[str, ...], Dict[Path, np.ndarray]]:
+        return {
+            tuple(map(self.function_name, callstack)): self.intervals(labels)
+            for callstack, labels in self.callstack_labels.items()
+        }
+
+    def function_infos(self) -> List["FunctionInfo"]:
+        # cfg depends on networkx and graphviz, which are slow to import
+        from .cfg import FunctionInfo
+
+        return [
+            FunctionInfo(
+                self.function_name(function_id),
+                called_from=map(self.function_name, self.callers[function_id]),
+                cmp_intervals={
+                    str(path): intervals
+                    for path, intervals in self.intervals(labels).items()
+                },
+            )
+            for function_id, labels in self.function_labels.items()
+        ]
+
+
+class MapFunctionsToInputs(Command):
+    name = "functions"
+    help = "attribute the input bytes that affected control flow to functions"
+
+    def __init_arguments__(self, parser):
+        parser.add_argument("POLYTRACKER_TF", type=str, help="the trace file")
+        parser.add_argument(
+            "--function-ids",
+            "-f",
+            type=str,
+            help="the functionid.json written by the instrumentation, to name functions",
+        )
+        parser.add_argument(
+            "--callstacks",
+            "-c",
+            action="store_true",
+            help="attribute bytes to callstacks rather than functions",
+        )
+
+    def run(self, args):
+        names = None
+        if args.function_ids is not None:
+            with open(args.function_ids) as f:
+                names = json.load(f)
+        with open(args.POLYTRACKER_TF, "rb") as f:
+            attribution = FunctionAttribution(TDFile(f), names)
+            if args.callstacks:
+                results = {
+                    ">".join(callstack): intervals
+                    for callstack, intervals in attribution.callstacks().items()
+                }
+            else:
+                results = attribution.functions()
+            for name, intervals_by_path in results.items():
+                for path, intervals in intervals_by_path.items():
+                    for begin, end in intervals.tolist():
+                        print(f"{name},{path},{begin},{end}")
 
 
 def ascii(b: bytes) -> str:
@@ -208,18 +426,20 @@ class FileCavities(Command):
             cavities = InputOutputMapping(TDFile(f)).file_cavities()
 
             if not args.print_bytes:
-                for path, cs in cavities.items():
-                    for cavity in cs:
-                        print_cavity(path, *cavity)
+                with phase("cavities.output"):
+                    for path, cs in cavities.items():
+                        for cavity in cs:
+                            print_cavity(path, *cavity)
                 return
 
-            for path, cs in cavities.items():
-                with open(path, "rb") as f:
-                    contents = f.read()
-                    for begin, end in cs:
-                        print_cavity(path, begin, end)
-                        before = ascii(contents[max(begin - 10, 0) : begin])
-                        after = ascii(contents[end : end + 10])
-                        inside = ascii(contents[begin:end])
-                        print(f'\t"{before}{inside}{after}"')
-                        print(f"\t {' ' * len(before)}{'^' * len(inside)}")
+            with phase("cavities.output"):
+                for path, cs in cavities.items():
+                    with open(path, "rb") as f:
+                        contents = f.read()
+                        for begin, end in cs:
+                            print_cavity(path, begin, end)
+                            before = ascii(contents[max(begin - 10, 0) : begin])
+                            after = ascii(contents[end : end + 10])
+                            inside = ascii(contents[begin:end])
+                            print(f'\t"{before}{inside}{after}"')
+                            print(f"\t {' ' * len(before)}{'^' * len(inside)}")
@@ -1,11 +1,13 @@
 from abc import ABC, abstractmethod
 from logging import getLogger
 from typing import (
+    Dict,
     Generic,
     Iterable,
     Iterator,
     List,
     Optional,
+    Set,
     Tuple,
     Type,
     TypeVar,
@@ -244,6 +246,68 @@ class Terminal:
         return f'{ret}"'
 
 
+class TerminalTrie:
+    """A trie over the byte strings of a set of terminals
+
+    Finds every terminal that occurs at a given offset of an input in a single
+    walk, instead of testing each terminal separately.
+    """
+
+    def __init__(self, terminals: Iterable[Union[bytes, Terminal]] = ()):
+        self.terminals: List[bytes] = []
+        # children[node] maps a byte value to the next node
+        self.children: List[Dict[int, int]] = [{}]
+        # ends[node] is the index of the terminal ending at node, or -1
+        self.ends: List[int] = [-1]
+        for terminal in terminals:
+            self.add(terminal)
+
+    def add(self, terminal: Union[bytes, Terminal]) -> int:
+        """Adds a terminal and returns its index"""
+        if isinstance(terminal, Terminal):
+            terminal = terminal.terminal
+        node = 0
+        for b in terminal:
+            next_node = self.children[node].get(b)
+            if next_node is None:
+                next_node = len(self.children)
+                self.children[node][b] = next_node
+                self.children.append({})
+                self.ends.append(-1)
+            node = next_node
+        if self.ends[node] < 0:
+            self.ends[node] = len(self.terminals)
+            self.terminals.append(terminal)
+        return self.ends[node]
+
+    def matches(self, data: bytes, offset: int = 0) -> List[int]:
+        """Returns the indexes of all terminals that `data` contains at `offset`
+
+        Terminals are returned in order of increasing length.
+        """
+        result = []
+        children = self.children
+        ends = self.ends
+        if ends[0] >= 0:
+            result.append(ends[0])
+        node = 0
+        for i in range(offset, len(data)):
+            next_node = children[node].get(data[i])
+            if next_node is None:
+                break
+            node = next_node
+            if ends[node] >= 0:
+                result.append(ends[node])
+        return result
+
+    def prefixes(self, data: bytes, offset: int = 0) -> Set[bytes]:
+        """Returns all terminals that `data` contains at `offset`"""
+        return {self.terminals[i] for i in self.matches(data, offset)}
+
+    def __len__(self):
+        return len(self.terminals)
+
+
 class Start:
     def __str__(self):
         return "<START>"
@@ -78,6 +78,7 @@ Examples:
 
 from abc import ABC, ABCMeta, abstractmethod
 from argparse import ArgumentParser, Namespace
+from importlib import import_module
 from inspect import isabstract
 from typing import (
     Any,
@@ -87,12 +88,15 @@ from typing import (
     Iterable,
     List,
     Mapping,
+    NamedTuple,
     Optional,
+    Sequence,
     Tuple,
     Type,
     TypeVar,
 )
 
+from .profiling import add_profiling_arguments, profiled
 
 PLUGINS: Dict[str, Type["Plugin"]] = {}
 """A global dictionary mapping plugin names to their types."""
@@ -100,6 +104,105 @@ COMMANDS: Dict[str, Type["Command"]] = {}
 """A global dictionary mapping commands to their types."""
 
 
+class LazyCommand(NamedTuple):
+    """A built-in command whose module has not necessarily been imported yet."""
+
+    module: str
+    """The module implementing the command; importing it registers the command."""
+    help: str
+    """Help string for the command, which must match the command's :attr:`AbstractCommand.help`."""
+
+
+COMMAND_MANIFEST: Dict[str, LazyCommand] = {
+    "archive": LazyCommand(
+        "polytracker.taint_dag",
+        "write a trace file as a seekable, block compressed archive",
+    ),
+    "build": LazyCommand(
+        "polytracker.build", "runs a build command with blight instrumentation"
+    ),
+    "cavities": LazyCommand(
+        "polytracker.mapping",
+        "finds input byte offsets that do not affect any output byte offsets",
+    ),
+    "commands": LazyCommand("polytracker.repl", "print the PolyTracker commands"),
+    "compact": LazyCommand(
+        "polytracker.taint_dag", "rewrite a trace file with tightly packed sections"
+    ),
+    "diff": LazyCommand("polytracker.diffing", "compute a diff of two trace files"),
+    "docker": LazyCommand(
+        "polytracker.containerization",
+        "commands for seamlessly running PolyTracker in a Docker container",
+    ),
+    "extract-bc": LazyCommand(
+        "polytracker.build",
+        "extracts LLVM bitcode from a binary (executable, library, object file, ...)",
+    ),
+    "forest": LazyCommand(
+        "polytracker.taint_forest", "export a taint forest to GraphViz (DOT) format"
+    ),
+    "functions": LazyCommand(
+        "polytracker.mapping",
+        "attribute the input bytes that affected control flow to functions",
+    ),
+    "grammar": LazyCommand(
+        "polytracker.grammars", "extract a grammar from one or more program traces"
+    ),
+    "info": LazyCommand("polytracker.taint_dag", "print trace file information"),
+    "instrument-bc": LazyCommand(
+        "polytracker.build", "instruments LLVM bitcode with polytracker passes"
+    ),
+    "instrument-targets": LazyCommand(
+        "polytracker.build",
+        "instruments blight journal build targets with polytracker",
+    ),
+    "lower-bc": LazyCommand(
+        "polytracker.build",
+        "lowers an LLVM bitcode file to an executable according to a blight journal file",
+    ),
+    "mapping": LazyCommand(
+        "polytracker.mapping",
+        "generate a mapping of input byte offsets to output byte offsets",
+    ),
+    "opt-bc": LazyCommand("polytracker.build", "optimizes LLVM bitcode with O3"),
+    "serve": LazyCommand(
+        "polytracker.server",
+        "answer queries about traces over HTTP, keeping them open between queries",
+    ),
+    "slice": LazyCommand(
+        "polytracker.taint_dag",
+        "extract the provenance of selected output bytes into a smaller trace file",
+    ),
+    "synthesize": LazyCommand(
+        "polytracker.synthetic",
+        "write a synthetic trace file for benchmarking and testing",
+    ),
+}
+"""A static manifest of the built-in commands.
+
+The command line only imports the module of the command it dispatches, so that running one command does not pay for
+importing the dependencies of every other command. New built-in commands must be added here.
+
+"""
+
+
+def load_command(name: str) -> Optional[Type["Command"]]:
+    """Imports the module implementing the built-in command ``name``, returning the command's type.
+
+    Returns ``None`` if there is no such command.
+
+    """
+    if name not in COMMANDS and name in COMMAND_MANIFEST:
+        import_module(COMMAND_MANIFEST[name].module)
+    return COMMANDS.get(name, None)
+
+
+def load_all_commands():
+    """Imports the modules of every built-in command, along with the other plugins they define."""
+    for name in COMMAND_MANIFEST:
+        load_command(name)
+
+
 class PluginMeta(ABCMeta):
     """Metaclass for PolyTracker plugins."""
 
@@ -184,6 +287,7 @@ class AbstractCommand(Plugin):
             self.extensions = []
         if self.parent is None:
             self.__init_arguments__(argument_parser)
+            add_profiling_arguments(argument_parser)
         if self.subcommand_types is not None:
             self.subparser = argument_parser.add_subparsers(
                 title="subcommand",
@@ -210,16 +314,19 @@ class AbstractCommand(Plugin):
         pass
 
     def __getattribute__(self, item):
-        if item == "run" and Plugin.__getattribute__(self, "extensions"):
+        if item == "run":
             return Plugin.__getattribute__(self, "_run")
         else:
             return Plugin.__getattribute__(self, item)
 
     def _run(self, args: Namespace):
-        Plugin.__getattribute__(self, "run")(args)
-        # Fixme: Do extensions really need to be run every time?
-        for extension in self.extensions:
-            extension.run(self, args)
+        # Profiles and times the command if it was run with `--profile` or `--timings`
+        with profiled(self.full_name, args):
+            retval = Plugin.__getattribute__(self, "run")(args)
+            # Fixme: Do extensions really need to be run every time?
+            for extension in self.extensions:
+                extension.run(self, args)
+        return retval
 
     @abstractmethod
     def run(self, args: Namespace):
@@ -364,16 +471,42 @@ class Subcommand(Generic[C], AbstractCommand, ABC, metaclass=CommandExtensionMet
         return cast(C, self.parent)
 
 
-def add_command_subparsers(parser: ArgumentParser):
-    """Adds subparsers for all PolyTracker commands"""
+def requested_command(argv: Sequence[str]) -> Optional[str]:
+    """Returns the name of the command a PolyTracker command line dispatches, if any"""
+    for arg in argv:
+        if not arg.startswith("-"):
+            return arg
+    return None
+
+
+def add_command_subparsers(
+    parser: ArgumentParser, argv: Optional[Sequence[str]] = None
+):
+    """Adds subparsers for all PolyTracker commands
+
+    If ``argv`` is given, only the module of the command it requests is imported; every other built-in command that
+    has not already been imported is listed with its help string from :data:`COMMAND_MANIFEST`, but without its
+    arguments. Otherwise, all built-in commands are imported.
+
+    """
+    if argv is None:
+        load_all_commands()
+    else:
+        command = requested_command(argv)
+        if command is not None:
+            load_command(command)
     subparsers = parser.add_subparsers(
         title="command",
         description="valid PolyTracker commands",
         help="run `polytracker command --help` for help on a specific command",
     )
-    for name, command_type in COMMANDS.items():
-        p = subparsers.add_parser(
-            name, parents=command_type.parent_parsers, help=command_type.help
-        )
-        p.set_defaults(func=command_type(p).run)
+    for name in sorted(COMMANDS.keys() | COMMAND_MANIFEST.keys()):
+        if name in COMMANDS:
+            command_type = COMMANDS[name]
+            p = subparsers.add_parser(
+                name, parents=command_type.parent_parsers, help=command_type.help
+            )
+            p.set_defaults(func=command_type(p).run)
+        else:
+            subparsers.add_parser(name, help=COMMAND_MANIFEST[name].help)
     return subparsers
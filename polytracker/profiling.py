@@ -0,0 +1,176 @@
+"""Phase timers and counters for the analyses, and profiling of commands
+
+Analysis code marks its phases and counts the work it does::
+
+    from .profiling import count, phase
+
+    with phase("cavities.walk_sinks"):
+        ...
+    count("cavities.sink_labels", len(seen))
+
+Both are no-ops unless a command is run with ``--timings``, in which case the time spent in each phase and the
+counters are written as JSON when the command exits. Counters should be incremented in bulk at the end of a phase
+rather than once per label, so that they cost nothing in the inner loops.
+
+Running a command with ``--profile`` runs it under :mod:`cProfile`.
+
+"""
+
+from argparse import ArgumentParser, Namespace
+import cProfile
+from contextlib import contextmanager, nullcontext
+import json
+import pstats
+import resource
+import sys
+import time
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+_NULL_CONTEXT = nullcontext()
+
+
+class Metrics:
+    """Accumulates the time spent in named phases, and named counters"""
+
+    def __init__(self):
+        self.enabled: bool = False
+        self.phases: Dict[str, List[float]] = {}
+        """Maps each phase to its total time in seconds, and the number of times it ran"""
+        self.counters: Dict[str, int] = {}
+
+    def reset(self):
+        self.phases = {}
+        self.counters = {}
+
+    def phase(self, name: str) -> ContextManager:
+        """Returns a context manager timing a phase of an analysis"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            totals = self.phases.setdefault(name, [0.0, 0])
+            totals[0] += elapsed
+            totals[1] += 1
+
+    def count(self, name: str, n: int = 1):
+        """Adds `n` to a counter"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "phases": {
+                name: {"seconds": seconds, "calls": calls}
+                for name, (seconds, calls) in self.phases.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+
+METRICS = Metrics()
+"""The metrics of the running command."""
+
+
+def phase(name: str) -> ContextManager:
+    """Times a phase of an analysis, if timings are enabled"""
+    return METRICS.phase(name)
+
+
+def count(name: str, n: int = 1):
+    """Increments a counter, if timings are enabled"""
+    METRICS.count(name, n)
+
+
+def add_profiling_arguments(parser: ArgumentParser):
+    """Adds the ``--profile`` and ``--timings`` options to a command's parser"""
+    group = parser.add_argument_group("profiling")
+    group.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="run the command under cProfile and write its stats to FILE, which can be loaded with `pstats` or "
+        "snakeviz; if FILE is `-`, print the functions with the highest cumulative time to stderr",
+    )
+    group.add_argument(
+        "--timings",
+        metavar="FILE",
+        help="write the time spent in each phase of the analysis and its counters to FILE as JSON, or to stderr "
+        "if FILE is `-`",
+    )
+
+
+def _peak_rss() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, and bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _write(destination: str, write):
+    if destination == "-":
+        write(sys.stderr)
+    else:
+        with open(destination, "w") as f:
+            write(f)
+
+
+_active: bool = False
+
+
+@contextmanager
+def profiled(command: str, args: Namespace) -> Iterator[None]:
+    """Profiles and times `command` as requested by its ``--profile`` and ``--timings`` arguments
+
+    Only the outermost command is measured if commands run each other.
+
+    """
+    global _active
+    profile: Optional[str] = getattr(args, "profile", None)
+    timings: Optional[str] = getattr(args, "timings", None)
+    if _active or (profile is None and timings is None):
+        yield
+        return
+    _active = True
+    profiler: Optional[cProfile.Profile] = None
+    if timings is not None:
+        METRICS.reset()
+        METRICS.enabled = True
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        if profile is not None:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        wall_time = time.perf_counter() - wall_start
+        cpu_time = time.process_time() - cpu_start
+        _active = False
+        if profiler is not None:
+            if profile == "-":
+                stats = pstats.Stats(profiler, stream=sys.stderr)
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(30)
+            else:
+                profiler.dump_stats(profile)
+        if timings is not None:
+            METRICS.enabled = False
+            report = {
+                "command": command,
+                "wall_seconds": wall_time,
+                "cpu_seconds": cpu_time,
+                "peak_rss": _peak_rss(),
+                **METRICS.report(),
+            }
+
+            def write(f):
+                json.dump(report, f, indent=2)
+                f.write("\n")
+
+            _write(timings, write)
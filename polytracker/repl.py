@@ -3,97 +3,12 @@ import inspect
 import traceback
 from datetime import datetime
 from io import StringIO
-from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from typing import Any, Callable, Dict, List, Optional
 
-from prompt_toolkit import HTML, print_formatted_text, PromptSession
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
-from prompt_toolkit.completion import Completer, Completion
-from prompt_toolkit.filters import Condition
-from prompt_toolkit.formatted_text import PygmentsTokens
-from prompt_toolkit.key_binding import KeyBindings
-from prompt_toolkit.lexers import PygmentsLexer
-from pygments import lex
-from pygments.lexers.python import PythonLexer, PythonTracebackLexer
+from .plugins import Command, COMMANDS, load_all_commands
 
-from .plugins import Command, COMMANDS
-
-
-class PolyTrackerCompleter(Completer):
-    def __init__(self, repl: "PolyTrackerREPL"):
-        self.repl: PolyTrackerREPL = repl
-        self.current_help: Optional[str] = None
-
-    @staticmethod
-    def _get_completions(
-        partial: str,
-        options: Iterable[str],
-        already_completed: Set[str],
-        style: str = "",
-    ):
-        for var in options:
-            if (
-                var not in already_completed
-                and var.startswith(partial)
-                and var != partial
-            ):
-                yield Completion(var, start_position=-len(partial), style=style)
-                already_completed.add(var)
-
-    def rprompt(self):
-        return None
-
-    def bottom_toolbar(self):
-        if self.current_help is not None:
-            return self.current_help
-        else:
-            return ""
-
-    def get_completions(self, document, complete_event):
-        if self.repl.multi_line and document.text == "":
-            # we are in a multi-line statement, and the user pressed TAB in order to indent
-            return
-        partial = document.text_before_cursor
-        already_yielded = set()
-        if partial == document.text:
-            # we are at the start of the line, so complete for commands:
-            yield from PolyTrackerCompleter._get_completions(
-                partial, PolyTrackerREPL.commands, already_yielded, "fg:ansiblue"
-            )
-        args = document.text.split(" ")
-        if args[0] in PolyTrackerREPL.commands:
-            # We are completing a command
-            # TODO: Parse options and add their help to self.current_help
-            self.current_help = None
-        else:
-            self.current_help = None
-
-        yield from PolyTrackerCompleter._get_completions(
-            partial,
-            (var for var in self.repl.state if var not in self.repl.builtins),
-            already_yielded,
-        )
-        yield from PolyTrackerCompleter._get_completions(
-            partial, self.repl.builtins, already_yielded, "fg:ansigreen"
-        )
-        if "__builtins__" in self.repl.state:
-            builtins = self.repl.state["__builtins__"]
-        else:
-            builtins = __builtins__
-        yield from PolyTrackerCompleter._get_completions(
-            partial, builtins, already_yielded, "fg:ansigreen"
-        )
-        if "." in partial:
-            portions = partial.split(".")
-            varname = portions[-2]
-            to_complete = portions[-1]
-            if varname in self.repl.state:
-                attr = self.repl.state[varname]
-                if not isinstance(attr, REPLCommand):
-                    yield from PolyTrackerCompleter._get_completions(
-                        to_complete,
-                        (a for a in dir(attr) if not a.startswith("_")),
-                        already_yielded,
-                    )
+# prompt_toolkit and pygments are slow to import, and most modules only import this one to register functions with
+# the REPL, so they are only imported once the REPL or one of its printing functions is actually used.
 
 
 class REPLCommand:
@@ -148,6 +63,11 @@ class REPLCommand:
 
 
 def print_function_help(func, func_name: Optional[str] = None):
+    from prompt_toolkit import HTML, print_formatted_text
+    from prompt_toolkit.formatted_text import PygmentsTokens
+    from pygments import lex
+    from pygments.lexers.python import PythonLexer
+
     if func_name is None:
         func_name = func.__name__
     sig = inspect.signature(func)
@@ -163,6 +83,10 @@ class PolyTrackerREPL:
     _current_instance: Optional["PolyTrackerREPL"] = None
 
     def __init__(self):
+        from prompt_toolkit import PromptSession
+        from prompt_toolkit.lexers import PygmentsLexer
+        from pygments.lexers.python import PythonLexer
+
         self.session = PromptSession(lexer=PygmentsLexer(PythonLexer))
         self.state = {
             "copyright": f"Copyright (c) 2019-{datetime.today().year} Trail of Bits.\nAll Rights Reserved.",
@@ -215,11 +139,18 @@ class PolyTrackerREPL:
 
     @staticmethod
     def warning(message: str):
+        from prompt_toolkit import HTML, print_formatted_text
+
         print_formatted_text(
             HTML(f'<b><style fg="yellow">Warning: </style></b> {message}')
         )
 
     def print_exc(self):
+        from prompt_toolkit import print_formatted_text
+        from prompt_toolkit.formatted_text import PygmentsTokens
+        from pygments import lex
+        from pygments.lexers.python import PythonTracebackLexer
+
         buffer = StringIO()
         traceback.print_exc(file=buffer)
         tokens = lex(buffer.getvalue(), lexer=PythonTracebackLexer())
@@ -227,6 +158,8 @@ class PolyTrackerREPL:
 
     @classmethod
     def prompt(cls, message: str, options: str = "yN", default: bool = False) -> bool:
+        from prompt_toolkit import HTML, print_formatted_text
+
         while True:
             print_formatted_text(
                 HTML(f"<b>{message}</b> <ansigray>[{options}]</ansigray> "), end=""
@@ -240,6 +173,13 @@ class PolyTrackerREPL:
                 return False
 
     def run_python(self, command):
+        from prompt_toolkit import HTML
+        from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+        from prompt_toolkit.filters import Condition
+        from prompt_toolkit.key_binding import KeyBindings
+
+        from .completion import PolyTrackerCompleter
+
         continued_prompt = HTML("<b>... </b>")
 
         bindings = KeyBindings()
@@ -346,6 +286,8 @@ class PolyTrackerREPL:
     @classmethod
     def commands_command(cls):
         """print the PolyTracker commands"""
+        from prompt_toolkit import HTML, print_formatted_text
+
         longest_command = max(len(cmd_name) for cmd_name in cls.commands)
         for name, command in sorted(cls.commands.items()):
             dots = "." * (longest_command - len(name) + 1)
@@ -357,8 +299,14 @@ class PolyTrackerREPL:
             )
 
     def run(self):
+        from prompt_toolkit import HTML, print_formatted_text
+        from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+
         from . import version
+        from .completion import PolyTrackerCompleter
 
+        # Import every module, so that all of their functions are registered with the REPL
+        load_all_commands()
         if PolyTrackerREPL._current_instance is not None:
             PolyTrackerREPL.warning(
                 "More than one instance of PolyTrackerREPL is running at the same time! This can "
@@ -424,6 +372,9 @@ class Commands(Command):
     help = "print the PolyTracker commands"
 
     def run(self, args):
+        from prompt_toolkit import HTML, print_formatted_text
+
+        load_all_commands()
         longest_command = max(len(cmd_name) for cmd_name in COMMANDS)
         for command in COMMANDS.values():
             dots = "." * (longest_command - len(command.name) + 1)
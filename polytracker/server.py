@@ -0,0 +1,609 @@
+"""
+A long running analysis server that keeps traces open between queries
+
+Every ``polytracker`` command opens and indexes its trace from scratch. ``polytracker serve`` instead keeps the most
+recently used traces open, together with their label resolver caches and the indexes built by earlier queries, and
+answers queries about them over HTTP, either on a local TCP port or on a Unix socket.
+
+Queries are POSTed as JSON objects to ``/<query>``, and always include the path of the ``trace``::
+
+    $ curl -s -d '{"trace": "out.tdag", "sink": "out.bin", "offsets": [0, 1]}' localhost:8378/backward
+
+The response is a JSON object, or ``{"error": message}`` with a 4xx status code if the query is invalid and a 500
+status code if answering it failed.
+"""
+
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+from pathlib import Path
+import selectors
+import socket
+from socketserver import BaseServer, UnixStreamServer
+import sys
+from threading import Lock, Thread
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .cache import LRUCache
+from .mapping import InputOutputMapping
+from .plugins import Command
+from .taint_dag import (
+    derived_labels,
+    reachable_labels,
+    sink_bytes,
+    source_bitmaps,
+    TDFile,
+    TDLabelArrays,
+)
+from .tracing import normalize_intervals
+
+DEFAULT_PORT = 8378
+DEFAULT_MAX_TRACES = 16
+DEFAULT_TIMEOUT = 60.0
+
+
+class QueryError(ValueError):
+    """Raised for malformed queries, reported to the client with status 400"""
+
+
+def _offset_intervals(offsets: np.ndarray) -> List[List[int]]:
+    """Returns the [begin, end) intervals covering `offsets`"""
+    return normalize_intervals(np.stack((offsets, offsets + 1), axis=1)).tolist()
+
+
+class OpenTrace:
+    """A trace kept open by the server, along with the indexes built for it
+
+    Analyses of a :class:`TDFile` are not thread safe, so queries on the same trace hold :attr:`lock`.
+    """
+
+    def __init__(self, path: Path):
+        self.path: Path = path
+        self.stat: Tuple[int, int] = self._stat(path)
+        with open(path, "rb") as f:
+            # The trace is memory mapped, so the file does not need to stay open
+            self.tdfile: TDFile = TDFile(f)
+        self.lock: Lock = Lock()
+        self._arrays: Optional[TDLabelArrays] = None
+        self._sink_bytes: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._mapping: Optional[Dict[Tuple[Path, int], Any]] = None
+        self._cavities: Optional[Dict[Path, Any]] = None
+
+    @staticmethod
+    def _stat(path: Path) -> Tuple[int, int]:
+        stat = path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def is_stale(self) -> bool:
+        """Returns whether the trace file changed since it was opened"""
+        try:
+            return self._stat(self.path) != self.stat
+        except FileNotFoundError:
+            return True
+
+    @property
+    def arrays(self) -> TDLabelArrays:
+        if self._arrays is None:
+            self._arrays = TDLabelArrays(self.tdfile)
+        return self._arrays
+
+    @property
+    def sink_bytes(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._sink_bytes is None:
+            self._sink_bytes = sink_bytes(self.tdfile)
+        return self._sink_bytes
+
+    def intervals_by_path(
+        self, fds: np.ndarray, offsets: np.ndarray
+    ) -> Dict[str, List[List[int]]]:
+        """Groups the offsets of file descriptors `fds` into intervals by path"""
+        by_path: Dict[str, List[np.ndarray]] = {}
+        for idx in np.unique(fds).tolist():
+            path = str(self.tdfile.fd_headers[idx][0])
+            by_path.setdefault(path, []).append(offsets[fds == idx])
+        return {
+            path: _offset_intervals(np.concatenate(path_offsets))
+            for path, path_offsets in by_path.items()
+        }
+
+    def fd_indices(self, path: str) -> List[int]:
+        """Returns the indices of the file descriptors opened for `path`"""
+        indices = [
+            i
+            for i, (fd_path, _) in enumerate(self.tdfile.fd_headers)
+            if str(fd_path) == path
+        ]
+        if not indices:
+            raise QueryError(f"{path} is not a source or sink of {self.path}")
+        return indices
+
+    def info(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        tdfile = self.tdfile
+        return {
+            "labels": tdfile.label_count,
+            "sections": [
+                {"tag": h.tag, "align": h.align, "offset": h.offset, "size": h.size}
+                for h in tdfile.section_headers
+            ],
+            "fds": [str(path) for path, _ in tdfile.fd_headers],
+            "functions": [name for name, _ in tdfile.fn_headers],
+            "sink_bytes": len(self.sink_bytes[0]),
+        }
+
+    def mapping(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        if self._mapping is None:
+            self._mapping = InputOutputMapping(self.tdfile).mapping()
+        return {
+            "mapping": [
+                {
+                    "input": [str(path), offset],
+                    "outputs": sorted([str(p), o] for p, o in outputs),
+                }
+                for (path, offset), outputs in self._mapping.items()
+            ]
+        }
+
+    def cavities(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        if self._cavities is None:
+            self._cavities = InputOutputMapping(self.tdfile).file_cavities()
+        return {
+            "cavities": {
+                str(path): [list(cavity) for cavity in cavities]
+                for path, cavities in self._cavities.items()
+            }
+        }
+
+    def _sink_labels(self, query: Dict[str, Any]) -> np.ndarray:
+        """The labels selected by a query, either directly or by the output bytes they were written to"""
+        if "labels" in query:
+            labels = np.asarray(query["labels"], dtype=np.int64)
+            if labels.size and (labels.min() < 0 or labels.max() >= len(self.arrays)):
+                raise QueryError(f"labels must be in [0, {len(self.arrays)})")
+            return labels
+        if "sink" not in query:
+            raise QueryError("either `labels` or `sink` is required")
+        fds, offsets, labels = self.sink_bytes
+        selected = np.isin(fds, self.fd_indices(query["sink"]))
+        if "offsets" in query:
+            selected &= np.isin(offsets, np.asarray(query["offsets"], dtype=np.int64))
+        return labels[selected]
+
+    def backward(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """The source bytes that the selected labels or output bytes were derived from"""
+        labels = self._sink_labels(query)
+        sources: Dict[str, List[Tuple[int, int]]] = {}
+        for idx, begin, end in self.tdfile.resolver.resolve_all(labels.tolist()):
+            sources.setdefault(str(self.tdfile.fd_headers[idx][0]), []).append(
+                (begin, end)
+            )
+        return {
+            "sources": {
+                path: normalize_intervals(intervals).tolist()
+                for path, intervals in sources.items()
+            }
+        }
+
+    def forward(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """The output bytes derived from the selected source bytes"""
+        if "source" not in query:
+            raise QueryError("`source` is required")
+        arrays = self.arrays
+        selected = arrays.is_source & np.isin(
+            arrays.source_index, self.fd_indices(query["source"])
+        )
+        if "offsets" in query:
+            selected &= np.isin(
+                arrays.source_offset, np.asarray(query["offsets"], dtype=np.int64)
+            )
+        derived = derived_labels(arrays, selected)
+        fds, offsets, labels = self.sink_bytes
+        tainted = derived[labels]
+        return {
+            "labels": int(np.count_nonzero(derived)),
+            "sinks": self.intervals_by_path(fds[tainted], offsets[tainted]),
+        }
+
+    def sinks(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """The output bytes of every sink, and optionally the source bytes they are derived from"""
+        fds, offsets, labels = self.sink_bytes
+        result: Dict[str, Any] = {"sinks": self.intervals_by_path(fds, offsets)}
+        if query.get("sources", False):
+            bitmaps = source_bitmaps(
+                self.tdfile,
+                self.arrays,
+                reachable_labels(self.arrays, np.unique(labels)),
+            )
+            result["sources"] = {
+                str(path): _offset_intervals(np.flatnonzero(bitmap))
+                for path, bitmap in bitmaps.items()
+            }
+        return result
+
+
+QUERIES: Dict[str, Callable[[OpenTrace, Dict[str, Any]], Dict[str, Any]]] = {
+    "info": OpenTrace.info,
+    "mapping": OpenTrace.mapping,
+    "cavities": OpenTrace.cavities,
+    "backward": OpenTrace.backward,
+    "forward": OpenTrace.forward,
+    "sinks": OpenTrace.sinks,
+}
+"""The queries answered by the server, by name."""
+
+
+class TraceServer:
+    """Answers queries about traces, keeping the most recently used ones open"""
+
+    def __init__(self, max_traces: int = DEFAULT_MAX_TRACES):
+        self.traces: LRUCache[Path, OpenTrace] = LRUCache(max_size=max_traces)
+        self._traces_lock: Lock = Lock()
+
+    def trace(self, path: Path) -> OpenTrace:
+        """Returns the open trace at `path`, (re)opening it if it is not open or has changed"""
+        path = path.resolve()
+        with self._traces_lock:
+            trace = self.traces.get(path, None)
+            if trace is not None and not trace.is_stale():
+                return trace
+        trace = OpenTrace(path)
+        with self._traces_lock:
+            self.traces[path] = trace
+        return trace
+
+    def query(self, name: str, query: Dict[str, Any]) -> Dict[str, Any]:
+        if name not in QUERIES:
+            raise QueryError(
+                f"unknown query {name!r}, expected one of {', '.join(QUERIES)}"
+            )
+        if "trace" not in query:
+            raise QueryError("`trace` is required")
+        trace = self.trace(Path(query["trace"]))
+        with trace.lock:
+            return QUERIES[name](trace, query)
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    """Answers the requests sent over a connection, one at a time
+
+    Unlike other request handlers, the handler is only set up when the connection is accepted. The server calls
+    :meth:`handle_one_request` whenever a request arrives, and :meth:`finish` once the connection is closed.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: "_PooledServer"
+
+    def __init__(self, request, client_address, server: "_PooledServer"):
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+        # How long a client may take to send the rest of a request, and to receive the response
+        self.timeout = server.request_timeout
+        self.setup()
+
+    def address_string(self) -> str:
+        # Unix socket clients do not have a host address
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _respond(self, status: int, body: Dict[str, Any]) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def has_buffered_request(self) -> bool:
+        """Returns whether the client already sent (part of) its next request, so that it was read along with the
+        last one and the connection will not become readable for it"""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            query = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(query, dict):
+                raise QueryError("the query must be a JSON object")
+            response = self.server.trace_server.query(self.path.strip("/"), query)
+        except socket.timeout:
+            # The rest of the query never arrived, so the connection is out of step
+            self.close_connection = True
+            self._respond(408, {"error": "timed out waiting for the query"})
+        except FileNotFoundError as e:
+            self._respond(404, {"error": str(e)})
+        except PermissionError as e:
+            self._respond(403, {"error": str(e)})
+        except (QueryError, ValueError, TypeError, OSError) as e:
+            self._respond(400, {"error": str(e)})
+        except Exception as e:
+            self.log_error("query %s failed: %r", self.path, e)
+            self._respond(500, {"error": f"{type(e).__name__}: {e}"})
+        else:
+            self._respond(200, response)
+
+
+class _PooledServer(BaseServer):
+    """Answers requests on the workers of a thread pool
+
+    Connections waiting for their next request are watched by a selector, and only handed to a worker once a request
+    arrives, so idle keep-alive connections do not hold a worker. Connections idle for longer than
+    :attr:`request_timeout` are closed.
+    """
+
+    trace_server: TraceServer
+    executor: ThreadPoolExecutor
+    quiet: bool = False
+    request_timeout: float = DEFAULT_TIMEOUT
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._selector = selectors.DefaultSelector()
+        # Connections that became idle since the watcher last woke up, and when they did
+        self._idle: List[Tuple[_QueryHandler, float]] = []
+        self._idle_lock: Lock = Lock()
+        # Wakes the watcher up to watch the connections in _idle
+        self._wakeup, self._wakeup_sender = socket.socketpair()
+        self._selector.register(self._wakeup, selectors.EVENT_READ)
+        self._closing: bool = False
+        self._watcher: Thread = Thread(target=self._watch_connections, daemon=True)
+        self._watcher.start()
+
+    def process_request(self, request, client_address):
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+        else:
+            self._wait_for_request(handler)
+
+    def _wait_for_request(self, handler: _QueryHandler):
+        with self._idle_lock:
+            closing = self._closing
+            if not closing:
+                self._idle.append((handler, time.monotonic()))
+        if closing:
+            self._close_connection(handler)
+        else:
+            self._wakeup_sender.send(b"\0")
+
+    def _watch_connections(self):
+        idle_since: Dict[_QueryHandler, float] = {}
+        while True:
+            timeout = None
+            if idle_since:
+                oldest = min(idle_since.values())
+                timeout = max(0.0, oldest + self.request_timeout - time.monotonic())
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is self._wakeup:
+                    self._wakeup.recv(4096)
+                    continue
+                handler = key.data
+                self._selector.unregister(key.fileobj)
+                del idle_since[handler]
+                self.executor.submit(self._handle_request, handler)
+            with self._idle_lock:
+                closing = self._closing
+                idle, self._idle = self._idle, []
+            for handler, since in idle:
+                self._selector.register(
+                    handler.connection, selectors.EVENT_READ, handler
+                )
+                idle_since[handler] = since
+            now = time.monotonic()
+            for handler, since in list(idle_since.items()):
+                if closing or now - since >= self.request_timeout:
+                    self._selector.unregister(handler.connection)
+                    del idle_since[handler]
+                    self._close_connection(handler)
+            if closing:
+                return
+
+    def _handle_request(self, handler: _QueryHandler):
+        try:
+            handler.handle_one_request()
+            while not handler.close_connection and handler.has_buffered_request():
+                handler.handle_one_request()
+        except ConnectionError:
+            # The client went away
+            handler.close_connection = True
+        except Exception:
+            self.handle_error(handler.request, handler.client_address)
+            handler.close_connection = True
+        if handler.close_connection:
+            self._close_connection(handler)
+        else:
+            self._wait_for_request(handler)
+
+    def _close_connection(self, handler: _QueryHandler):
+        try:
+            handler.finish()
+        except OSError:
+            # The client is gone, and the rest of the response with it
+            pass
+        finally:
+            self.shutdown_request(handler.request)
+
+    def server_close(self):
+        super().server_close()  # type: ignore
+        with self._idle_lock:
+            self._closing = True
+        self._wakeup_sender.send(b"\0")
+        self._watcher.join()
+        # Connections answered from here on are closed by the workers
+        self.executor.shutdown(wait=True)
+        self._selector.close()
+        self._wakeup.close()
+        self._wakeup_sender.close()
+
+
+class TCPQueryServer(_PooledServer, HTTPServer):
+    pass
+
+
+class UnixQueryServer(_PooledServer, UnixStreamServer):
+    pass
+
+
+def make_server(
+    trace_server: TraceServer,
+    workers: Optional[int] = None,
+    unix_socket: Optional[Path] = None,
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> _PooledServer:
+    """Creates a server answering queries on `unix_socket` if given, or else on `host`:`port`
+
+    Connections that are idle, or that stall in the middle of a request, for `timeout` seconds are closed.
+    """
+    server: _PooledServer
+    if unix_socket is not None:
+        if unix_socket.exists():
+            unix_socket.unlink()
+        server = UnixQueryServer(str(unix_socket), _QueryHandler)
+    else:
+        server = TCPQueryServer((host, port), _QueryHandler)
+    server.trace_server = trace_server
+    server.request_timeout = timeout
+    server.executor = ThreadPoolExecutor(max_workers=workers)
+    return server
+
+
+class _UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path: Path):
+        super().__init__("localhost")
+        self.unix_socket: str = str(path)
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_socket)
+
+
+class TraceClient:
+    """Sends queries to a ``polytracker serve`` server over a single persistent connection"""
+
+    def __init__(
+        self,
+        unix_socket: Optional[Path] = None,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_PORT,
+    ):
+        if unix_socket is not None:
+            self.connection: HTTPConnection = _UnixHTTPConnection(unix_socket)
+        else:
+            self.connection = HTTPConnection(host, port)
+
+    def query(self, name: str, trace: Path, **params: Any) -> Dict[str, Any]:
+        """Runs query `name` on `trace`, raising a QueryError if the server rejects it"""
+        body = json.dumps({"trace": str(trace), **params})
+        for attempt in range(2):
+            try:
+                self.connection.request(
+                    "POST", f"/{name}", body, {"Content-Type": "application/json"}
+                )
+                response = self.connection.getresponse()
+                break
+            except ConnectionError:
+                # The server closes idle connections. Queries have no side effects, so they are resent once over a
+                # new connection.
+                self.connection.close()
+                if attempt:
+                    raise
+        result = json.loads(response.read())
+        if response.status != 200:
+            raise QueryError(result.get("error", response.reason))
+        return result
+
+    def close(self):
+        self.connection.close()
+
+
+class ServeCommand(Command):
+    name = "serve"
+    help = "answer queries about traces over HTTP, keeping them open between queries"
+
+    def __init_arguments__(self, parser: ArgumentParser):
+        parser.add_argument(
+            "--unix-socket",
+            "-u",
+            type=Path,
+            help="listen on this Unix socket instead of a TCP port",
+        )
+        parser.add_argument(
+            "--host",
+            type=str,
+            default="127.0.0.1",
+            help="address to listen on (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--port",
+            "-p",
+            type=int,
+            default=DEFAULT_PORT,
+            help="port to listen on (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--workers",
+            "-j",
+            type=int,
+            default=os.cpu_count(),
+            help="number of connections served concurrently (default: number of CPUs)",
+        )
+        parser.add_argument(
+            "--max-traces",
+            type=int,
+            default=DEFAULT_MAX_TRACES,
+            help="number of traces kept open (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=DEFAULT_TIMEOUT,
+            help="seconds after which idle or stalled connections are closed (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--quiet", "-q", action="store_true", help="do not log requests"
+        )
+
+    def run(self, args: Namespace):
+        if args.max_traces <= 0 or args.workers <= 0 or args.timeout <= 0:
+            sys.stderr.write("--max-traces, --workers and --timeout must be positive\n")
+            return 1
+        server = make_server(
+            TraceServer(args.max_traces),
+            args.workers,
+            args.unix_socket,
+            args.host,
+            args.port,
+            args.timeout,
+        )
+        server.quiet = args.quiet
+        if args.unix_socket is not None:
+            sys.stderr.write(f"Serving on {args.unix_socket}\n")
+        else:
+            sys.stderr.write(f"Serving on http://{args.host}:{args.port}\n")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if args.unix_socket is not None and args.unix_socket.exists():
+                args.unix_socket.unlink()
+        return 0
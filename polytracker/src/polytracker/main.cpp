@@ -1,8 +1,11 @@
 #include <atomic>
+#include <cctype>
+#include <cerrno>
 #include <fcntl.h>
 #include <fstream>
 #include <iostream>
 #include <limits.h>
+#include <limits>
 #include <sanitizer/dfsan_interface.h>
 #include <stdio.h>
 #include <stdlib.h>
@@ -16,6 +19,7 @@
 #include "polytracker/dfsan_types.h"
 #include "polytracker/early_construct.h"
 #include "polytracker/polytracker.h"
+#include "taintdag/error.h"
 #include "taintdag/polytracker.h"
 
 #define DEFAULT_TTL 32
@@ -30,6 +34,28 @@ DECLARE_EARLY_CONSTRUCT(std::string, polytracker_stdin_source);
 // Controls argv being a taint source
 bool polytracker_taint_argv = false;
 
+// Controls whether the output file is compacted at exit
+bool polytracker_compact_output = false;
+
+// Bytes to reserve for each output file section, zero uses the default
+taintdag::SectionCapacities polytracker_section_capacities{};
+
+// Environment variables overriding the capacity of a section
+struct SectionCapacityVariable {
+  char const *name;
+  uint8_t tag;
+};
+
+constexpr SectionCapacityVariable section_capacity_variables[] = {
+    {"POLYTRACKER_SOURCES_CAPACITY", taintdag::Sources::tag},
+    {"POLYTRACKER_LABELS_CAPACITY", taintdag::Labels::tag},
+    {"POLYTRACKER_STRINGS_CAPACITY", taintdag::StringTable::tag},
+    {"POLYTRACKER_SINKS_CAPACITY", taintdag::TaintSinkRuns::tag},
+    {"POLYTRACKER_FUNCTIONS_CAPACITY", taintdag::Functions::tag},
+    {"POLYTRACKER_EVENTS_CAPACITY", taintdag::Events::tag},
+    {"POLYTRACKER_CONTROL_FLOW_LOG_CAPACITY", taintdag::ControlFlowLog::tag},
+};
+
 uint64_t byte_start = 0;
 uint64_t byte_end = 0;
 bool polytracker_trace = false;
@@ -55,6 +81,45 @@ void set_defaults() {
   }
 }
 
+// Parses a number of bytes with an optional K, M, G or T (binary) suffix
+size_t parse_capacity(char const *name, char const *value) {
+  if (!isdigit(static_cast<unsigned char>(value[0]))) {
+    taintdag::error_exit("Invalid ", name, ": '", value, "'");
+  }
+  char *end = nullptr;
+  errno = 0;
+  size_t bytes = strtoull(value, &end, 10);
+  if (errno == ERANGE) {
+    taintdag::error_exit("Invalid ", name, ": '", value, "'");
+  }
+  unsigned shift = 0;
+  switch (*end) {
+  case 'T':
+  case 't':
+    shift += 10;
+    [[fallthrough]];
+  case 'G':
+  case 'g':
+    shift += 10;
+    [[fallthrough]];
+  case 'M':
+  case 'm':
+    shift += 10;
+    [[fallthrough]];
+  case 'K':
+  case 'k':
+    shift += 10;
+    ++end;
+    break;
+  }
+  auto max = std::numeric_limits<size_t>::max() >> shift;
+  // A section can't be reserved zero bytes, the variable is unset instead
+  if (*end != '\0' || bytes == 0 || bytes > max) {
+    taintdag::error_exit("Invalid ", name, ": '", value, "'");
+  }
+  return bytes << shift;
+}
+
 // Parses the env looking to override current settings
 void polytracker_parse_env() {
   if (auto pdb = getenv("POLYDB")) {
@@ -76,6 +141,17 @@ void polytracker_parse_env() {
   if (auto argv = getenv("POLYTRACKER_TAINT_ARGV")) {
     polytracker_taint_argv = argv[0] == '1';
   }
+
+  if (auto compact = getenv("POLYTRACKER_COMPACT_OUTPUT")) {
+    polytracker_compact_output = compact[0] == '1';
+  }
+
+  for (auto const &var : section_capacity_variables) {
+    if (auto capacity = getenv(var.name)) {
+      polytracker_section_capacities[var.tag] =
+          parse_capacity(var.name, capacity);
+    }
+  }
 }
 
 /*
@@ -127,6 +203,14 @@ void polytracker_print_settings() {
   if (polytracker_taint_argv) {
     printf("POLYTRACKER_TAINT_ARGV: 1\n");
   }
+  if (polytracker_compact_output) {
+    printf("POLYTRACKER_COMPACT_OUTPUT: 1\n");
+  }
+  for (auto const &var : section_capacity_variables) {
+    if (auto capacity = polytracker_section_capacities[var.tag]) {
+      printf("%s: %zu\n", var.name, capacity);
+    }
+  }
 }
 
 void sink_streams() {
@@ -151,7 +235,8 @@ void taint_start(void) {
   polytracker_get_settings();
   polytracker_print_settings();
   DO_EARLY_CONSTRUCT(taintdag::PolyTracker, polytracker_tdag,
-                     get_polytracker_db_name());
+                     get_polytracker_db_name(), polytracker_compact_output,
+                     polytracker_section_capacities);
   sink_streams();
   stdin_source();
   // Set up the atexit call
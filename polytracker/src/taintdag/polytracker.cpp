@@ -6,6 +6,8 @@
  * the LICENSE file found in the root directory of this source tree.
  */
 
+#include <array>
+#include <chrono>
 #include <filesystem>
 #include <system_error>
 
@@ -19,8 +21,42 @@
 
 namespace taintdag {
 
-PolyTracker::PolyTracker(std::filesystem::path const &outputfile)
-    : output_file_{outputfile} {}
+PolyTracker::PolyTracker(std::filesystem::path const &outputfile,
+                         bool compact_output,
+                         SectionCapacities const &capacities)
+    : output_file_{outputfile, compact_output, capacities},
+      start_time_{std::chrono::system_clock::now()},
+      start_{std::chrono::steady_clock::now()} {}
+
+PolyTracker::~PolyTracker() {
+  using std::chrono::duration_cast;
+  using std::chrono::nanoseconds;
+
+  auto &counters = output_file_.section<Labels>().union_counters;
+  RuntimeStatsHeader header{
+      .start_time_ns = static_cast<uint64_t>(
+          duration_cast<nanoseconds>(start_time_.time_since_epoch()).count()),
+      .duration_ns = static_cast<uint64_t>(
+          duration_cast<nanoseconds>(std::chrono::steady_clock::now() - start_)
+              .count()),
+      .unions_requested = counters.requested,
+      .unions_identical = counters.identical,
+      .unions_short_circuited = counters.short_circuited,
+      .unions_deduplicated = counters.deduplicated,
+      .unions_created = counters.created};
+
+  std::array<SectionUsage, RuntimeStats::max_sections> sections;
+  size_t count = 0;
+  output_file_.for_each_section(
+      [&sections, &count](uint8_t tag, size_t used, size_t capacity) {
+        if (count < sections.size()) {
+          sections[count++] = SectionUsage{
+              .tag = tag, .used = used, .capacity = capacity};
+        }
+      });
+  output_file_.section<RuntimeStats>().record(header,
+                                              {sections.data(), count});
+}
 
 label_t PolyTracker::union_labels(label_t l1, label_t l2) {
   return output_file_.section<Labels>().union_taint(l1, l2);
@@ -125,28 +161,19 @@ PolyTracker::create_taint_source(std::string_view name,
 void PolyTracker::taint_sink(int fd, util::Offset offset, void const *mem,
                              size_t length) {
 
-  // TODO (hbrodin): Optimize this. Add a way of representing the entire write
-  // without calling log_single. Observations from writing png from pdf:
-  //  - there are a lot of outputs repeated once - could reuse highest label
-  //  bit to indicate that the value should be repeated and only output offset
-  //  should increase by one.
-  //  - writes come in chunks of 78, 40-70k of data. Could write [fileindex,
-  //  offset, len, label1, label2, ...label-len]
-  //    instead of [fileindex offset label1] [fileindex offset label2] ...
-  //    [fileindex offset label-len]
-  // could consider variable length encoding of values. Not sure how much of a
-  // gain it would be.
-
+  // Consecutive output bytes are logged as runs. A write of bytes that share a
+  // label, or that carry labels increasing by a constant stride (e.g. a copy of
+  // source bytes), is stored as a single entry instead of one per byte.
   if (auto idx = output_file_.section<Sources>().mapping_idx(fd)) {
     std::span<uint8_t const> src{reinterpret_cast<uint8_t const *>(mem),
                                  length};
     auto offset_value = offset.valid()
                             ? *offset.value()
                             : stream_write_offsets_.increase(*idx, length);
+    SinkRunEncoder<TaintSinkRuns> encoder{
+        output_file_.section<TaintSinkRuns>(), *idx};
     for (auto &c : src) {
-      auto lbl = dfsan_read_label(&c, sizeof(char));
-      if (lbl > 0)
-        output_file_.section<TaintSink>().log_single(offset_value, lbl, *idx);
+      encoder.add(offset_value, dfsan_read_label(&c, sizeof(char)));
       ++offset_value;
     }
   }
@@ -164,10 +191,9 @@ void PolyTracker::taint_sink(int fd, util::Offset offset, label_t label,
     if (label == 0) {
       return;
     }
-    for (size_t i = 0; i < length; ++i) {
-      output_file_.section<TaintSink>().log_single(offset_value + i, label,
-                                                   *idx);
-    }
+    SinkRunEncoder<TaintSinkRuns> encoder{
+        output_file_.section<TaintSinkRuns>(), *idx};
+    encoder.add_repeated(offset_value, label, length);
   }
 }
 
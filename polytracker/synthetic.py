@@ -0,0 +1,386 @@
+"""
+Generates synthetic TDAG files, for benchmarking and testing the analyses without the instrumentation toolchain
+
+The generated files are structurally valid traces: every union or range label only references smaller labels, the
+source index bitmap matches the source labels, sinks only carry existing labels and every function left in the control
+flow log was entered before. The contents are random, but the generator is deterministic for a given seed. Sections
+are generated and streamed in chunks, so traces much larger than memory can be written.
+"""
+
+from argparse import ArgumentParser, Namespace
+from ctypes import c_uint16, sizeof
+from pathlib import Path
+import sys
+from typing import BinaryIO, Iterator, List, Tuple
+
+import numpy as np
+
+from .plugins import Command
+from .taint_dag import (
+    TDControlFlowLogSection,
+    TDFDHeader,
+    TDFileWriter,
+    TDFnHeader,
+    TDSink,
+    TDSinkRun,
+)
+
+# Labels are 31 bits wide, see encoding.h
+MAX_LABELS = 1 << 31
+# Source and sink file descriptor indices are 8 bits wide, one index is used by the output
+MAX_SOURCES = (1 << 8) - 1
+
+
+def _struct_dtype(struct) -> np.dtype:
+    """A NumPy dtype with the same layout as the ctypes Structure `struct`"""
+    fields = struct._fields_
+    return np.dtype(
+        {
+            "names": [name for name, _ in fields],
+            "formats": [np.dtype(ctype) for _, ctype in fields],
+            "offsets": [getattr(struct, name).offset for name, _ in fields],
+            "itemsize": sizeof(struct),
+        }
+    )
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """Encodes non-negative integers as LEB128 varints, like the control flow log"""
+    values = values.astype(np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for i in range(1, 10):
+        lengths += values >= np.uint64(1 << (7 * i))
+    starts = np.zeros(len(values), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    encoded = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    for i in range(int(lengths.max(initial=0))):
+        selected = lengths > i
+        byte = (values[selected] >> np.uint64(7 * i)) & np.uint64(0x7F)
+        more = (lengths[selected] > i + 1).astype(np.uint64) << np.uint64(7)
+        encoded[starts[selected] + i] = byte | more
+    return encoded.tobytes()
+
+
+class SyntheticTrace:
+    """Parameters of a synthetic TDAG
+
+    Labels 1 to `sources` are the first byte of each source. After them, a `source_fraction` of the labels are
+    source labels, spread evenly and assigned to the sources round robin. The other labels are unions, or ranges with
+    probability `range_fraction`. Their parents are drawn from the `window` labels before them, so the depth of the
+    DAG grows with `labels / window`. A `control_flow_fraction` of all labels affect control flow.
+
+    `sinks` output bytes are written to a single output file, in runs of `sink_run_length` bytes carrying consecutive
+    labels. The control flow log enters `main`, then calls random functions that each branch `branches_per_call`
+    times on random labels, until it holds `control_flow_records` records.
+    """
+
+    CHUNK_SIZE = 1 << 20
+    """Number of labels, sink runs or control flow log records generated at a time"""
+
+    def __init__(
+        self,
+        labels: int = 1 << 20,
+        sources: int = 1,
+        source_fraction: float = 0.1,
+        range_fraction: float = 0.1,
+        max_range_length: int = 16,
+        window: int = 1 << 16,
+        control_flow_fraction: float = 0.01,
+        sinks: int = 1 << 12,
+        sink_run_length: int = 1,
+        run_encoded_sinks: bool = False,
+        functions: int = 16,
+        control_flow_records: int = 1 << 12,
+        branches_per_call: int = 4,
+        seed: int = 0,
+    ):
+        if not 1 <= sources <= MAX_SOURCES:
+            raise ValueError(f"sources must be in [1, {MAX_SOURCES}]")
+        if not sources < labels <= MAX_LABELS:
+            raise ValueError(f"labels must be in ({sources}, {MAX_LABELS}]")
+        if not 0 <= source_fraction <= 1 or not 0 <= range_fraction <= 1:
+            raise ValueError("source_fraction and range_fraction must be in [0, 1]")
+        if max_range_length < 1 or window < 1 or sink_run_length < 1:
+            raise ValueError(
+                "max_range_length, window and sink_run_length must be positive"
+            )
+        if functions < 2:
+            raise ValueError("at least two functions are required")
+        self.labels: int = labels
+        self.sources: int = sources
+        self.source_fraction: float = source_fraction
+        self.range_fraction: float = range_fraction
+        self.max_range_length: int = max_range_length
+        self.window: int = window
+        self.control_flow_fraction: float = control_flow_fraction
+        self.sinks: int = sinks
+        self.sink_run_length: int = min(sink_run_length, labels - 1)
+        self.run_encoded_sinks: bool = run_encoded_sinks
+        self.functions: int = functions
+        self.control_flow_records: int = control_flow_records
+        self.branches_per_call: int = branches_per_call
+        self.seed: int = seed
+
+    def _rng(self, section: int, chunk: int) -> np.random.Generator:
+        return np.random.default_rng((self.seed, section, chunk))
+
+    def _source_ordinals(self, labels: np.ndarray) -> np.ndarray:
+        """The number of source labels before each label, or -1 for labels that are not source labels"""
+        s = self.sources
+        ordinals = np.where(labels <= s, labels - 1, -1)
+        after = labels > s
+        position = labels[after] - s
+        count = np.floor(position * self.source_fraction).astype(np.int64)
+        previous = np.floor((position - 1) * self.source_fraction).astype(np.int64)
+        ordinals[after] = np.where(count > previous, s + count - 1, -1)
+        return ordinals
+
+    @property
+    def source_label_count(self) -> int:
+        return self.sources + int(
+            np.floor((self.labels - 1 - self.sources) * self.source_fraction)
+        )
+
+    def source_sizes(self) -> List[int]:
+        """The number of bytes of each source, which are all tainted"""
+        count = self.source_label_count
+        return [
+            (count - i + self.sources - 1) // self.sources for i in range(self.sources)
+        ]
+
+    def label_chunks(self) -> Iterator[bytes]:
+        for chunk, start in enumerate(range(0, self.labels, self.CHUNK_SIZE)):
+            rng = self._rng(2, chunk)
+            labels = np.arange(start, min(start + self.CHUNK_SIZE, self.labels))
+            ordinals = self._source_ordinals(labels)
+            is_source = (ordinals >= 0) & (labels > 0)
+            # Ranges are the only derived labels possible for labels 1 and 2
+            is_range = ~is_source & (
+                (rng.random(len(labels)) < self.range_fraction) | (labels < 3)
+            )
+            span = np.minimum(self.window, labels - 1).clip(min=1)
+            first_parent = labels - 1 - rng.integers(0, span)
+            second_parent = labels - 1 - rng.integers(0, span)
+
+            left = np.maximum(first_parent, second_parent)
+            right = np.minimum(first_parent, second_parent)
+            equal = left == right
+            left[equal & (left == 1)] = 2
+            right[equal] = left[equal] - 1
+            values = (left.astype(np.uint64) << np.uint64(31)) | right.astype(np.uint64)
+
+            last = first_parent
+            first = np.maximum(
+                last - rng.integers(0, self.max_range_length, len(labels)), 1
+            )
+            ranges = (first.astype(np.uint64) << np.uint64(31)) | last.astype(np.uint64)
+            values = np.where(is_range, ranges, values)
+
+            ordinals = ordinals.astype(np.uint64)
+            sources = (
+                (np.uint64(1) << np.uint64(63))
+                | ((ordinals // np.uint64(self.sources)) << np.uint64(8))
+                | (ordinals % np.uint64(self.sources))
+            )
+            values = np.where(is_source, sources, values)
+            values[rng.random(len(labels)) < self.control_flow_fraction] |= np.uint64(
+                1 << 62
+            )
+            values[labels == 0] = 0
+            yield values.tobytes()
+
+    def source_index_chunks(self) -> Iterator[bytes]:
+        # CHUNK_SIZE is a multiple of 64, so each chunk is a whole number of bitmap words
+        for start in range(0, self.labels, self.CHUNK_SIZE):
+            labels = np.arange(start, min(start + self.CHUNK_SIZE, self.labels))
+            is_source = (self._source_ordinals(labels) >= 0) & (labels > 0)
+            padded = np.zeros(-(-len(labels) // 64) * 64, dtype=bool)
+            padded[: len(labels)] = is_source
+            yield np.packbits(padded, bitorder="little").tobytes()
+
+    def _sink_runs(self) -> Iterator[np.ndarray]:
+        """Yields the (offset, length, first label) of sink runs"""
+        run_length = self.sink_run_length
+        runs = -(-self.sinks // run_length)
+        for chunk, start in enumerate(range(0, runs, self.CHUNK_SIZE)):
+            rng = self._rng(4, chunk)
+            indices = np.arange(start, min(start + self.CHUNK_SIZE, runs))
+            offsets = indices * run_length
+            lengths = np.minimum(run_length, self.sinks - offsets)
+            first_labels = rng.integers(1, self.labels - lengths + 1)
+            yield np.stack((offsets, lengths, first_labels), axis=1)
+
+    def sink_chunks(self) -> Iterator[bytes]:
+        fdidx = self.sources
+        if self.run_encoded_sinks:
+            dtype = _struct_dtype(TDSinkRun)
+            for runs in self._sink_runs():
+                entries = np.zeros(len(runs), dtype=dtype)
+                entries["offset"] = runs[:, 0]
+                entries["length"] = runs[:, 1]
+                entries["first_label"] = runs[:, 2]
+                entries["stride"] = 1
+                entries["fdidx"] = fdidx
+                yield entries.tobytes()
+        else:
+            dtype = _struct_dtype(TDSink)
+            for runs in self._sink_runs():
+                lengths = runs[:, 1]
+                starts = np.zeros(len(runs), dtype=np.int64)
+                np.cumsum(lengths[:-1], out=starts[1:])
+                position = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+                entries = np.zeros(len(position), dtype=dtype)
+                entries["offset"] = np.repeat(runs[:, 0], lengths) + position
+                entries["label"] = np.repeat(runs[:, 2], lengths) + position
+                entries["fdidx"] = fdidx
+                yield entries.tobytes()
+
+    def control_flow_chunks(self) -> Iterator[bytes]:
+        enter = TDControlFlowLogSection.ENTER_FUNCTION
+        leave = TDControlFlowLogSection.LEAVE_FUNCTION
+        branch = TDControlFlowLogSection.TAINTED_CONTROL_FLOW
+        if self.control_flow_records < 2:
+            return
+        # Each call is an enter, `branches_per_call` branches and a leave, inside of main
+        call_records = self.branches_per_call + 2
+        calls = (self.control_flow_records - 2) // call_records
+        yield encode_varints(np.array([enter, 0]))
+        chunk_calls = max(self.CHUNK_SIZE // call_records, 1)
+        for chunk, start in enumerate(range(0, calls, chunk_calls)):
+            rng = self._rng(8, chunk)
+            count = min(chunk_calls, calls - start)
+            functions = rng.integers(1, self.functions, count)
+            values = np.empty((count, 3 * self.branches_per_call + 4), dtype=np.int64)
+            values[:, 0] = enter
+            values[:, 1] = functions
+            values[:, 2:-2:3] = branch
+            values[:, 3:-2:3] = functions[:, None]
+            values[:, 4:-2:3] = rng.integers(
+                1, self.labels, (count, self.branches_per_call)
+            )
+            values[:, -2] = leave
+            values[:, -1] = functions
+            yield encode_varints(values.ravel())
+        yield encode_varints(np.array([leave, 0]))
+
+    def _strings(self) -> Tuple[bytes, List[int]]:
+        names = [f"input{i}.bin" for i in range(self.sources)] + ["output.bin", "main"]
+        names += [f"function{i}" for i in range(1, self.functions)]
+        strings = b""
+        offsets = []
+        for name in names:
+            encoded = name.encode("utf-8")
+            offsets.append(len(strings))
+            strings += bytes(c_uint16(len(encoded))) + encoded
+            strings += b"\0" * (-len(strings) % 2)
+        return strings, offsets
+
+    def write(self, file: BinaryIO) -> int:
+        """Writes the trace to the seekable `file`, returns the number of bytes written"""
+        strings, name_offsets = self._strings()
+        fds = [
+            TDFDHeader(name_offsets[i], 3 + i, size)
+            for i, size in enumerate(self.source_sizes())
+        ]
+        fds.append(TDFDHeader(name_offsets[self.sources], 3 + self.sources, self.sinks))
+        functions = name_offsets[self.sources + 1 :]
+
+        writer = TDFileWriter()
+        writer.add_section(1, 8, b"".join(bytes(fd) for fd in fds))
+        writer.add_section(2, 8, self.label_chunks())
+        writer.add_section(3, 2, strings)
+        writer.add_section(9 if self.run_encoded_sinks else 4, 8, self.sink_chunks())
+        writer.add_section(5, 8, self.source_index_chunks())
+        writer.add_section(6, 4, b"".join(bytes(TDFnHeader(o)) for o in functions))
+        writer.add_section(7, 4, b"")
+        writer.add_section(8, 1, self.control_flow_chunks())
+        return writer.write(file)
+
+
+class SynthesizeCommand(Command):
+    name = "synthesize"
+    help = "write a synthetic trace file for benchmarking and testing"
+
+    def __init_arguments__(self, parser: ArgumentParser):
+        defaults = SyntheticTrace()
+        parser.add_argument("OUTPUT", type=Path, help="path to the trace file")
+        parser.add_argument(
+            "--labels", "-l", type=int, default=defaults.labels, help="number of labels"
+        )
+        parser.add_argument(
+            "--sources", type=int, default=defaults.sources, help="number of sources"
+        )
+        parser.add_argument(
+            "--source-fraction",
+            type=float,
+            default=defaults.source_fraction,
+            help="fraction of the labels that are source labels",
+        )
+        parser.add_argument(
+            "--range-fraction",
+            type=float,
+            default=defaults.range_fraction,
+            help="fraction of the derived labels that are ranges rather than unions",
+        )
+        parser.add_argument(
+            "--window",
+            type=int,
+            default=defaults.window,
+            help="derived labels reference the labels this far before them; smaller windows make deeper DAGs",
+        )
+        parser.add_argument(
+            "--sinks",
+            "-s",
+            type=int,
+            default=defaults.sinks,
+            help="number of output bytes",
+        )
+        parser.add_argument(
+            "--sink-run-length",
+            type=int,
+            default=defaults.sink_run_length,
+            help="number of consecutive output bytes carrying consecutive labels",
+        )
+        parser.add_argument(
+            "--run-encoded-sinks",
+            action="store_true",
+            help="write a run encoded sink section",
+        )
+        parser.add_argument(
+            "--functions",
+            type=int,
+            default=defaults.functions,
+            help="number of functions",
+        )
+        parser.add_argument(
+            "--control-flow-records",
+            "-c",
+            type=int,
+            default=defaults.control_flow_records,
+            help="number of control flow log records",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=defaults.seed, help="random seed"
+        )
+
+    def run(self, args: Namespace):
+        try:
+            trace = SyntheticTrace(
+                labels=args.labels,
+                sources=args.sources,
+                source_fraction=args.source_fraction,
+                range_fraction=args.range_fraction,
+                window=args.window,
+                sinks=args.sinks,
+                sink_run_length=args.sink_run_length,
+                run_encoded_sinks=args.run_encoded_sinks,
+                functions=args.functions,
+                control_flow_records=args.control_flow_records,
+                seed=args.seed,
+            )
+        except ValueError as e:
+            sys.stderr.write(f"{e}\n")
+            return 1
+        with open(args.OUTPUT, "wb") as f:
+            size = trace.write(f)
+        print(f"Wrote {size} bytes to {args.OUTPUT}")
@@ -1,5 +1,7 @@
 from typing import (
     BinaryIO,
+    Generic,
+    TypeVar,
     Union,
     Iterable,
     Iterator,
@@ -7,12 +9,21 @@ from typing import (
     Dict,
     Tuple,
     List,
+    Sequence,
     Set,
     Type,
     cast,
 )
 
+from abc import ABC, abstractmethod
+import heapq
+import operator
+import sys
+from datetime import datetime, timezone
+from array import array
+from collections import defaultdict
 from enum import Enum
+from functools import reduce
 from pathlib import Path
 from mmap import mmap, PROT_READ
 from ctypes import (
@@ -24,24 +35,42 @@ from ctypes import (
     c_uint32,
     c_uint8,
     c_uint16,
+    alignment,
     sizeof,
 )
 
+import numpy as np
+
+from .cache import SizedLRUCache
+from .archive import (
+    DEFAULT_BLOCK_SIZE,
+    Codec,
+    TDArchive,
+    is_archive,
+    write_archive,
+)
 from .plugins import Command
+from .profiling import count
 from .repl import PolyTrackerREPL
 from .polytracker import ProgramTrace
 from .inputs import Input
 from .taint_forest import TaintForest, TaintForestNode
 from .tracing import (
     BasicBlock,
+    BasicBlockEntry,
+    ByteAccessType,
     ByteOffset,
     Function,
+    FunctionEntry,
+    FunctionReturn,
     TaintAccess,
     TraceEvent,
     TaintOutput,
     Taints,
 )
 
+T = TypeVar("T")
+
 
 class TDFileMeta(Structure):
     """TDAG File metadata.
@@ -72,10 +101,149 @@ class TDSectionMeta(Structure):
         ("align", c_uint32),
         ("offset", c_uint64),
         ("size", c_uint64),
+        # Bytes reserved for the section, recorded when the file is created
+        ("capacity", c_uint64),
     ]
 
     def __repr__(self) -> str:
-        return f"TDSectionMeta:\n\ttag: {self.tag}\n\talign: {self.align}\n\toffset: {self.offset}\n\tsize: {self.size}\n"
+        return (
+            f"TDSectionMeta:\n\ttag: {self.tag}\n\talign: {self.align}\n\toffset: {self.offset}\n\tsize: {self.size}\n"
+            f"\tcapacity: {self.capacity}\n"
+        )
+
+
+def read_section_headers(buffer) -> Tuple[TDFileMeta, List[TDSectionMeta]]:
+    """Reads the file header and the section headers following it"""
+    filemeta = TDFileMeta.from_buffer_copy(buffer)
+    if filemeta.tdag != b"TDAG":
+        raise ValueError("Not a TDAG file")
+    headers = [
+        TDSectionMeta.from_buffer_copy(
+            buffer, sizeof(TDFileMeta) + i * sizeof(TDSectionMeta)
+        )
+        for i in range(filemeta.section_count)
+    ]
+    return filemeta, headers
+
+
+SectionData = Union[bytes, memoryview, Iterable[bytes]]
+
+
+class TDFileWriter:
+    """Writes a TDAG file from raw section contents.
+
+    Sections are written in the order they are added, each directly following
+    the previous one and padded only to satisfy its alignment. This is the same
+    layout as produced by OutputFile in outputfile.h when compaction is enabled.
+    The capacity of each section is the size of its contents.
+
+    The contents of a section may also be an iterable of chunks, which are
+    streamed to the file. The section headers are then written last, so the
+    file must be seekable.
+    """
+
+    def __init__(self, magic: Optional[int] = None):
+        self.magic: Optional[int] = magic
+        self.sections: List[Tuple[int, int, SectionData]] = []
+
+    def add_section(self, tag: int, align: int, data: SectionData):
+        self.sections.append((tag, max(align, 1), data))
+
+    def compute_magic(self) -> int:
+        """Corresponds to the magic computation in OutputFile::FileMeta"""
+        return (sum(tag for tag, _, _ in self.sections) ^ len(self.sections)) & 0xFFFF
+
+    def write(self, file: BinaryIO) -> int:
+        """Writes the TDAG to `file` and returns the number of bytes written"""
+        magic = self.compute_magic() if self.magic is None else self.magic
+        filemeta = TDFileMeta(b"TDAG", magic, len(self.sections))
+        streamed = not all(
+            isinstance(data, (bytes, memoryview)) for _, _, data in self.sections
+        )
+
+        offset = sizeof(TDFileMeta) + len(self.sections) * sizeof(TDSectionMeta)
+        headers = []
+        for tag, align, data in self.sections:
+            offset += -offset % align
+            size = 0 if streamed else len(data)  # type: ignore
+            headers.append(TDSectionMeta(tag, align, offset, size, size))
+            offset += size
+
+        start = file.tell() if streamed else 0
+        file.write(bytes(filemeta))
+        for hdr in headers:
+            file.write(bytes(hdr))
+        written = sizeof(TDFileMeta) + len(headers) * sizeof(TDSectionMeta)
+        for hdr, (_, align, data) in zip(headers, self.sections):
+            if streamed:
+                hdr.offset = written + -written % align
+            file.write(b"\0" * (hdr.offset - written))
+            if isinstance(data, (bytes, memoryview)):
+                file.write(data)
+                hdr.size = len(data)
+            else:
+                hdr.size = 0
+                for chunk in data:
+                    file.write(chunk)
+                    hdr.size += len(chunk)
+            hdr.capacity = hdr.size
+            written = hdr.offset + hdr.size
+
+        if streamed:
+            file.seek(start + sizeof(TDFileMeta))
+            for hdr in headers:
+                file.write(bytes(hdr))
+            file.seek(start + written)
+        return written
+
+
+def read_sections(
+    buffer,
+) -> Tuple[int, List[Tuple[int, int, Union[bytes, memoryview]]]]:
+    """Returns the magic and the (tag, align, data) of each section in `buffer`
+
+    `buffer` may hold either a TDAG or an archive created by `archive`.
+    """
+    if is_archive(buffer):
+        tdarchive = TDArchive(buffer)
+        return tdarchive.tdag_magic, [
+            (hdr.tag, hdr.align, b"".join(tdarchive.iter_blocks(i)))
+            for i, hdr in enumerate(tdarchive.sections)
+        ]
+    filemeta, headers = read_section_headers(buffer)
+    return filemeta.magic, [
+        (hdr.tag, hdr.align, memoryview(buffer)[hdr.offset : hdr.offset + hdr.size])
+        for hdr in headers
+    ]
+
+
+def compact(src: BinaryIO, dst: BinaryIO) -> int:
+    """Rewrites the TDAG in `src` to `dst` with tightly packed sections.
+
+    The runtime reserves a fixed amount of space for each section up front, only
+    the used part of each section is copied. If `src` is an archive it is
+    expanded. Returns the size of the output.
+    """
+    magic, sections = read_sections(mmap(src.fileno(), 0, prot=PROT_READ))
+    writer = TDFileWriter(magic)
+    for tag, align, data in sections:
+        writer.add_section(tag, align, data)
+    return writer.write(dst)
+
+
+def archive(
+    src: BinaryIO,
+    dst: BinaryIO,
+    codec: Codec = Codec.ZLIB,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> int:
+    """Writes the TDAG in `src` to `dst` as a block compressed archive.
+
+    The archive can be opened directly by TDFile, see archive.py for the
+    format. Returns the size of the output.
+    """
+    magic, sections = read_sections(mmap(src.fileno(), 0, prot=PROT_READ))
+    return write_archive(dst, sections, magic, codec, block_size)
 
 
 class TDSourceSection:
@@ -90,7 +258,9 @@ class TDSourceSection:
 
     def enumerate(self):
         for offset in range(0, len(self.mem), sizeof(TDFDHeader)):
-            yield TDFDHeader.from_buffer_copy(self.mem[offset:])
+            yield TDFDHeader.from_buffer_copy(
+                self.mem[offset : offset + sizeof(TDFDHeader)]
+            )
 
 
 class TDStringSection:
@@ -105,7 +275,9 @@ class TDStringSection:
         self.align = hdr.align
 
     def read_string(self, offset):
-        n = c_uint16.from_buffer_copy(self.section[offset:]).value
+        n = c_uint16.from_buffer_copy(
+            self.section[offset : offset + sizeof(c_uint16)]
+        ).value
         assert len(self.section) >= offset + sizeof(c_uint16) + n
         return str(
             self.section[offset + sizeof(c_uint16) : offset + sizeof(c_uint16) + n],
@@ -124,11 +296,29 @@ class TDLabelSection:
         self.section = mem[hdr.offset : hdr.offset + hdr.size]
 
     def read_raw(self, label):
-        return c_uint64.from_buffer_copy(self.section, label * sizeof(c_uint64)).value
+        offset = label * sizeof(c_uint64)
+        return c_uint64.from_buffer_copy(
+            self.section[offset : offset + sizeof(c_uint64)]
+        ).value
 
     def count(self):
         return len(self.section) // sizeof(c_uint64)
 
+    def read_array(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Returns the raw values of labels [start, stop) as a uint64 array"""
+        if stop is None:
+            stop = self.count()
+        return np.frombuffer(
+            self.section[start * sizeof(c_uint64) : stop * sizeof(c_uint64)],
+            dtype=np.uint64,
+        )
+
+    def iter_raw(self, chunk_size: int = 1 << 16) -> Iterator[int]:
+        """Enumerates the raw value of every label in ascending label order"""
+        count = self.count()
+        for start in range(0, count, chunk_size):
+            yield from self.read_array(start, min(start + chunk_size, count)).tolist()
+
 
 class TDEnterFunctionEvent:
     """Emitted whenever execution enters a function.
@@ -199,19 +389,20 @@ class TDControlFlowLogSection:
     LEAVE_FUNCTION = 1
     TAINTED_CONTROL_FLOW = 2
 
+    # Number of bytes of the section decoded at a time
+    CHUNK_SIZE = 1 << 20
+
     @staticmethod
-    def _decode_varint(buffer):
+    def _decode_varint(stream: Iterator[int]) -> int:
         shift = 0
         val = 0
-        while buffer:
-            curr = c_uint8.from_buffer_copy(buffer, 0).value
+        for curr in stream:
             val |= (curr & 0x7F) << shift
             shift += 7
-            buffer = buffer[1:]
             if curr & 0x80 == 0:
                 break
 
-        return val, buffer
+        return val
 
     @staticmethod
     def _align_callstack(target_function_id, callstack):
@@ -223,13 +414,27 @@ class TDControlFlowLogSection:
         self.section = mem[hdr.offset : hdr.offset + hdr.size]
         self.funcmapping = None
 
+    def _bytes(self) -> Iterator[int]:
+        for start in range(0, len(self.section), self.CHUNK_SIZE):
+            yield from bytes(self.section[start : start + self.CHUNK_SIZE])
+
+    def records(self) -> Iterator[Tuple[int, int, int]]:
+        """Enumerates the raw (event, function id, label) records of the log
+
+        The label is zero for function enter and leave events. Function ids are
+        not translated and the callstack is not tracked.
+        """
+        stream = self._bytes()
+        for event in stream:
+            function_id = TDControlFlowLogSection._decode_varint(stream)
+            if event == TDControlFlowLogSection.TAINTED_CONTROL_FLOW:
+                yield event, function_id, TDControlFlowLogSection._decode_varint(stream)
+            else:
+                yield event, function_id, 0
+
     def __iter__(self):
-        buffer = self.section
         callstack = []
-        while buffer:
-            event = c_uint8.from_buffer_copy(buffer, 0).value
-            buffer = buffer[1:]
-            function_id, buffer = TDControlFlowLogSection._decode_varint(buffer)
+        for event, function_id, label in self.records():
             if self.funcmapping != None:
                 function_id = self.funcmapping[function_id]
 
@@ -251,7 +456,6 @@ class TDControlFlowLogSection:
                     function_id, callstack
                 )
 
-                label, buffer = TDControlFlowLogSection._decode_varint(buffer)
                 yield TDTaintedControlFlowEvent(callstack[:], label)
 
         # Drain callstack with artifical TDLeaveFunction events (using a dummy function id that doesn't exist)
@@ -266,15 +470,53 @@ class TDSinkSection:
     """TDAG Sinks section
 
     Interprets the sink entries section in a TDAG file.
-    Corresponds to TaintSinkBase in sink.h.
+    Corresponds to TaintSinkBase in sink.h. A section that outgrew its
+    reserved memory at runtime continues in extents, additional sections with
+    the same tag, that are read as if they were part of the first one.
     """
 
     def __init__(self, mem, hdr):
-        self.section = mem[hdr.offset : hdr.offset + hdr.size]
+        self.extents = [mem[hdr.offset : hdr.offset + hdr.size]]
 
-    def enumerate(self):
-        for offset in range(0, len(self.section), sizeof(TDSink)):
-            yield TDSink.from_buffer_copy(self.section[offset:])
+    def add_extent(self, mem, hdr):
+        """Appends the entries of an extent, see SinkExtents in sink.h"""
+        self.extents.append(mem[hdr.offset : hdr.offset + hdr.size])
+
+    def enumerate(self) -> Iterator["TDSink"]:
+        for extent in self.extents:
+            for offset in range(0, len(extent), sizeof(TDSink)):
+                yield TDSink.from_buffer_copy(extent[offset : offset + sizeof(TDSink)])
+
+    def runs(self) -> Iterator["TDSinkRun"]:
+        """Enumerates the sink entries coalesced into runs
+
+        Adjacent entries are merged the same way the runtime does when writing
+        a run encoded sink section, see SinkRunEncoder in sink.h.
+        """
+        return coalesce_sinks(self.enumerate())
+
+
+class TDSinkRunSection(TDSinkSection):
+    """TDAG run encoded Sinks section
+
+    Interprets the run encoded sink entries section in a TDAG file.
+    Corresponds to TaintSinkRunsBase in sink.h. Enumerating the section
+    expands each run into the individual sink entries it represents.
+    """
+
+    def __init__(self, mem, hdr):
+        super().__init__(mem, hdr)
+
+    def enumerate(self) -> Iterator["TDSink"]:
+        for run in self.runs():
+            yield from run
+
+    def runs(self) -> Iterator["TDSinkRun"]:
+        for extent in self.extents:
+            for offset in range(0, len(extent), sizeof(TDSinkRun)):
+                yield TDSinkRun.from_buffer_copy(
+                    extent[offset : offset + sizeof(TDSinkRun)]
+                )
 
 
 class TDBitmapSection:
@@ -296,7 +538,9 @@ class TDBitmapSection:
         """
         index = 0
         for offset in range(0, len(self.section), sizeof(c_uint64)):
-            bucket = c_uint64.from_buffer_copy(self.section, offset).value
+            bucket = c_uint64.from_buffer_copy(
+                self.section[offset : offset + sizeof(c_uint64)]
+            ).value
             if bucket == 0:
                 index += 64  # No bits set, just advance the bit index
             else:
@@ -323,7 +567,9 @@ class TDFunctionsSection:
 
     def __iter__(self):
         for offset in range(0, len(self.section), sizeof(TDFnHeader)):
-            yield TDFnHeader.from_buffer_copy(self.section, offset)
+            yield TDFnHeader.from_buffer_copy(
+                self.section[offset : offset + sizeof(TDFnHeader)]
+            )
 
 
 class TDEventsSection:
@@ -332,7 +578,69 @@ class TDEventsSection:
 
     def __iter__(self):
         for offset in range(0, len(self.section), sizeof(TDEvent)):
-            yield TDEvent.from_buffer_copy(self.section, offset)
+            yield TDEvent.from_buffer_copy(
+                self.section[offset : offset + sizeof(TDEvent)]
+            )
+
+
+class TDRuntimeStats(Structure):
+    """Python representation of the RuntimeStatsHeader from runtime_stats.h"""
+
+    _fields_ = [
+        ("start_time_ns", c_uint64),
+        ("duration_ns", c_uint64),
+        ("unions_requested", c_uint64),
+        ("unions_identical", c_uint64),
+        ("unions_short_circuited", c_uint64),
+        ("unions_deduplicated", c_uint64),
+        ("unions_created", c_uint64),
+        ("section_count", c_uint64),
+    ]
+
+
+class TDSectionUsage(Structure):
+    """Python representation of the SectionUsage from runtime_stats.h"""
+
+    _fields_ = [
+        ("tag", c_uint32),
+        ("reserved", c_uint32),
+        ("used", c_uint64),
+        ("capacity", c_uint64),
+    ]
+
+
+class TDRuntimeStatsSection:
+    """TDAG Runtime Statistics section.
+
+    Written by the runtime when the instrumented program exits, so it is empty
+    if the program did not exit normally. It is also empty in a slice, which
+    does not describe a run.
+    """
+
+    def __init__(self, mem, hdr):
+        self.section = mem[hdr.offset : hdr.offset + hdr.size]
+
+    @property
+    def stats(self) -> Optional[TDRuntimeStats]:
+        if len(self.section) < sizeof(TDRuntimeStats):
+            return None
+        return TDRuntimeStats.from_buffer_copy(self.section[: sizeof(TDRuntimeStats)])
+
+    @property
+    def section_usage(self) -> List[TDSectionUsage]:
+        stats = self.stats
+        if stats is None:
+            return []
+        return [
+            TDSectionUsage.from_buffer_copy(
+                self.section[offset : offset + sizeof(TDSectionUsage)]
+            )
+            for offset in range(
+                sizeof(TDRuntimeStats),
+                sizeof(TDRuntimeStats) + stats.section_count * sizeof(TDSectionUsage),
+                sizeof(TDSectionUsage),
+            )
+        ]
 
 
 class TDFDHeader(Structure):
@@ -413,6 +721,73 @@ class TDSink(Structure):
         return f"TDSink fdidx: {self.fdidx} offset: {self.offset} label: {self.label}"
 
 
+class TDSinkRun(Structure):
+    """Python representation of the SinkRunEntry from sink.h
+
+    Byte `i` of the run was written to `offset + i` and carries the label
+    `first_label + i * stride`.
+    """
+
+    _fields_ = [
+        ("offset", c_int64),
+        ("length", c_uint32),
+        ("first_label", c_uint32),
+        ("stride", c_int32),
+        ("fdidx", c_uint8),
+    ]
+
+    def label(self, i: int) -> int:
+        return self.first_label + i * self.stride
+
+    def labels(self) -> Iterator[int]:
+        """Enumerates the distinct labels of the run"""
+        if self.stride == 0:
+            yield self.first_label
+        else:
+            yield from range(self.first_label, self.label(self.length), self.stride)
+
+    def offsets(self) -> range:
+        return range(self.offset, self.offset + self.length)
+
+    def __iter__(self) -> Iterator[TDSink]:
+        for i in range(self.length):
+            yield TDSink(self.offset + i, self.label(i), self.fdidx)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __repr__(self) -> str:
+        return (
+            f"TDSinkRun fdidx: {self.fdidx} offset: {self.offset} length: {self.length} "
+            f"first label: {self.first_label} stride: {self.stride}"
+        )
+
+
+def coalesce_sinks(sinks: Iterable[TDSink]) -> Iterator[TDSinkRun]:
+    """Merges consecutive sink entries into runs, see SinkRunEncoder in sink.h"""
+    run: Optional[TDSinkRun] = None
+    for sink in sinks:
+        if (
+            run is not None
+            and sink.fdidx == run.fdidx
+            and sink.offset == run.offset + run.length
+        ):
+            if run.length == 1:
+                run.stride = sink.label - run.first_label
+                run.length = 2
+                continue
+            elif sink.label == run.label(run.length):
+                run.length += 1
+                continue
+
+        if run is not None:
+            yield run
+        run = TDSinkRun(sink.offset, 1, sink.label, 0, sink.fdidx)
+
+    if run is not None:
+        yield run
+
+
 class TDEvent(Structure):
     _fields_ = [("kind", c_uint8), ("fnidx", c_uint16)]
 
@@ -429,12 +804,28 @@ TDSection = Union[
     TDSourceSection,
     TDStringSection,
     TDSinkSection,
+    TDSinkRunSection,
     TDSourceIndexSection,
     TDFunctionsSection,
     TDEventsSection,
     TDControlFlowLogSection,
+    TDRuntimeStatsSection,
 ]
 
+SECTION_NAMES: Dict[int, str] = {
+    1: "sources",
+    2: "labels",
+    3: "strings",
+    4: "sinks",
+    5: "source label index",
+    6: "functions",
+    7: "events",
+    8: "control flow log",
+    9: "sink runs",
+    10: "runtime stats",
+}
+"""Names of the TDAG sections by tag."""
+
 
 class TDFile:
     def __init__(self, file: BinaryIO) -> None:
@@ -449,47 +840,96 @@ class TDFile:
         self.source_offset_mask = (1 << 54) - 1
 
         self.buffer = mmap(file.fileno(), 0, prot=PROT_READ)
-
-        self.filemeta = TDFileMeta.from_buffer_copy(self.buffer)
-        section_offset = sizeof(TDFileMeta)
+        count("tdag.bytes_mapped", len(self.buffer))
+
+        # Sections are read through `mem`. For a plain TDAG it is a view of the
+        # mapped file, for an archive it decompresses blocks on demand.
+        self.mem: Union[memoryview, TDArchive]
+        self.archive: Optional[TDArchive] = None
+        if is_archive(self.buffer):
+            self.archive = TDArchive(self.buffer)
+            self.mem = self.archive
+            self.filemeta = TDFileMeta(
+                b"TDAG", self.archive.tdag_magic, len(self.archive.section_headers)
+            )
+            self.section_headers = [
+                TDSectionMeta(tag, align, offset, size, size)
+                for tag, align, offset, size in self.archive.section_headers
+            ]
+        else:
+            self.mem = memoryview(self.buffer)
+            self.filemeta, self.section_headers = read_section_headers(self.buffer)
         self.sections: List[TDSection] = []
         self.sections_by_type: Dict[Type[TDSection], TDSection] = {}
-        for i in range(0, self.filemeta.section_count):
-            hdr = TDSectionMeta.from_buffer_copy(self.buffer, section_offset)
-            if hdr.tag == 1:
-                self.sections.append(TDSourceSection(self.buffer, hdr))
+        for hdr in self.section_headers:
+            sinks = self.sections_by_type.get(TDSinkSection)
+            if hdr.tag in (4, 9) and isinstance(sinks, TDSinkSection):
+                sinks.add_extent(self.mem, hdr)
+            elif hdr.tag == 1:
+                self.sections.append(TDSourceSection(self.mem, hdr))
                 self.sections_by_type[TDSourceSection] = self.sections[-1]
             elif hdr.tag == 2:
-                self.sections.append(TDLabelSection(self.buffer, hdr))
+                self.sections.append(TDLabelSection(self.mem, hdr))
                 self.sections_by_type[TDLabelSection] = self.sections[-1]
             elif hdr.tag == 3:
-                self.sections.append(TDStringSection(self.buffer, hdr))
+                self.sections.append(TDStringSection(self.mem, hdr))
                 self.sections_by_type[TDStringSection] = self.sections[-1]
             elif hdr.tag == 4:
-                self.sections.append(TDSinkSection(self.buffer, hdr))
+                self.sections.append(TDSinkSection(self.mem, hdr))
                 self.sections_by_type[TDSinkSection] = self.sections[-1]
             elif hdr.tag == 5:
-                self.sections.append(TDSourceIndexSection(self.buffer, hdr))
+                self.sections.append(TDSourceIndexSection(self.mem, hdr))
                 self.sections_by_type[TDSourceIndexSection] = self.sections[-1]
             elif hdr.tag == 6:
-                self.sections.append(TDFunctionsSection(self.buffer, hdr))
+                self.sections.append(TDFunctionsSection(self.mem, hdr))
                 self.sections_by_type[TDFunctionsSection] = self.sections[-1]
             elif hdr.tag == 7:
-                self.sections.append(TDEventsSection(self.buffer, hdr))
+                self.sections.append(TDEventsSection(self.mem, hdr))
                 self.sections_by_type[TDEventsSection] = self.sections[-1]
             elif hdr.tag == 8:
-                self.sections.append(TDControlFlowLogSection(self.buffer, hdr))
+                self.sections.append(TDControlFlowLogSection(self.mem, hdr))
                 self.sections_by_type[TDControlFlowLogSection] = self.sections[-1]
+            elif hdr.tag == 9:
+                # Run encoded sinks are decoded transparently by the sink section
+                self.sections.append(TDSinkRunSection(self.mem, hdr))
+                self.sections_by_type[TDSinkSection] = self.sections[-1]
+            elif hdr.tag == 10:
+                self.sections.append(TDRuntimeStatsSection(self.mem, hdr))
+                self.sections_by_type[TDRuntimeStatsSection] = self.sections[-1]
             else:
                 raise NotImplementedError("Unsupported section tag")
 
-            section_offset += sizeof(TDSectionMeta)
-
         self.raw_nodes: Dict[int, int] = {}
         self.sink_cache: Dict[int, TDSink] = {}
 
         self.fd_headers: List[Tuple[Path, TDFDHeader]] = list(self.read_fd_headers())
         self.fn_headers: List[Tuple[str, TDFnHeader]] = list(self.read_fn_headers())
+        self._resolver: Optional["TDLabelResolver"] = None
+
+    @property
+    def runtime_stats(self) -> Optional[TDRuntimeStats]:
+        """Statistics recorded by the runtime, if any"""
+        section = self.sections_by_type.get(TDRuntimeStatsSection)
+        if section is None:
+            return None
+        assert isinstance(section, TDRuntimeStatsSection)
+        return section.stats
+
+    @property
+    def section_usage(self) -> List[TDSectionUsage]:
+        """How much of the memory reserved for each section the runtime used"""
+        section = self.sections_by_type.get(TDRuntimeStatsSection)
+        if section is None:
+            return []
+        assert isinstance(section, TDRuntimeStatsSection)
+        return section.section_usage
+
+    @property
+    def resolver(self) -> "TDLabelResolver":
+        """The label resolver shared by all analyses of this file"""
+        if self._resolver is None:
+            self._resolver = TDLabelResolver(self)
+        return self._resolver
 
     def _get_section(self, wanted_type: Type[TDSection]) -> TDSection:
         return self.sections_by_type[wanted_type]
@@ -569,8 +1009,16 @@ class TDFile:
         assert isinstance(sink_section, TDSinkSection)
         yield from sink_section.enumerate()
 
+    @property
+    def sink_runs(self) -> Iterator[TDSinkRun]:
+        sink_section = self.sections_by_type[TDSinkSection]
+        assert isinstance(sink_section, TDSinkSection)
+        yield from sink_section.runs()
+
     def read_event(self, offset: int) -> TDEvent:
-        return TDEvent.from_buffer_copy(self.buffer, offset)
+        return TDEvent.from_buffer_copy(
+            bytes(self.mem[offset : offset + sizeof(TDEvent)])
+        )
 
     @property
     def events(self) -> Iterator[TDEvent]:
@@ -579,6 +1027,903 @@ class TDFile:
         yield from events_section
 
 
+# The default number of intervals the cache of a TDLabelResolver holds
+DEFAULT_RESOLVER_CACHE = 1 << 20
+
+# A half open interval [begin, end) of bytes of the source with index `idx`: (idx, begin, end)
+SourceInterval = Tuple[int, int, int]
+
+
+def merge_source_intervals(
+    intervals: Iterable[SourceInterval],
+) -> Tuple[SourceInterval, ...]:
+    """Sorts intervals and coalesces those of the same source that overlap or are adjacent"""
+    merged: List[List[int]] = []
+    for idx, begin, end in sorted(intervals):
+        if merged and merged[-1][0] == idx and begin <= merged[-1][2]:
+            merged[-1][2] = max(merged[-1][2], end)
+        else:
+            merged.append([idx, begin, end])
+    return tuple((idx, begin, end) for idx, begin, end in merged)
+
+
+class TDLabelResolver:
+    """Resolves labels to the intervals of source bytes they are derived from
+
+    The intervals of resolved labels are cached, and a label is resolved by
+    merging the cached intervals of the labels it references, so resolving
+    labels that share ancestors only decodes the labels that are not cached
+    yet. The cache is bounded by the total number of intervals it holds, and
+    evicts the least recently used labels.
+    """
+
+    def __init__(
+        self, tdfile: TDFile, max_intervals: Optional[int] = DEFAULT_RESOLVER_CACHE
+    ):
+        self.tdfile: TDFile = tdfile
+        self.cache: SizedLRUCache[int, Tuple[SourceInterval, ...]] = SizedLRUCache(
+            max_intervals, lambda intervals: len(intervals) + 1
+        )
+        self.hits: int = 0
+        """Number of labels resolved from the cache."""
+        self.misses: int = 0
+        """Number of labels that had to be decoded to be resolved."""
+
+    def resolve(self, label: int) -> Tuple[SourceInterval, ...]:
+        if label == 0:
+            return ()
+        cache = self.cache
+        cached = cache.get(label, None)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        # Mark the labels `label` is derived from, in descending label order,
+        # down to labels that are cached, counting how many labels in the
+        # closure reference each of them. The intervals of cached labels are
+        # pinned, so they can not be evicted before they are merged.
+        pinned: Dict[int, Tuple[SourceInterval, ...]] = {0: ()}
+        references: Dict[int, int] = {label: 0}
+        decoded: List[int] = []
+        heap = [-label]
+        while heap:
+            current = -heapq.heappop(heap)
+            decoded.append(current)
+            for parent in self._parents(self.tdfile.decode_node(current)):
+                if parent in references:
+                    references[parent] += 1
+                    continue
+                references[parent] = 1
+                cached = cache.get(parent, None)
+                if cached is not None:
+                    pinned[parent] = cached
+                elif parent != 0:
+                    heapq.heappush(heap, -parent)
+        # A label is greater than the labels it references, so resolving the
+        # marked labels in ascending order merges intervals that are all known.
+        # The intervals of a label are only held until the last label in the
+        # closure referencing it is resolved, so however large the closure is,
+        # only the intervals still needed are held.
+        intervals: Tuple[SourceInterval, ...] = ()
+        for current in reversed(decoded):
+            node = self.tdfile.decode_node(current)
+            if isinstance(node, TDSourceNode):
+                intervals = ((node.idx, node.offset, node.offset + 1),)
+            else:
+                parents = self._parents(node)
+                intervals = merge_source_intervals(
+                    interval for parent in parents for interval in pinned[parent]
+                )
+                for parent in parents:
+                    references[parent] -= 1
+                    if references[parent] == 0 and parent != 0:
+                        del pinned[parent]
+            cache[current] = intervals
+            if references[current] > 0:
+                pinned[current] = intervals
+        return intervals
+
+    @staticmethod
+    def _parents(node: TDNode) -> Sequence[int]:
+        """Returns the labels `node` references"""
+        if isinstance(node, TDUnionNode):
+            return (node.left, node.right)
+        if isinstance(node, TDRangeNode):
+            return range(node.first, node.last + 1)
+        return ()
+
+    def resolve_all(self, labels: Iterable[int]) -> Tuple[SourceInterval, ...]:
+        """Returns the union of the intervals of all `labels`"""
+        return merge_source_intervals(
+            interval for label in set(labels) for interval in self.resolve(label)
+        )
+
+
+def backward_closure(tdfile: TDFile, labels: Iterable[int]) -> bytearray:
+    """Marks every label that any of `labels` is derived from, including themselves
+
+    Returns a bytearray indexed by label that is non-zero for labels in the
+    closure. A union or range label is always greater than the labels it
+    references, so a single pass in descending label order suffices.
+    """
+    marked = bytearray(tdfile.label_count)
+    for label in labels:
+        marked[label] = 1
+    marked[0] = 0
+
+    label = len(marked)
+    while True:
+        label = marked.rfind(1, 0, label)
+        if label <= 0:
+            break
+        node = tdfile.decode_node(label)
+        if isinstance(node, TDUnionNode):
+            marked[node.left] = marked[node.right] = 1
+        elif isinstance(node, TDRangeNode):
+            marked[node.first : node.last + 1] = b"\1" * (node.last - node.first + 1)
+    return marked
+
+
+def slice_tdag(
+    tdfile: TDFile,
+    dst: BinaryIO,
+    sink_offsets: Iterable[int] = (),
+    labels: Iterable[int] = (),
+) -> int:
+    """Writes the provenance of the selected sinks and labels in `tdfile` to `dst`
+
+    Sinks written to any of `sink_offsets` or carrying any of `labels` are kept,
+    along with every label they are derived from and the sources they refer to.
+    Labels are renumbered densely in their original order, so a label still
+    references only smaller labels. Functions, events and the control flow log
+    are left empty. Returns the size of the output.
+    """
+    offsets = set(sink_offsets)
+    roots = set(labels)
+    sinks = [s for s in tdfile.sinks if s.offset in offsets or s.label in roots]
+    marked = backward_closure(tdfile, roots.union(s.label for s in sinks))
+
+    new_labels: Dict[int, int] = {0: 0}
+    label = marked.find(1)
+    while label > 0:
+        new_labels[label] = len(new_labels)
+        label = marked.find(1, label + 1)
+
+    source_bit = 1 << tdfile.source_taint_bit_shift
+    used_fds = {s.fdidx for s in sinks}
+    for label in new_labels:
+        raw = tdfile.read_node(label)
+        if raw & source_bit:
+            used_fds.add(raw & tdfile.source_index_mask)
+    new_fds = {old: new for new, old in enumerate(sorted(used_fds))}
+
+    strings_section = tdfile.sections_by_type[TDStringSection]
+    assert isinstance(strings_section, TDStringSection)
+    strings = bytearray()
+    sources = bytearray()
+    for fdidx in new_fds:
+        hdr = tdfile.fd_headers[fdidx][1]
+        name = strings_section.read_string(hdr.name_offset).encode("utf-8")
+        sources += bytes(TDFDHeader(len(strings), hdr.fd, hdr.size))
+        strings += bytes(c_uint16(len(name))) + name
+        strings += b"\0" * (-len(strings) % strings_section.align)
+
+    nodes = (c_uint64 * len(new_labels))()
+    source_index = (c_uint64 * ((len(new_labels) + 63) // 64))()
+    cf_bit = 1 << tdfile.affects_control_flow_bit_shift
+    for old, new in new_labels.items():
+        if old == 0:
+            continue
+        raw = tdfile.read_node(old)
+        if raw & source_bit:
+            fdidx = raw & tdfile.source_index_mask
+            nodes[new] = raw ^ fdidx | new_fds[fdidx]
+            source_index[new // 64] |= 1 << (new % 64)
+        else:
+            v1 = new_labels[(raw >> tdfile.val1_shift) & tdfile.label_mask]
+            v2 = new_labels[raw & tdfile.label_mask]
+            nodes[new] = raw & cf_bit | v1 << tdfile.val1_shift | v2
+
+    runs = b"".join(
+        bytes(run)
+        for run in coalesce_sinks(
+            TDSink(s.offset, new_labels[s.label], new_fds[s.fdidx]) for s in sinks
+        )
+    )
+
+    contents = {1: sources, 2: nodes, 3: strings, 5: source_index}
+    writer = TDFileWriter()
+    sinks_written = False
+    for hdr in tdfile.section_headers:
+        if hdr.tag in (4, 9):
+            # Sink extents are merged into a single section
+            if not sinks_written:
+                writer.add_section(9, alignment(TDSinkRun), runs)
+                sinks_written = True
+        else:
+            writer.add_section(hdr.tag, hdr.align, bytes(contents.get(hdr.tag, b"")))
+    return writer.write(dst)
+
+
+class LabelFold(ABC, Generic[T]):
+    """A per-label property computed from the properties of the labels it references
+
+    `fold_labels` computes the property of every label in ascending label order.
+    A union or range label is always greater than the labels it references, so
+    their properties are always known by the time they are combined.
+    """
+
+    def __init__(self, untainted: T):
+        self.untainted: T = untainted
+
+    @abstractmethod
+    def source(self, label: int, index: int, offset: int) -> T:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def union(self, label: int, left: T, right: T) -> T:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def range(self, label: int, values: List[T]) -> T:
+        """Combines the properties of all labels in a range
+
+        Folds without a cheaper way to combine a range can call this
+        implementation, which nests unions.
+        """
+        return reduce(lambda left, right: self.union(label, left, right), values)
+
+
+def fold_labels(tdfile: TDFile, fold: LabelFold[T]) -> List[T]:
+    """Computes `fold` for every label in a single pass over the label section
+
+    Returns a list indexed by label.
+    """
+    label_section = tdfile.sections_by_type[TDLabelSection]
+    assert isinstance(label_section, TDLabelSection)
+
+    source_bit = 1 << tdfile.source_taint_bit_shift
+    label_mask = tdfile.label_mask
+    val1_shift = tdfile.val1_shift
+    index_mask = tdfile.source_index_mask
+    offset_mask = tdfile.source_offset_mask
+    index_bits = tdfile.source_index_bits
+
+    values: List[T] = []
+    for label, raw in enumerate(label_section.iter_raw()):
+        if label == 0:
+            values.append(fold.untainted)
+        elif raw & source_bit:
+            values.append(
+                fold.source(label, raw & index_mask, (raw >> index_bits) & offset_mask)
+            )
+        else:
+            v1 = (raw >> val1_shift) & label_mask
+            v2 = raw & label_mask
+            if v1 > v2:
+                values.append(fold.union(label, values[v1], values[v2]))
+            else:
+                values.append(fold.range(label, values[v1 : v2 + 1]))
+    return values
+
+
+def source_counts(tdfile: TDFile) -> List[int]:
+    """Returns the number of distinct source bytes each label is derived from
+
+    The counts are the sizes of the intervals `tdfile.resolver` resolves each
+    label to. Labels are resolved in ascending order, so the labels a label
+    references were resolved just before it and are usually still cached.
+    Memory is bounded by the resolver cache rather than by the number of
+    labels times the number of source labels.
+    """
+    resolver = tdfile.resolver
+    return [
+        sum(end - begin for _, begin, end in resolver.resolve(label))
+        for label in range(tdfile.label_count)
+    ]
+
+
+class TDLabelArrays:
+    """The label section of a TDAG decoded into NumPy arrays indexed by label
+
+    For unions `left` and `right` hold the referenced labels, for ranges they
+    hold the first and last label of the range.
+    """
+
+    def __init__(self, tdfile: TDFile):
+        label_section = tdfile.sections_by_type[TDLabelSection]
+        assert isinstance(label_section, TDLabelSection)
+        raw = label_section.read_array()
+
+        self.is_source: np.ndarray = (
+            raw >> np.uint64(tdfile.source_taint_bit_shift)
+        ).astype(bool)
+        self.affects_control_flow: np.ndarray = (
+            (raw >> np.uint64(tdfile.affects_control_flow_bit_shift)) & np.uint64(1)
+        ).astype(bool)
+        self.left: np.ndarray = (
+            (raw >> np.uint64(tdfile.val1_shift)) & np.uint64(tdfile.label_mask)
+        ).astype(np.int64)
+        self.right: np.ndarray = (raw & np.uint64(tdfile.label_mask)).astype(np.int64)
+        self.source_index: np.ndarray = (
+            raw & np.uint64(tdfile.source_index_mask)
+        ).astype(np.int64)
+        self.source_offset: np.ndarray = (
+            (raw >> np.uint64(tdfile.source_index_bits))
+            & np.uint64(tdfile.source_offset_mask)
+        ).astype(np.int64)
+
+        derived = ~self.is_source
+        derived[:1] = False  # label 0 is untainted
+        self.is_union: np.ndarray = derived & (self.left > self.right)
+        self.is_range: np.ndarray = derived & (self.left <= self.right)
+        self.left[self.is_source] = 0
+        self.right[self.is_source] = 0
+
+    def __len__(self) -> int:
+        return len(self.is_source)
+
+    def max_child(self) -> np.ndarray:
+        """The largest label referenced by each label, or -1 if none"""
+        result = np.full(len(self), -1, dtype=np.int64)
+        result[self.is_union] = self.left[self.is_union]
+        result[self.is_range] = self.right[self.is_range]
+        return result
+
+
+# Python equivalents of ufuncs, used when folding a few labels at a time
+_SCALAR_UFUNCS = {np.maximum: max, np.minimum: min, np.add: operator.add}
+
+
+def reduce_labels(
+    arrays: TDLabelArrays,
+    initial: np.ndarray,
+    ufunc: np.ufunc,
+    increment: int = 0,
+) -> np.ndarray:
+    """Vectorized `fold_labels` for properties combined with a binary NumPy ufunc
+
+    The value of a union or range label is `ufunc` reduced over the values of the
+    labels it references plus `increment`. `initial` holds the values of source
+    labels and label 0, the values of other labels are ignored.
+
+    Consecutive labels that only reference labels before them are computed
+    together. Where labels mostly reference the label just before them, such
+    batches get too small to be worth vectorizing and labels are instead
+    computed one at a time for a while.
+    """
+    values = initial.copy()
+    max_child = arrays.max_child()
+    left = arrays.left
+    right = arrays.right
+    n = len(values)
+
+    combine = _SCALAR_UFUNCS.get(ufunc, ufunc)
+    scalar_kind: Optional[List[int]] = None
+
+    start = 1
+    window = 64
+    while start < n:
+        stop = min(start + window, n)
+        blocked = np.flatnonzero(max_child[start:stop] >= start)
+        if blocked.size:
+            if blocked[0] == 0:
+                raise ValueError(f"Label {start} does not reference smaller labels")
+            stop = start + int(blocked[0])
+            window = max(64, window // 2)
+        else:
+            window *= 2
+
+        if stop - start < 16:
+            if scalar_kind is None:
+                # 1 for unions, 2 for ranges
+                scalar_kind = (arrays.is_union + 2 * arrays.is_range).tolist()
+                scalar_left = left.tolist()
+                scalar_right = right.tolist()
+            stop = min(start + 1024, n)
+            for label in range(start, stop):
+                kind = scalar_kind[label]
+                if kind == 1:
+                    values[label] = (
+                        combine(
+                            values.item(scalar_left[label]),
+                            values.item(scalar_right[label]),
+                        )
+                        + increment
+                    )
+                elif kind == 2:
+                    first, last = scalar_left[label], scalar_right[label]
+                    values[label] = ufunc.reduce(values[first : last + 1]) + increment
+            start = stop
+            continue
+
+        unions = np.flatnonzero(arrays.is_union[start:stop]) + start
+        if unions.size:
+            values[unions] = (
+                ufunc(values[left[unions]], values[right[unions]]) + increment
+            )
+
+        ranges = np.flatnonzero(arrays.is_range[start:stop]) + start
+        if ranges.size:
+            lengths = right[ranges] - left[ranges] + 1
+            offsets = np.zeros(len(ranges), dtype=np.int64)
+            np.cumsum(lengths[:-1], out=offsets[1:])
+            members = np.arange(lengths.sum()) + np.repeat(
+                left[ranges] - offsets, lengths
+            )
+            values[ranges] = ufunc.reduceat(values[members], offsets) + increment
+
+        start = stop
+    return values
+
+
+def label_depths(arrays: TDLabelArrays) -> np.ndarray:
+    """The length of the longest path from each label to a source label"""
+    return reduce_labels(
+        arrays, np.zeros(len(arrays), dtype=np.int64), np.maximum, increment=1
+    )
+
+
+def min_source_offsets(arrays: TDLabelArrays) -> np.ndarray:
+    """The smallest source offset each label is derived from
+
+    Offsets of different sources are not distinguished. Label 0 has the largest
+    int64 value.
+    """
+    initial = np.where(arrays.is_source, arrays.source_offset, np.iinfo(np.int64).max)
+    return reduce_labels(arrays, initial, np.minimum)
+
+
+def max_source_offsets(arrays: TDLabelArrays) -> np.ndarray:
+    """The largest source offset each label is derived from
+
+    Offsets of different sources are not distinguished. Label 0 has the value -1.
+    """
+    initial = np.where(arrays.is_source, arrays.source_offset, -1)
+    return reduce_labels(arrays, initial, np.maximum)
+
+
+def reachable_labels(arrays: TDLabelArrays, labels: Iterable[int]) -> np.ndarray:
+    """Vectorized `backward_closure`, returns a boolean array indexed by label
+
+    Labels are visited in descending windows. The marked labels of a window
+    are expanded together if none of them references a label in the same
+    window, otherwise the window is cut above the largest such reference.
+    Where windows get too small to be worth vectorizing, labels are expanded
+    one at a time for a while, like in `reduce_labels`.
+    """
+    marked = np.zeros(len(arrays), dtype=bool)
+    marked[np.fromiter(labels, dtype=np.int64)] = True
+    marked[0] = False
+    max_child = arrays.max_child()
+    left = arrays.left
+    right = arrays.right
+    scalar_kind: Optional[List[int]] = None
+
+    stop = len(marked)
+    window = 64
+    while stop > 1:
+        start = max(stop - window, 1)
+        batch = np.flatnonzero(marked[start:stop]) + start
+        blocked = batch[max_child[batch] >= start]
+        if blocked.size:
+            start = int(max_child[blocked].max()) + 1
+            batch = batch[batch >= start]
+            window = max(64, window // 2)
+        else:
+            window *= 2
+
+        if stop - start < 16:
+            if scalar_kind is None:
+                # 1 for unions, 2 for ranges
+                scalar_kind = (arrays.is_union + 2 * arrays.is_range).tolist()
+                scalar_left = left.tolist()
+                scalar_right = right.tolist()
+            start = max(stop - 1024, 1)
+            for label in range(stop - 1, start - 1, -1):
+                if not marked[label]:
+                    continue
+                kind = scalar_kind[label]
+                if kind == 1:
+                    marked[scalar_left[label]] = marked[scalar_right[label]] = True
+                elif kind == 2:
+                    marked[scalar_left[label] : scalar_right[label] + 1] = True
+            stop = start
+            continue
+
+        unions = batch[arrays.is_union[batch]]
+        marked[left[unions]] = True
+        marked[right[unions]] = True
+
+        ranges = batch[arrays.is_range[batch]]
+        if ranges.size:
+            lengths = right[ranges] - left[ranges] + 1
+            offsets = np.zeros(len(ranges), dtype=np.int64)
+            np.cumsum(lengths[:-1], out=offsets[1:])
+            marked[
+                np.arange(lengths.sum()) + np.repeat(left[ranges] - offsets, lengths)
+            ] = True
+
+        stop = start
+    marked[0] = False
+    return marked
+
+
+def source_bitmaps(
+    tdfile: TDFile, arrays: TDLabelArrays, labels: np.ndarray
+) -> Dict[Path, np.ndarray]:
+    """Marks the source bytes of the source labels selected by the boolean array `labels`
+
+    Returns a boolean array indexed by offset for every source path. Sources
+    opened more than once share a path, and their bitmaps are merged.
+    """
+    selected = labels & arrays.is_source
+    indices = arrays.source_index[selected]
+    offsets = arrays.source_offset[selected]
+    result: Dict[Path, np.ndarray] = {}
+    for idx, (path, header) in enumerate(tdfile.fd_headers):
+        source_offsets = offsets[indices == idx]
+        size = max(
+            header.size, int(source_offsets.max()) + 1 if source_offsets.size else 0
+        )
+        bitmap = result.get(path, np.zeros(0, dtype=bool))
+        if len(bitmap) < size:
+            bitmap = np.concatenate((bitmap, np.zeros(size - len(bitmap), dtype=bool)))
+        bitmap[source_offsets] = True
+        result[path] = bitmap
+    return result
+
+
+def derived_labels(arrays: TDLabelArrays, sources: np.ndarray) -> np.ndarray:
+    """Marks every label derived from the source labels selected by the boolean array `sources`
+
+    Returns a boolean array indexed by label, the forward counterpart of
+    `reachable_labels`. Only the source labels of `sources` are considered.
+    """
+    initial = (sources & arrays.is_source).astype(np.uint8)
+    return reduce_labels(arrays, initial, np.maximum).astype(bool)
+
+
+def sink_bytes(tdfile: TDFile) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The file descriptor index, offset and label of every output byte, in sink log order"""
+    runs = list(tdfile.sink_runs)
+    if not runs:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    fields = np.array(
+        [(r.fdidx, r.offset, r.length, r.first_label, r.stride) for r in runs],
+        dtype=np.int64,
+    )
+    fdidx, offset, length, first_label, stride = fields.T
+    starts = np.zeros(len(runs), dtype=np.int64)
+    np.cumsum(length[:-1], out=starts[1:])
+    position = np.arange(length.sum()) - np.repeat(starts, length)
+    return (
+        np.repeat(fdidx, length),
+        np.repeat(offset, length) + position,
+        np.repeat(first_label, length) + position * np.repeat(stride, length),
+    )
+
+
+def sink_bitmaps(tdfile: TDFile) -> Tuple[Dict[Path, np.ndarray], np.ndarray]:
+    """Marks the output bytes of every sink path
+
+    Returns a boolean array indexed by offset for every sink path, and the
+    distinct labels written to the sinks.
+    """
+    byte_fds, byte_offsets, byte_labels = sink_bytes(tdfile)
+    result: Dict[Path, np.ndarray] = {}
+    for idx in np.unique(byte_fds).tolist():
+        path = tdfile.fd_headers[idx][0]
+        sink_offsets = byte_offsets[byte_fds == idx]
+        size = int(sink_offsets.max()) + 1
+        bitmap = result.get(path, np.zeros(0, dtype=bool))
+        if len(bitmap) < size:
+            bitmap = np.concatenate((bitmap, np.zeros(size - len(bitmap), dtype=bool)))
+        bitmap[sink_offsets] = True
+        result[path] = bitmap
+    return result, np.unique(byte_labels)
+
+
+class TDEventIndex:
+    """An index of the trace events of a TDAG, built in one pass over the control flow log
+
+    The control flow log only records function entries, function exits and
+    tainted control flow. The index turns these records into a sequence of
+    trace events, where the event uid is the position in the sequence:
+
+    * a function entry, immediately followed by the basic block entry of the
+      first block of the function (index 0),
+    * a tainted control flow event for every branch that depended on tainted
+      data, belonging to the preceding basic block,
+    * a function return, immediately followed by a basic block entry in the
+      caller. As the log does not record call sites, the block is identified by
+      the function that was returned from (index `function id + 1`).
+
+    Returns missing from the log are synthesized, so every entry has a return.
+    Each event is stored as a handful of integers in arrays, so any event can
+    be looked up by uid in constant time without materializing event objects.
+    """
+
+    FUNCTION_ENTRY = 0
+    FUNCTION_RETURN = 1
+    BASIC_BLOCK_ENTRY = 2
+    TAINTED_CONTROL_FLOW = 3
+
+    def __init__(self, records: Iterable[Tuple[int, int, int]]):
+        """`records` are the raw (event, function id, label) records of the log"""
+        self.kinds = array("B")
+        # The function the event occurred in (the callee for entries and returns)
+        self.functions = array("i")
+        # The uid of the function entry of the frame the event occurred in
+        self.frames = array("q")
+        # The return uid for entries, the entry uid for returns, the block index
+        # for basic block entries and the label for tainted control flow
+        self.values = array("q")
+        # The number of times a basic block was previously entered in its frame
+        self.entry_counts = array("I")
+        # (caller, callee) function ids, the caller of the first function is -1
+        self.calls: Set[Tuple[int, int]] = set()
+        # (function id, block index) of every basic block entered
+        self.basic_blocks: Set[Tuple[int, int]] = set()
+        self.num_accesses: int = 0
+
+        # (entry uid, function id, entries per block index) of each active frame
+        stack: List[Tuple[int, int, Dict[int, int]]] = []
+        # Number of active frames of each function
+        active: Dict[int, int] = {}
+        for event, function_id, label in records:
+            if event == TDControlFlowLogSection.ENTER_FUNCTION:
+                self.calls.add((stack[-1][1] if stack else -1, function_id))
+                uid = self._append(
+                    TDEventIndex.FUNCTION_ENTRY, function_id, len(self.kinds), -1
+                )
+                stack.append((uid, function_id, {}))
+                active[function_id] = active.get(function_id, 0) + 1
+                self._enter_block(stack, 0)
+            elif not active.get(function_id):
+                if event == TDControlFlowLogSection.TAINTED_CONTROL_FLOW:
+                    # Attribute it to the current frame, if there is one
+                    self._append_control_flow(stack, label)
+                # Leaving a function that was never entered is ignored
+            else:
+                # Synthesize returns until the function is at the top of the stack
+                while stack[-1][1] != function_id:
+                    self._leave(stack, active)
+                if event == TDControlFlowLogSection.LEAVE_FUNCTION:
+                    self._leave(stack, active)
+                else:
+                    self._append_control_flow(stack, label)
+        while stack:
+            self._leave(stack, active)
+
+    def _append(
+        self, kind: int, function_id: int, frame: int, value: int, count: int = 0
+    ) -> int:
+        self.kinds.append(kind)
+        self.functions.append(function_id)
+        self.frames.append(frame)
+        self.values.append(value)
+        self.entry_counts.append(count)
+        return len(self.kinds) - 1
+
+    def _append_control_flow(
+        self, stack: List[Tuple[int, int, Dict[int, int]]], label: int
+    ):
+        if stack:
+            entry, function_id, _ = stack[-1]
+        else:
+            entry, function_id = -1, -1
+        self._append(TDEventIndex.TAINTED_CONTROL_FLOW, function_id, entry, label)
+        self.num_accesses += 1
+
+    def _enter_block(self, stack: List[Tuple[int, int, Dict[int, int]]], index: int):
+        entry, function_id, counts = stack[-1]
+        count = counts.get(index, 0)
+        counts[index] = count + 1
+        self.basic_blocks.add((function_id, index))
+        self._append(TDEventIndex.BASIC_BLOCK_ENTRY, function_id, entry, index, count)
+
+    def _leave(
+        self, stack: List[Tuple[int, int, Dict[int, int]]], active: Dict[int, int]
+    ):
+        entry, function_id, _ = stack.pop()
+        active[function_id] -= 1
+        self.values[entry] = self._append(
+            TDEventIndex.FUNCTION_RETURN, function_id, entry, entry
+        )
+        if stack:
+            self._enter_block(stack, function_id + 1)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def uids(self, kind: int, function_id: Optional[int] = None) -> np.ndarray:
+        """Returns the uids of all events of `kind`, optionally only those in a function"""
+        mask = np.frombuffer(self.kinds, dtype=np.uint8) == kind
+        if function_id is not None:
+            mask &= np.frombuffer(self.functions, dtype=np.int32) == function_id
+        return np.flatnonzero(mask)
+
+
+class TDFunction(Function):
+    def __init__(self, trace: "TDProgramTrace", name: str, function_id: int):
+        super().__init__(name, function_id)
+        self.trace: TDProgramTrace = trace
+
+    def taints(self) -> Taints:
+        index = self.trace.event_index
+        return self.trace.label_taints(
+            index.values[uid]
+            for uid in index.uids(
+                TDEventIndex.TAINTED_CONTROL_FLOW, self.function_index
+            ).tolist()
+        )
+
+    def calls_to(self) -> Set[Function]:
+        return {
+            self.trace.function_by_id(callee)
+            for caller, callee in self.trace.event_index.calls
+            if caller == self.function_index
+        }
+
+    def called_from(self) -> Set[Function]:
+        return {
+            self.trace.function_by_id(caller)
+            for caller, callee in self.trace.event_index.calls
+            if callee == self.function_index and caller >= 0
+        }
+
+
+class TDBasicBlock(BasicBlock):
+    def __init__(self, trace: "TDProgramTrace", function: Function, index: int):
+        super().__init__(function, index)
+        self.trace: TDProgramTrace = trace
+
+    def entries(self) -> Iterator["TDBasicBlockEntry"]:
+        index = self.trace.event_index
+        for uid in index.uids(
+            TDEventIndex.BASIC_BLOCK_ENTRY, self.function.function_index
+        ).tolist():
+            if index.values[uid] == self.index_in_function:
+                yield TDBasicBlockEntry(self.trace, uid)
+
+    def taints(self) -> Taints:
+        return self.trace.label_taints(
+            label for entry in self.entries() for label in entry.labels()
+        )
+
+
+class TDTraceEvent(TraceEvent):
+    def __init__(self, trace: "TDProgramTrace", uid: int):
+        super().__init__(uid)
+        self.trace: TDProgramTrace = trace
+
+    @property
+    def previous_event(self) -> Optional[TraceEvent]:
+        if self.uid == 0:
+            return None
+        return self.trace.get_event(self.uid - 1)
+
+    @property
+    def next_event(self) -> Optional[TraceEvent]:
+        if self.uid + 1 >= len(self.trace):
+            return None
+        return self.trace.get_event(self.uid + 1)
+
+    @property
+    def next_global_event(self) -> Optional[TraceEvent]:
+        return self.next_event
+
+    @property
+    def previous_global_event(self) -> Optional[TraceEvent]:
+        return self.previous_event
+
+    @property
+    def function_entry(self) -> Optional["TDFunctionEntry"]:
+        frame = self.trace.event_index.frames[self.uid]
+        if frame < 0:
+            return None
+        return TDFunctionEntry(self.trace, frame)
+
+
+class TDFunctionEntry(TDTraceEvent, FunctionEntry):
+    @property
+    def function(self) -> Function:
+        return self.trace.function_by_id(self.trace.event_index.functions[self.uid])
+
+    @property
+    def function_return(self) -> Optional["TDFunctionReturn"]:
+        uid = self.trace.event_index.values[self.uid]
+        if uid < 0:
+            return None
+        return TDFunctionReturn(self.trace, uid)
+
+    def taints(self) -> Taints:
+        return Taints(())
+
+
+class TDFunctionReturn(TDTraceEvent, FunctionReturn):
+    @property
+    def function_entry(self) -> TDFunctionEntry:
+        return TDFunctionEntry(self.trace, self.trace.event_index.values[self.uid])
+
+    @property
+    def basic_block(self) -> BasicBlock:
+        """The last basic block entered in the function that returned"""
+        index = self.trace.event_index
+        entry = index.values[self.uid]
+        for uid in range(self.uid - 1, entry, -1):
+            if (
+                index.kinds[uid] == TDEventIndex.BASIC_BLOCK_ENTRY
+                and index.frames[uid] == entry
+            ):
+                return TDBasicBlockEntry(self.trace, uid).basic_block
+        raise ValueError(f"{self!r} does not have a basic block")
+
+    @property
+    def function(self) -> Function:
+        returning_to = self.returning_to
+        if returning_to is None:
+            return self.returning_from
+        return returning_to.function
+
+    def taints(self) -> Taints:
+        return Taints(())
+
+
+class TDBasicBlockEntry(TDTraceEvent, BasicBlockEntry):
+    @property
+    def basic_block(self) -> BasicBlock:
+        index = self.trace.event_index
+        return self.trace.basic_block(index.functions[self.uid], index.values[self.uid])
+
+    def entry_count(self) -> int:
+        return self.trace.event_index.entry_counts[self.uid]
+
+    def labels(self) -> Iterator[int]:
+        """Yields the labels of the tainted control flow that happened in this block"""
+        index = self.trace.event_index
+        uid = self.uid + 1
+        while (
+            uid < len(index) and index.kinds[uid] == TDEventIndex.TAINTED_CONTROL_FLOW
+        ):
+            yield index.values[uid]
+            uid += 1
+
+    def taints(self) -> Taints:
+        return self.trace.label_taints(self.labels())
+
+
+class TDTaintedControlFlow(TDTraceEvent):
+    """A branch whose condition depended on the tainted data of `label`"""
+
+    @property
+    def label(self) -> int:
+        return self.trace.event_index.values[self.uid]
+
+    @property
+    def basic_block(self) -> BasicBlock:
+        index = self.trace.event_index
+        uid = self.uid - 1
+        while uid >= 0 and index.kinds[uid] == TDEventIndex.TAINTED_CONTROL_FLOW:
+            uid -= 1
+        if uid < 0 or index.kinds[uid] != TDEventIndex.BASIC_BLOCK_ENTRY:
+            raise ValueError(f"{self!r} happened outside of a function")
+        return TDBasicBlockEntry(self.trace, uid).basic_block
+
+    def taints(self) -> Taints:
+        return self.trace.label_taints((self.label,))
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.uid!r}, label={self.label!r})"
+
+
+class TDTaintAccess(TaintAccess):
+    def taints(self) -> Taints:
+        return self.event.taints()
+
+
 class TDTaintOutput(TaintOutput):
     def __init__(self, source: Input, output_offset: int, label: int):
         super().__init__(source, output_offset, label)
@@ -592,25 +1937,109 @@ class TDProgramTrace(ProgramTrace):
         self.tdfile: TDFile = TDFile(file)
         self.tforest: TDTaintForest = TDTaintForest(self)
         self._inputs = None
+        self._event_index: Optional[TDEventIndex] = None
+        self._functions: Dict[int, TDFunction] = {}
+        self._basic_blocks: Dict[Tuple[int, int], TDBasicBlock] = {}
+        self._sources: Dict[int, Input] = {}
+
+    @property
+    def event_index(self) -> TDEventIndex:
+        """The index of trace events, built on first use
+
+        Events are read from the control flow log. Traces without one fall back
+        to the function entry and exit events of the function trace.
+        """
+        if self._event_index is None:
+            cflog = self.tdfile.sections_by_type.get(TDControlFlowLogSection)
+            if isinstance(cflog, TDControlFlowLogSection) and len(cflog.section):
+                records: Iterable[Tuple[int, int, int]] = cflog.records()
+            else:
+                records = (
+                    (
+                        (
+                            TDControlFlowLogSection.ENTER_FUNCTION
+                            if event.kind == TDEvent.Kind.ENTRY.value
+                            else TDControlFlowLogSection.LEAVE_FUNCTION
+                        ),
+                        event.fnidx,
+                        0,
+                    )
+                    for event in self.tdfile.events
+                )
+            self._event_index = TDEventIndex(records)
+        return self._event_index
+
+    def function_name(self, function_id: int) -> str:
+        cflog = self.tdfile.sections_by_type.get(TDControlFlowLogSection)
+        if isinstance(cflog, TDControlFlowLogSection) and len(cflog.section):
+            # Control flow log function ids are assigned by the instrumentation and
+            # can only be named with its function id mapping
+            if cflog.funcmapping is not None:
+                return str(cflog.funcmapping[function_id])
+        elif function_id < len(self.tdfile.fn_headers):
+            return self.tdfile.fn_headers[function_id][0]
+        return f"function_{function_id}"
+
+    def function_by_id(self, function_id: int) -> TDFunction:
+        if function_id not in self._functions:
+            self._functions[function_id] = TDFunction(
+                self, self.function_name(function_id), function_id
+            )
+        return self._functions[function_id]
+
+    def basic_block(self, function_id: int, index: int) -> TDBasicBlock:
+        key = (function_id, index)
+        if key not in self._basic_blocks:
+            self._basic_blocks[key] = TDBasicBlock(
+                self, self.function_by_id(function_id), index
+            )
+        return self._basic_blocks[key]
+
+    def source(self, idx: int) -> Input:
+        """Returns the input of the source with index `idx`"""
+        if idx not in self._sources:
+            path, fd_header = self.tdfile.fd_headers[idx]
+            self._sources[idx] = Input(fd_header.fd, str(path), fd_header.size)
+        return self._sources[idx]
+
+    def label_taints(self, labels: Iterable[int]) -> Taints:
+        """Returns the source bytes that any of `labels` were derived from"""
+        intervals_by_source: Dict[Input, List[Tuple[int, int]]] = defaultdict(list)
+        for idx, begin, end in self.tdfile.resolver.resolve_all(labels):
+            intervals_by_source[self.source(idx)].append((begin, end))
+        return Taints.from_intervals(intervals_by_source)
 
     def __contains__(self, uid: int):
-        return super().__contains__(uid)
+        return self.has_event(uid)
 
     def __getitem__(self, uid: int) -> TraceEvent:
-        raise NotImplementedError()
+        return self.get_event(uid)
 
     def __iter__(self) -> Iterator[TraceEvent]:
-        raise NotImplementedError()
+        for uid in range(len(self)):
+            yield self.get_event(uid)
 
     def __len__(self) -> int:
-        raise NotImplementedError()
+        return len(self.event_index)
 
     def access_sequence(self) -> Iterator[TaintAccess]:
-        raise NotImplementedError()
+        index = self.event_index
+        for access_id, uid in enumerate(
+            index.uids(TDEventIndex.TAINTED_CONTROL_FLOW).tolist()
+        ):
+            yield TDTaintAccess(
+                access_id,
+                TDTaintedControlFlow(self, uid),
+                index.values[uid],
+                ByteAccessType.CMP_ACCESS,
+            )
 
     @property
     def basic_blocks(self) -> Iterable[BasicBlock]:
-        raise NotImplementedError()
+        return [
+            self.basic_block(function_id, index)
+            for function_id, index in sorted(self.event_index.basic_blocks)
+        ]
 
     def file_offset(self, node: TaintForestNode) -> ByteOffset:
         assert node.source is not None
@@ -620,23 +2049,40 @@ class TDProgramTrace(ProgramTrace):
 
     @property
     def functions(self) -> Iterable[Function]:
-        raise NotImplementedError()
+        return [
+            self.function_by_id(function_id)
+            for function_id in sorted(
+                set(callee for _, callee in self.event_index.calls)
+            )
+        ]
 
     def get_event(self, uid: int) -> TraceEvent:
-        raise NotImplementedError()
+        if not self.has_event(uid):
+            raise KeyError(uid)
+        kind = self.event_index.kinds[uid]
+        if kind == TDEventIndex.FUNCTION_ENTRY:
+            return TDFunctionEntry(self, uid)
+        elif kind == TDEventIndex.FUNCTION_RETURN:
+            return TDFunctionReturn(self, uid)
+        elif kind == TDEventIndex.BASIC_BLOCK_ENTRY:
+            return TDBasicBlockEntry(self, uid)
+        return TDTaintedControlFlow(self, uid)
 
     def get_function(self, name: str) -> Function:
-        raise NotImplementedError()
+        for function in self.functions:
+            if function.name == name:
+                return function
+        raise KeyError(name)
 
     def has_event(self, uid: int) -> bool:
-        raise NotImplementedError()
+        return 0 <= uid < len(self)
 
     def has_function(self, name: str) -> bool:
-        raise NotImplementedError()
+        return any(function.name == name for function in self.functions)
 
     @property
     def num_accesses(self) -> int:
-        raise NotImplementedError()
+        return self.event_index.num_accesses
 
     @property
     def outputs(self) -> Optional[Iterable[Input]]:
@@ -820,6 +2266,12 @@ class TDInfo(Command):
 
     def __init_arguments__(self, parser):
         parser.add_argument("POLYTRACKER_TF", type=str, help="the trace file")
+        parser.add_argument(
+            "--print-section-headers",
+            "-S",
+            action="store_true",
+            help="print section headers",
+        )
         parser.add_argument(
             "--print-fd-headers",
             "-f",
@@ -859,11 +2311,54 @@ class TDInfo(Command):
             help="print function trace events",
         )
 
+        parser.add_argument(
+            "--print-runtime-stats",
+            "-r",
+            action="store_true",
+            help="print the statistics recorded by the runtime",
+        )
+
+    @staticmethod
+    def print_runtime_stats(tdfile: TDFile):
+        stats = tdfile.runtime_stats
+        if stats is None:
+            print("No runtime statistics were recorded")
+            # The header still records the capacity reserved for each section
+            print("Section capacities:")
+            for hdr in tdfile.section_headers:
+                name = SECTION_NAMES.get(hdr.tag, f"tag {hdr.tag}")
+                print(f"  {name}: {hdr.capacity} bytes")
+            return
+        start = datetime.fromtimestamp(stats.start_time_ns / 1e9, timezone.utc)
+        print(f"Run started: {start.isoformat()}")
+        print(f"Run duration: {stats.duration_ns / 1e9:.3f}s")
+        requested = stats.unions_requested
+        print(f"Unions requested: {requested}")
+        for outcome in ("identical", "short_circuited", "deduplicated", "created"):
+            n = getattr(stats, f"unions_{outcome}")
+            share = f" ({n / requested:.1%})" if requested else ""
+            print(f"  {outcome.replace('_', '-')}: {n}{share}")
+        print("Section usage:")
+        for usage in tdfile.section_usage:
+            name = SECTION_NAMES.get(usage.tag, f"tag {usage.tag}")
+            share = f" ({usage.used / usage.capacity:.1%})" if usage.capacity else ""
+            print(f"  {name}: {usage.used} of {usage.capacity} bytes{share}")
+
     def run(self, args):
         with open(args.POLYTRACKER_TF, "rb") as f:
             tdfile = TDFile(f)
             print(f"Number of labels: {tdfile.label_count}")
 
+            if args.print_runtime_stats:
+                self.print_runtime_stats(tdfile)
+
+            if args.print_section_headers:
+                for hdr in tdfile.section_headers:
+                    print(
+                        f"tag: {hdr.tag} align: {hdr.align} offset: {hdr.offset} size: {hdr.size} "
+                        f"capacity: {hdr.capacity}"
+                    )
+
             if args.print_fd_headers:
                 for i, h in enumerate(tdfile.fd_headers):
                     path = h[0]
@@ -891,3 +2386,79 @@ class TDInfo(Command):
                 assert isinstance(cflog, TDControlFlowLogSection)
                 for obj in cflog:
                     print(f"{obj}")
+
+
+class TDCompact(Command):
+    name = "compact"
+    help = "rewrite a trace file with tightly packed sections"
+
+    def __init_arguments__(self, parser):
+        parser.add_argument("POLYTRACKER_TF", type=str, help="the trace file")
+        parser.add_argument("OUTPUT", type=str, help="path to the compacted trace file")
+
+    def run(self, args):
+        with open(args.POLYTRACKER_TF, "rb") as src, open(args.OUTPUT, "wb") as dst:
+            size = compact(src, dst)
+        print(f"Wrote {size} bytes to {args.OUTPUT}")
+
+
+class TDArchiveCommand(Command):
+    name = "archive"
+    help = "write a trace file as a seekable, block compressed archive"
+
+    def __init_arguments__(self, parser):
+        parser.add_argument("POLYTRACKER_TF", type=str, help="the trace file")
+        parser.add_argument("OUTPUT", type=str, help="path to the archive")
+        parser.add_argument(
+            "--codec",
+            choices=[c.name.lower() for c in Codec],
+            default=Codec.ZLIB.name.lower(),
+            help="compression codec (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--block-size",
+            type=int,
+            default=DEFAULT_BLOCK_SIZE,
+            help="uncompressed size of each block in bytes (default: %(default)s)",
+        )
+
+    def run(self, args):
+        if args.block_size <= 0:
+            sys.stderr.write("--block-size must be positive\n")
+            return 1
+        with open(args.POLYTRACKER_TF, "rb") as src, open(args.OUTPUT, "wb") as dst:
+            size = archive(src, dst, Codec[args.codec.upper()], args.block_size)
+        print(f"Wrote {size} bytes to {args.OUTPUT}")
+
+
+class TDSlice(Command):
+    name = "slice"
+    help = "extract the provenance of selected output bytes into a smaller trace file"
+
+    def __init_arguments__(self, parser):
+        parser.add_argument("POLYTRACKER_TF", type=str, help="the trace file")
+        parser.add_argument("OUTPUT", type=str, help="path to the sliced trace file")
+        parser.add_argument(
+            "--offsets",
+            "-o",
+            type=int,
+            nargs="+",
+            default=[],
+            help="keep the sinks written to these output offsets",
+        )
+        parser.add_argument(
+            "--labels",
+            "-l",
+            type=int,
+            nargs="+",
+            default=[],
+            help="keep these labels and the sinks carrying them",
+        )
+
+    def run(self, args):
+        if not args.offsets and not args.labels:
+            sys.stderr.write("at least one of --offsets or --labels is required\n")
+            return 1
+        with open(args.POLYTRACKER_TF, "rb") as src, open(args.OUTPUT, "wb") as dst:
+            size = slice_tdag(TDFile(src), dst, args.offsets, args.labels)
+        print(f"Wrote {size} bytes to {args.OUTPUT}")
@@ -1,11 +1,11 @@
 from abc import abstractmethod
-from typing import Iterator, Optional, Tuple
+from typing import Iterator, Optional, Tuple, TYPE_CHECKING
 
-from .graphs import DAG
 from .inputs import Input
 from .plugins import Command
 
-import networkx as nx
+if TYPE_CHECKING:
+    from .graphs import DAG
 
 
 class TaintForestNode:
@@ -62,7 +62,11 @@ class TaintForest:
     def __getitem__(self, label: int) -> Iterator[TaintForestNode]:
         raise NotImplementedError()
 
-    def to_graph(self) -> DAG[TaintForestNode]:
+    def to_graph(self) -> "DAG[TaintForestNode]":
+        import networkx as nx
+
+        from .graphs import DAG
+
         dag: nx.DiGraph = nx.DiGraph()
 
         for node in self:
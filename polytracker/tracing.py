@@ -4,10 +4,11 @@ from abc import ABC, abstractmethod
 from argparse import ArgumentParser, Namespace
 from collections import defaultdict
 from enum import IntFlag
-import itertools
 from os.path import commonpath
 from pathlib import Path
 from typing import (
+    Any,
+    Callable,
     Dict,
     Iterable,
     Iterator,
@@ -15,12 +16,16 @@ from typing import (
     Optional,
     Set,
     Tuple,
+    TYPE_CHECKING,
     Union,
 )
 
 from cxxfilt import demangle
+import numpy as np
 
-from .graphs import DiGraph
+if TYPE_CHECKING:
+    # networkx is slow to import, so graphs are only imported once a trace's CFG is built
+    from .graphs import DiGraph
 from .inputs import Input, InputProperties
 from .plugins import Command
 from .taint_forest import TaintForest, TaintForestNode
@@ -154,6 +159,56 @@ class ByteOffset(TaintedRegion):
         super().__init__(source=source, offset=offset, length=1)
 
 
+# An (n, 2) array of sorted, disjoint and non-adjacent [begin, end) byte intervals
+IntervalArray = np.ndarray
+
+_NO_INTERVALS: IntervalArray = np.empty((0, 2), dtype=np.int64)
+
+
+def normalize_intervals(intervals) -> IntervalArray:
+    """Sorts (n, 2) [begin, end) intervals and merges the ones that overlap or touch"""
+    intervals = np.asarray(intervals, dtype=np.int64).reshape(-1, 2)
+    intervals = intervals[intervals[:, 0] < intervals[:, 1]]
+    if len(intervals) == 0:
+        return _NO_INTERVALS
+    intervals = intervals[np.argsort(intervals[:, 0], kind="stable")]
+    ends = np.maximum.accumulate(intervals[:, 1])
+    first = np.empty(len(intervals), dtype=bool)
+    first[0] = True
+    first[1:] = intervals[1:, 0] > ends[:-1]
+    last = np.empty(len(intervals), dtype=bool)
+    last[:-1] = first[1:]
+    last[-1] = True
+    return np.stack((intervals[first, 0], ends[last]), axis=1)
+
+
+def _covered(intervals: IntervalArray, points: np.ndarray) -> np.ndarray:
+    """Returns whether each of `points` lies in one of the normalized `intervals`"""
+    if len(intervals) == 0:
+        return np.zeros(len(points), dtype=bool)
+    i = np.searchsorted(intervals[:, 0], points, side="right") - 1
+    return (i >= 0) & (points < intervals[np.maximum(i, 0), 1])
+
+
+def combine_intervals(
+    first: IntervalArray,
+    second: IntervalArray,
+    op: Callable[[np.ndarray, np.ndarray], np.ndarray],
+) -> IntervalArray:
+    """Combines two normalized interval arrays with a boolean ufunc like `np.logical_and`
+
+    The interval boundaries of both arrays split the bytes into segments that
+    are either entirely inside or entirely outside of each array, and the
+    segments for which `op` holds make up the result.
+    """
+    points = np.union1d(first.ravel(), second.ravel())
+    if len(points) < 2:
+        return _NO_INTERVALS
+    begins = points[:-1]
+    keep = op(_covered(first, begins), _covered(second, begins))
+    return normalize_intervals(np.stack((begins[keep], points[1:][keep]), axis=1))
+
+
 class TaintDiff:
     """A diff of two sets of taints."""
 
@@ -167,38 +222,36 @@ class TaintDiff:
         """
         self.taints1: Taints = taints1
         self.taints2: Taints = taints2
-        self._only_in_first: Optional[List[ByteOffset]] = None
-        self._only_in_second: Optional[List[ByteOffset]] = None
+        self._only_in_first: Optional[Taints] = None
+        self._only_in_second: Optional[Taints] = None
 
     def _diff(self):
         if self._only_in_first is not None:
             return
-        in_first = set(self.taints1)
-        in_second = set(self.taints2)
-        self._only_in_first = sorted(in_first - in_second)
-        self._only_in_second = sorted(in_second - in_first)
+        self._only_in_first = self.taints1.difference(self.taints2)
+        self._only_in_second = self.taints2.difference(self.taints1)
 
     @property
-    def bytes_only_in_first(self) -> List[ByteOffset]:
-        """Returns a list of all of the tainted byte offsets only in the first set of taints."""
+    def bytes_only_in_first(self) -> "Taints":
+        """Returns the tainted byte offsets only in the first set of taints."""
         self._diff()
         return self._only_in_first  # type: ignore
 
     @property
     def regions_only_in_first(self) -> Iterator[TaintedRegion]:
         """Returns a list of all of the tainted byte regions only in the first set of taints."""
-        yield from Taints.to_regions(self.bytes_only_in_first, is_sorted=True)
+        yield from self.bytes_only_in_first.regions()
 
     @property
-    def bytes_only_in_second(self) -> List[ByteOffset]:
-        """Returns a list of all of the tainted byte offsets only in the second set of taints."""
+    def bytes_only_in_second(self) -> "Taints":
+        """Returns the tainted byte offsets only in the second set of taints."""
         self._diff()
         return self._only_in_second  # type: ignore
 
     @property
     def regions_only_in_second(self) -> Iterator[TaintedRegion]:
         """Returns a list of all of the tainted byte regions only in the second set of taints."""
-        yield from Taints.to_regions(self.bytes_only_in_second, is_sorted=True)
+        yield from self.bytes_only_in_second.regions()
 
     def __bool__(self):
         """Equivalent to ``bool(self.bytes_only_in_first) or bool(self.bytes_only_in_second)``"""
@@ -213,75 +266,141 @@ class TaintDiff:
 
 
 class Taints:
-    """A class for representing a collection of tainted regions"""
+    """A class for representing a collection of tainted regions
+
+    The tainted bytes of each source are stored as an :data:`IntervalArray`, so the size of a collection depends on the
+    number of contiguous regions rather than on the number of tainted bytes.
+
+    Collections are immutable. They compare equal, and hash equally, if they contain the same bytes.
+
+    """
 
-    def __init__(self, byte_offsets: Iterable[ByteOffset]):
+    def __init__(self, byte_offsets: Iterable[TaintedRegion]):
         """Initializes a taint collection.
 
         Args:
-            byte_offsets: The tainted byte offsets to include in this collection.
+            byte_offsets: The tainted byte offsets (or larger regions) to include in this collection.
 
         """
-        offsets_by_source: Dict[Input, Set[ByteOffset]] = defaultdict(set)
-        for offset in byte_offsets:
-            offsets_by_source[offset.source].add(offset)
-        self._offsets_by_source: Dict[Input, List[ByteOffset]] = {
-            source: sorted(offsets) for source, offsets in offsets_by_source.items()
+        intervals_by_source: Dict[Input, List[Tuple[int, int]]] = defaultdict(list)
+        for region in byte_offsets:
+            intervals_by_source[region.source].append(
+                (region.offset, region.offset + region.length)
+            )
+        self._intervals_by_source: Dict[Input, IntervalArray] = Taints._by_source(
+            (source, normalize_intervals(intervals))
+            for source, intervals in intervals_by_source.items()
+        )
+
+    @staticmethod
+    def _by_source(
+        items: Iterable[Tuple[Input, IntervalArray]],
+    ) -> Dict[Input, IntervalArray]:
+        return {
+            source: intervals
+            for source, intervals in sorted(items, key=lambda item: item[0].uid)
+            if len(intervals)
         }
 
+    @classmethod
+    def from_intervals(cls, intervals_by_source: Dict[Input, Any]) -> "Taints":
+        """Creates a taint collection from (n, 2) arrays of [begin, end) byte intervals per source.
+
+        The intervals may be unsorted and may overlap.
+
+        """
+        taints = cls(())
+        taints._intervals_by_source = Taints._by_source(
+            (source, normalize_intervals(intervals))
+            for source, intervals in intervals_by_source.items()
+        )
+        return taints
+
+    def intervals(self, source: Input) -> IntervalArray:
+        """Returns the sorted, disjoint [begin, end) intervals of the bytes of `source` in this collection."""
+        return self._intervals_by_source.get(source, _NO_INTERVALS)
+
     def sources(self) -> Set[Input]:
         """Returns the set of sources from which this collection of taints originates."""
-        return set(self._offsets_by_source.keys())
+        return set(self._intervals_by_source.keys())
 
     def from_source(self, source: Input) -> "Taints":
         """Returns a subset of the taints in this collection that come from a specific source"""
-        return Taints(self._offsets_by_source.get(source, ()))
+        return Taints.from_intervals({source: self.intervals(source)})
 
-    def regions(self) -> Iterator[TaintedRegion]:
-        """Iterates over all of the contiguous regions of taint in this collection.
+    def includes(self, source: Input, offset: int) -> bool:
+        """Returns whether the byte at `offset` of `source` is in this collection."""
+        return bool(_covered(self.intervals(source), np.array([offset]))[0])
 
-        The regions are yielded in increasing order of offset.
+    def bitmap(self, source: Input, num_bytes: int) -> np.ndarray:
+        """Returns a boolean array marking which of the first `num_bytes` bytes of `source` are in this collection."""
+        bitmap = np.zeros(num_bytes, dtype=bool)
+        for begin, end in self.intervals(source).tolist():
+            if begin >= num_bytes:
+                break
+            bitmap[begin:end] = True
+        return bitmap
+
+    def union(self, *others: "Taints") -> "Taints":
+        """Returns the bytes that are in this collection or in any of `others`"""
+        intervals_by_source: Dict[Input, List[IntervalArray]] = defaultdict(list)
+        for taints in (self,) + others:
+            for source, intervals in taints._intervals_by_source.items():
+                intervals_by_source[source].append(intervals)
+        return Taints.from_intervals(
+            {
+                source: np.concatenate(intervals)
+                for source, intervals in intervals_by_source.items()
+            }
+        )
 
-        .. caution::
+    def intersection(self, other: "Taints") -> "Taints":
+        """Returns the bytes that are in both this collection and `other`"""
+        return Taints.from_intervals(
+            {
+                source: combine_intervals(
+                    intervals, other.intervals(source), np.logical_and
+                )
+                for source, intervals in self._intervals_by_source.items()
+                if source in other._intervals_by_source
+            }
+        )
 
-            The regions *will not* be grouped by source! Regions from different sources will be intermixed. Use
-            :meth:`Taints.from_source` if you want to differentiate regions by source.
+    def difference(self, other: "Taints") -> "Taints":
+        """Returns the bytes that are in this collection but not in `other`"""
+        return Taints.from_intervals(
+            {
+                source: combine_intervals(
+                    intervals,
+                    other.intervals(source),
+                    lambda a, b: a & ~b,
+                )
+                for source, intervals in self._intervals_by_source.items()
+            }
+        )
 
-        This is equivalent to::
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
 
-            return Taints.to_regions(self, is_sorted=True)
+    def regions(self) -> Iterator[TaintedRegion]:
+        """Iterates over all of the contiguous regions of taint in this collection.
+
+        The regions are yielded grouped by source, in increasing order of source :attr:`uid <Input.uid>`, and in
+        increasing order of offset within a source. Use :meth:`Taints.from_source` if you want the regions of a single
+        source.
 
         """
-        return Taints.to_regions(self, is_sorted=True)
+        for source, intervals in self._intervals_by_source.items():
+            for begin, end in intervals.tolist():
+                yield TaintedRegion(source=source, offset=begin, length=end - begin)
 
     @staticmethod
     def to_regions(
         offsets: Iterable[ByteOffset], is_sorted: bool = False
     ) -> Iterator[TaintedRegion]:
         """Converts the list of byte offsets into contiguous regions."""
-        last_input: Optional[Input] = None
-        last_offset: Optional[ByteOffset] = None
-        region: Optional[TaintedRegion] = None
-        if not is_sorted:
-            offsets = sorted(offsets)
-        for offset in offsets:
-            if last_input is None:
-                last_input = offset.source
-            elif last_input != offset.source or (
-                last_offset is not None and last_offset.offset != offset.offset - 1
-            ):
-                if region is not None:
-                    yield region
-                region = None
-            last_offset = offset
-            if region is None:
-                region = TaintedRegion(
-                    source=offset.source, offset=offset.offset, length=offset.length
-                )
-            else:
-                region.length += offset.length
-        if region is not None:
-            yield region
+        return Taints(offsets).regions()
 
     def find(self, byte_sequence: Union[int, str, bytes]) -> Iterator[TaintedRegion]:
         """Yields all matching tainted subsequences in this collection.
@@ -343,19 +462,43 @@ class Taints:
 
     def __len__(self):
         """The total number of tainted bytes in this collection."""
-        return sum(map(len, self._offsets_by_source.values()))
+        return sum(
+            int((intervals[:, 1] - intervals[:, 0]).sum())
+            for intervals in self._intervals_by_source.values()
+        )
 
     def __iter__(self) -> Iterator[ByteOffset]:
         """Iterates over all of the individual byte offsets in this collection, grouped by source.
 
         .. note::
 
-            The byte offsets are guaranteed to be yielded in increasing order of byte offset per source, but the order
-            of sources is arbitrary.
+            The byte offsets are yielded in increasing order of byte offset per source, and the sources in increasing
+            order of :attr:`uid <Input.uid>`.
 
         """
-        for offsets in self._offsets_by_source.values():
-            yield from offsets
+        for source, intervals in self._intervals_by_source.items():
+            for begin, end in intervals.tolist():
+                for offset in range(begin, end):
+                    yield ByteOffset(source=source, offset=offset)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Taints)
+            and self._intervals_by_source.keys() == other._intervals_by_source.keys()
+            and all(
+                np.array_equal(intervals, other.intervals(source))
+                for source, intervals in self._intervals_by_source.items()
+            )
+        )
+
+    def __hash__(self):
+        # Sources are compared as a mapping, so their order must not matter
+        return hash(
+            frozenset(
+                (source, intervals.tobytes())
+                for source, intervals in self._intervals_by_source.items()
+            )
+        )
 
     def __bool__(self):
         """Returns whether this taint collection has at least one tainted byte.
@@ -365,7 +508,7 @@ class Taints:
             bool(len(self))
 
         """
-        return bool(len(self))
+        return bool(self._intervals_by_source)
 
 
 class Function:
@@ -986,7 +1129,7 @@ class FunctionInvocation(ControlFlowEvent):
             setattr(
                 self,
                 "_taints",
-                Taints(itertools.chain(*(event.taints() for event in self))),
+                Taints(()).union(*(event.taints() for event in self)),
             )
         return getattr(self, "_taints")
 
@@ -1006,8 +1149,8 @@ class FunctionInvocation(ControlFlowEvent):
 class ProgramTrace(ABC):
     """An abstract class for representing a program trace."""
 
-    _cfg: Optional[DiGraph[BasicBlock]] = None
-    _func_cfg: Optional[DiGraph[Function]] = None
+    _cfg: Optional["DiGraph[BasicBlock]"] = None
+    _func_cfg: Optional["DiGraph[Function]"] = None
 
     @abstractmethod
     def __len__(self) -> int:
@@ -1135,34 +1278,39 @@ class ProgramTrace(ABC):
         )
 
     def taints(self, nodes: Iterable[TaintForestNode]) -> Taints:
-        seen: Set[TaintForestNode] = set(nodes)
-        stack: List[TaintForestNode] = list(seen)
-        result: Set[ByteOffset] = set()
+        seen: Set[TaintForestNode] = set()
+        stack: List[TaintForestNode] = list(set(nodes))
+        offsets_by_source: Dict[Input, List[int]] = defaultdict(list)
         while stack:
             node = stack.pop()
 
             if node in seen:
                 continue
+            seen.add(node)
 
             p1 = node.parent_one
             p2 = node.parent_two
 
             if p1 is None:
                 assert p2 is None
-                result.add(self.file_offset(node))
+                offset = self.file_offset(node)
+                offsets_by_source[offset.source].append(offset.offset)
             else:
                 # a node will always have either zero or two parents.
                 # labels that are reused will reuse their associated nodes.
                 # all other nodes are unions.
                 assert p1 is not None and p2 is not None
                 if p1 not in seen:
-                    seen.add(p1)
                     stack.append(p1)
                 if p2 not in seen:
-                    seen.add(p2)
                     stack.append(p2)
 
-        return Taints(result)
+        return Taints.from_intervals(
+            {
+                source: np.array(offsets, dtype=np.int64)[:, np.newaxis] + (0, 1)
+                for source, offsets in offsets_by_source.items()
+            }
+        )
 
     def function_trace(self) -> Iterator[FunctionEntry]:
         """Iterates over all of the :class:`FunctionEntry` events in this trace.
@@ -1238,8 +1386,10 @@ class ProgramTrace(ABC):
         raise NotImplementedError()
 
     @property
-    def cfg(self) -> DiGraph[BasicBlock]:
+    def cfg(self) -> "DiGraph[BasicBlock]":
         """The static control flow graph associated with this trace."""
+        from .graphs import DiGraph
+
         if not hasattr(self, "_cfg") or self._cfg is None:
             setattr(self, "_cfg", DiGraph())
             for bb in self.basic_blocks:
@@ -1249,7 +1399,9 @@ class ProgramTrace(ABC):
         return self._cfg  # type: ignore
 
     @property
-    def function_cfg(self) -> DiGraph[Function]:
+    def function_cfg(self) -> "DiGraph[Function]":
+        from .graphs import DiGraph
+
         if not hasattr(self, "_func_cfg") or self._func_cfg is None:
             setattr(self, "_func_cfg", DiGraph())
             for func in self.functions:
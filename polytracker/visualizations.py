@@ -1,36 +1,68 @@
 import math
-from typing import Callable, List, Optional
+from typing import Callable, List, Optional, Tuple, Union
 
-from PIL import Image, ImageEnhance
+import numpy as np
+from PIL import Image
 from tqdm import tqdm
 
 from .tracing import Input, ProgramTrace
 
+# Membership of the bytes of a file, either a boolean array indexed by offset
+# or a predicate on the offset
+ByteMembership = Union[np.ndarray, Callable[[int], bool]]
 
-def file_diff(
-    num_bytes: int,
-    in_first: Callable[[int], bool],
-    in_second: Callable[[int], bool],
-    aspect_ratio: float = 1.61803398875,
-) -> Image:
+# Colors of the bytes in a file_diff image, indexed by in_first | in_second << 1
+DIFF_PALETTE = np.array(
+    [
+        (0, 0, 0),  # in neither
+        (0, 0, 255),  # only in the first
+        (255, 0, 0),  # only in the second
+        (255, 255, 255),  # in both
+    ],
+    dtype=np.uint8,
+)
+
+
+def image_dimensions(num_bytes: int, aspect_ratio: float) -> Tuple[int, int]:
+    """Returns the (width, height) of an image with a pixel for each of `num_bytes` bytes"""
     height = max(int(math.ceil(math.sqrt(aspect_ratio) * math.sqrt(num_bytes))), 1)
     width = max(int(math.ceil(num_bytes / height)), 1)
     while width * height < num_bytes:
         height += 1
-    image = Image.new(size=(width, height), mode="RGB", color=(255, 255, 255))
-    for i in range(num_bytes):
-        first = in_first(i)
-        second = in_second(i)
-        if not (first and second):
-            row = i // width
-            col = i % width
-            if first:
-                image.putpixel((col, row), (0, 0, 255))
-            elif second:
-                image.putpixel((col, row), (255, 0, 0))
-            else:
-                image.putpixel((col, row), (0, 0, 0))
-    return image
+    return width, height
+
+
+def membership_bitmap(num_bytes: int, membership: ByteMembership) -> np.ndarray:
+    """Returns a boolean array marking which of the first `num_bytes` bytes are members"""
+    if callable(membership):
+        return np.fromiter(
+            (bool(membership(i)) for i in range(num_bytes)), dtype=bool, count=num_bytes
+        )
+    bitmap = np.zeros(num_bytes, dtype=bool)
+    members = np.asarray(membership, dtype=bool)[:num_bytes]
+    bitmap[: len(members)] = members
+    return bitmap
+
+
+def file_diff(
+    num_bytes: int,
+    in_first: ByteMembership,
+    in_second: ByteMembership,
+    aspect_ratio: float = 1.61803398875,
+) -> Image:
+    """Renders which bytes of a file are in a first and a second set of bytes
+
+    Each byte is a pixel, in row-major order: white if it is in both sets, blue if
+    it is only in the first, red if it is only in the second and black otherwise.
+    The sets are given as boolean arrays indexed by offset, or as predicates on
+    the offset, which are slower as they are called for every byte.
+    """
+    width, height = image_dimensions(num_bytes, aspect_ratio)
+    colors = np.full(width * height, len(DIFF_PALETTE) - 1, dtype=np.uint8)
+    colors[:num_bytes] = membership_bitmap(num_bytes, in_first) | (
+        membership_bitmap(num_bytes, in_second).astype(np.uint8) << 1
+    )
+    return Image.fromarray(DIFF_PALETTE[colors].reshape(height, width, 3))
 
 
 def temporal_animation(
@@ -39,13 +71,17 @@ def temporal_animation(
     for_input: Optional[Input] = None,
     aspect_ratio: float = 1.61803398875,
 ):
+    """Renders a GIF of the bytes of `for_input` accessed over the course of `trace`
+
+    Each frame adds one taint access: bytes accessed so far are black and the
+    rest are white. The frames are rendered from a single array of the
+    cumulative accesses, to which only the bytes of each access are written.
+    """
     if for_input is None:
         for_input = next(iter(trace.inputs))
-    num_bytes = for_input.size
-    height = max(int(math.ceil(math.sqrt(aspect_ratio) * math.sqrt(num_bytes))), 1)
-    width = max(int(math.ceil(num_bytes / height)), 1)
-    while width * height < num_bytes:
-        height += 1
+    width, height = image_dimensions(for_input.size, aspect_ratio)
+    accessed = np.full((height, width), 255, dtype=np.uint8)
+    flat = accessed.reshape(-1)
     images: List[Image] = []
     for access in tqdm(
         trace.access_sequence(),
@@ -54,16 +90,12 @@ def temporal_animation(
         unit=" frames",
         total=trace.num_accesses,
     ):
-        if not images:
-            image = Image.new(size=(width, height), mode="L", color=255)
-        else:
-            enhancer = ImageEnhance.Brightness(images[-1])
-            image = enhancer.enhance(1.1)
-        for offset in access.get_taints():
-            row = offset.offset // width
-            col = offset.offset % width
-            image.putpixel((col, row), 0)
-        images.append(image)
+        offsets = np.fromiter(
+            (offset.offset for offset in access.get_taints()), dtype=np.int64
+        )
+        flat[offsets] = 0
+        # fromarray may share the memory of the array, so each frame gets a copy
+        images.append(Image.fromarray(accessed.copy()))
     images[0].save(
         output_path, save_all=True, append_images=images[1:], fps=100.0, loop=True
     )
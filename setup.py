@@ -108,6 +108,7 @@ setup(
         "graphviz~=0.14.1",
         "intervaltree~=3.0.2",
         "networkx~=2.4",
+        "numpy>=1.20",
         "Pillow>=7.2.0",
         "prompt_toolkit~=3.0.8",
         "pygments~=2.15.0",
@@ -0,0 +1,134 @@
+"""Builders of small TDAG files for tests
+
+Larger traces with realistic structure are generated with
+:class:`polytracker.synthetic.SyntheticTrace` instead.
+"""
+
+from ctypes import c_uint16, c_uint64
+from typing import Iterable, List, Tuple
+
+from polytracker.taint_dag import (
+    TDControlFlowLogSection,
+    TDEvent,
+    TDFDHeader,
+    TDFileWriter,
+    TDFnHeader,
+    TDSink,
+)
+
+
+def source(idx: int, offset: int) -> int:
+    return (1 << 63) | (offset << 8) | idx
+
+
+def union(left: int, right: int) -> int:
+    return (left << 31) | right
+
+
+def varint(value: int) -> bytes:
+    encoded = b""
+    while value > 0x7F:
+        encoded += bytes([value & 0x7F | 0x80])
+        value >>= 7
+    return encoded + bytes([value])
+
+
+def string_table(names: Iterable[bytes]) -> Tuple[bytes, List[int]]:
+    """Returns the contents of a string table section and the offset of each name"""
+    strings = b""
+    offsets = []
+    for name in names:
+        offsets.append(len(strings))
+        strings += bytes(c_uint16(len(name))) + name
+        strings += b"\0" * (-len(strings) % 2)
+    return strings, offsets
+
+
+# Labels of a trace reading a.bin and b.bin, two bytes each
+LABELS = [
+    0,
+    source(0, 0),  # 1
+    source(0, 1),  # 2
+    source(1, 0),  # 3
+    source(1, 1),  # 4
+    union(3, 1),  # 5
+    1 << 31 | 2,  # 6: range [1, 2]
+    union(6, 4) | (1 << 62),  # 7: affects control flow
+    union(5, 2),  # 8
+]
+
+
+def write_tdag(path, labels, sinks):
+    """Writes a trace of `labels` and (offset, label, fdidx) `sinks`, with sources
+    a.bin and b.bin and a single function, main"""
+    strings, name_offsets = string_table((b"a.bin", b"b.bin", b"main"))
+
+    bitmap = [0] * ((len(labels) + 63) // 64)
+    for i, raw in enumerate(labels):
+        if raw >> 63:
+            bitmap[i // 64] |= 1 << (i % 64)
+
+    writer = TDFileWriter()
+    writer.add_section(
+        1,
+        8,
+        bytes(TDFDHeader(name_offsets[0], 3, 4))
+        + bytes(TDFDHeader(name_offsets[1], 4, 4)),
+    )
+    writer.add_section(2, 8, bytes((c_uint64 * len(labels))(*labels)))
+    writer.add_section(3, 2, strings)
+    writer.add_section(4, 8, b"".join(bytes(TDSink(*s)) for s in sinks))
+    writer.add_section(5, 8, bytes((c_uint64 * len(bitmap))(*bitmap)))
+    writer.add_section(6, 4, bytes(TDFnHeader(name_offsets[2])))
+    writer.add_section(7, 4, b"")
+    writer.add_section(8, 1, b"")
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+ENTER = TDControlFlowLogSection.ENTER_FUNCTION
+LEAVE = TDControlFlowLogSection.LEAVE_FUNCTION
+BRANCH = TDControlFlowLogSection.TAINTED_CONTROL_FLOW
+
+# main calls parse, which branches on "(", parses two items and branches on ")"
+CFLOG = [
+    (ENTER, 0),
+    (ENTER, 1),
+    (BRANCH, 1, 1),
+    (ENTER, 2),
+    (BRANCH, 2, 2),
+    (LEAVE, 2),
+    (ENTER, 2),
+    (BRANCH, 2, 3),
+    (LEAVE, 2),
+    (BRANCH, 1, 4),
+    (LEAVE, 1),
+    (LEAVE, 0),
+]
+
+
+def write_trace(tmp_path, cflog=CFLOG, events=()):
+    """Writes tmp_path/trace.tdag, a run of a parser over the input "(ab)" that
+    logs `cflog` and `events`, and returns its path"""
+    input_path = tmp_path / "input.txt"
+    input_path.write_bytes(b"(ab)")
+    strings, name_offsets = string_table((str(input_path).encode(), b"main", b"parse"))
+    labels = [0] + [source(0, offset) for offset in range(4)]
+
+    writer = TDFileWriter()
+    writer.add_section(1, 8, bytes(TDFDHeader(name_offsets[0], 3, 4)))
+    writer.add_section(2, 8, bytes((c_uint64 * len(labels))(*labels)))
+    writer.add_section(3, 2, strings)
+    writer.add_section(4, 8, b"")
+    writer.add_section(5, 8, bytes(c_uint64(0b11110)))
+    writer.add_section(
+        6, 4, bytes(TDFnHeader(name_offsets[1])) + bytes(TDFnHeader(name_offsets[2]))
+    )
+    writer.add_section(7, 4, b"".join(bytes(TDEvent(*e)) for e in events))
+    writer.add_section(
+        8, 1, b"".join(bytes([r[0]]) + b"".join(map(varint, r[1:])) for r in cflog)
+    )
+    path = tmp_path / "trace.tdag"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
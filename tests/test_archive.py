@@ -0,0 +1,86 @@
+import io
+from pathlib import Path
+
+from polytracker.archive import Codec, TDArchive, write_archive
+from polytracker.synthetic import SyntheticTrace
+from polytracker.taint_dag import (
+    TDControlFlowLogSection,
+    TDEnterFunctionEvent,
+    TDFile,
+    TDSourceNode,
+    archive,
+    compact,
+)
+
+
+def write_synthetic(path: Path, labels: int) -> None:
+    synthetic = SyntheticTrace(
+        labels=labels, window=64, sinks=100, control_flow_records=200
+    )
+    with open(path, "wb") as f:
+        synthetic.write(f)
+
+
+def test_archive_blocks():
+    data = bytes(range(256)) * 100
+    buffer = io.BytesIO()
+    write_archive(buffer, [(2, 8, data), (3, 1, b"")], 42, Codec.LZMA, 1000)
+    tdarchive = TDArchive(buffer.getvalue(), cache_blocks=2)
+    assert tdarchive.tdag_magic == 42
+    assert tdarchive.sections[0].block_count == 26
+    assert tdarchive.sections[1].block_count == 0
+    assert tdarchive.read(0, 0, len(data)) == data
+    assert tdarchive.read(0, 999, 2001) == data[999:2001]
+    assert tdarchive.read(1, 0, 10) == b""
+    assert len(tdarchive.cache) == 2
+
+    _, _, offset, size = tdarchive.section_headers[0]
+    view = tdarchive[offset : offset + size]
+    assert len(view) == len(data)
+    assert view[5000:5008] == data[5000:5008]
+    assert view[-1] == data[-1]
+
+
+def test_archive_tdfile(tmp_path):
+    tdag = tmp_path / "trace.tdag"
+    tdaz = tmp_path / "trace.tdaz"
+    write_synthetic(tdag, 5000)
+    with open(tdag, "rb") as src, open(tdaz, "wb") as dst:
+        archive(src, dst, block_size=4096)
+    assert tdaz.stat().st_size < tdag.stat().st_size
+
+    with open(tdag, "rb") as f1, open(tdaz, "rb") as f2:
+        plain = TDFile(f1)
+        archived = TDFile(f2)
+        assert archived.archive is not None
+        assert archived.filemeta.magic == plain.filemeta.magic
+        assert archived.label_count == plain.label_count
+        assert archived.fd_headers[0][0] == Path("input0.bin")
+        assert archived.fn_headers[0][0] == "main"
+        for label in (1, 2, 1000, 4999):
+            assert archived.read_node(label) == plain.read_node(label)
+            assert type(archived.decode_node(label)) is type(plain.decode_node(label))
+        assert isinstance(archived.decode_node(1), TDSourceNode)
+        assert list(archived.input_labels()) == list(plain.input_labels())
+        assert [(s.offset, s.label) for s in archived.sinks] == [
+            (s.offset, s.label) for s in plain.sinks
+        ]
+
+        cflog = archived._get_section(TDControlFlowLogSection)
+        assert isinstance(cflog, TDControlFlowLogSection)
+        events = list(cflog)
+        assert events[0] == TDEnterFunctionEvent([0])
+        assert events == list(plain._get_section(TDControlFlowLogSection))
+
+
+def test_archive_expand(tmp_path):
+    tdag = tmp_path / "trace.tdag"
+    tdaz = tmp_path / "trace.tdaz"
+    expanded = tmp_path / "expanded.tdag"
+    write_synthetic(tdag, 100)
+    with open(tdag, "rb") as src, open(tdaz, "wb") as dst:
+        archive(src, dst, Codec.LZMA)
+    with open(tdaz, "rb") as src, open(expanded, "wb") as dst:
+        size = compact(src, dst)
+    assert size == tdag.stat().st_size
+    assert expanded.read_bytes() == tdag.read_bytes()
@@ -1,4 +1,4 @@
-from polytracker.cache import LRUCache
+from polytracker.cache import LRUCache, SizedLRUCache
 
 
 def test_cache():
@@ -26,3 +26,24 @@ def test_cache():
     assert list(cache) == [8, 9, 10, 11, 1, 3, 4, 5, 6, 7]
     for number, string in cache.items():
         assert str(number) == string
+
+
+def test_sized_cache():
+    cache: SizedLRUCache[int, str] = SizedLRUCache(max_cost=10, cost=len)
+    cache[0] = "abcd"
+    cache[1] = "abc"
+    cache[2] = "ab"
+    assert cache.total_cost == 9
+    _ = 0 in cache
+    cache[3] = "abcd"
+    # 1 is now the least recently used item and makes room for 3
+    assert list(cache) == [2, 0, 3]
+    assert cache.total_cost == 10
+    cache[0] = "a"
+    assert cache.total_cost == 7
+    del cache[2]
+    assert cache.total_cost == 5
+    # An item costing more than the budget is kept on its own
+    cache[4] = "a" * 20
+    assert list(cache) == [4]
+    assert cache.total_cost == 20
@@ -0,0 +1,159 @@
+import random
+from io import StringIO
+
+import numpy as np
+
+from polytracker.diffing import (
+    ControlFlowLogEncoding,
+    TDTraceDiff,
+    TDTraceSummary,
+    align_control_flow_logs,
+    bitmap_intervals,
+    matching_blocks,
+)
+from polytracker.taint_dag import (
+    TDFile,
+    TDLabelArrays,
+    TDProgramTrace,
+    backward_closure,
+    reachable_labels,
+)
+
+from .tdag_builders import (
+    BRANCH,
+    CFLOG,
+    LABELS,
+    source,
+    union,
+    write_tdag,
+    write_trace,
+)
+
+CF = 1 << 62
+
+
+def random_labels(rng: random.Random, n: int):
+    labels = [0]
+    for label in range(1, n):
+        if label < 8 or rng.random() < 0.1:
+            labels.append(source(rng.randrange(2), rng.randrange(4)))
+        elif rng.random() < 0.7:
+            # mostly reference the previous label, like a running checksum
+            labels.append(union(label - 1, rng.randrange(1, label - 1)))
+        else:
+            first = rng.randrange(1, label - 1)
+            labels.append(first << 31 | rng.randrange(first, label))
+    return labels
+
+
+def test_reachable_labels(tmp_path):
+    rng = random.Random(0)
+    path = tmp_path / "trace.tdag"
+    write_tdag(path, random_labels(rng, 5000), [])
+    with open(path, "rb") as f:
+        tdfile = TDFile(f)
+        arrays = TDLabelArrays(tdfile)
+        for _ in range(5):
+            roots = [rng.randrange(1, 5000) for _ in range(rng.randrange(1, 4))]
+            expected = np.frombuffer(backward_closure(tdfile, roots), dtype=bool)
+            assert np.array_equal(reachable_labels(arrays, roots), expected)
+
+
+def test_bitmap_intervals():
+    bitmap = np.array([1, 1, 0, 0, 1, 0, 1], dtype=bool)
+    assert bitmap_intervals(bitmap).tolist() == [[0, 2], [4, 5], [6, 7]]
+    assert bitmap_intervals(np.zeros(3, dtype=bool)).shape == (0, 2)
+
+
+def summarize(path, labels, sinks) -> TDTraceSummary:
+    write_tdag(path, labels, sinks)
+    with open(path, "rb") as f:
+        return TDTraceSummary(TDProgramTrace(f))
+
+
+def test_trace_diff(tmp_path):
+    first_labels = list(LABELS)
+    first_labels[1] |= CF
+    second_labels = list(LABELS)
+    second_labels[4] |= CF
+    # a.bin[0] and b.bin[0] flow to output offset 0 in the first trace, and
+    # a.bin[0, 2) and b.bin[1] flow to output offsets 0 and 2 in the second
+    first = summarize(tmp_path / "first.tdag", first_labels, [(0, 5, 0)])
+    second = summarize(tmp_path / "second.tdag", second_labels, [(0, 7, 0), (2, 7, 0)])
+    diff = TDTraceDiff(first, second)
+    assert diff
+
+    def regions(result):
+        return {path.name: intervals.tolist() for path, intervals in result.items()}
+
+    assert regions(diff.only_in_first("control_flow")) == {"a.bin": [[0, 1]]}
+    assert regions(diff.only_in_second("control_flow")) == {"b.bin": [[1, 2]]}
+    assert regions(diff.only_in_first("sink_reachable")) == {"b.bin": [[0, 1]]}
+    assert regions(diff.only_in_second("sink_reachable")) == {
+        "a.bin": [[1, 2]],
+        "b.bin": [[1, 2]],
+    }
+    assert regions(diff.only_in_first("sinks")) == {}
+    assert regions(diff.only_in_second("sinks")) == {"a.bin": [[2, 3]]}
+    assert not diff.functions_only_in_first | diff.functions_only_in_second
+
+    output = StringIO()
+    diff.write(output, "A", "B")
+    assert "output bytes only in B" in output.getvalue()
+    assert not TDTraceDiff(first, first)
+
+
+def test_matching_blocks():
+    rng = random.Random(0)
+    for _ in range(500):
+        a = [rng.randrange(3) for _ in range(rng.randrange(20))]
+        b = [rng.randrange(3) for _ in range(rng.randrange(20))]
+        blocks = matching_blocks(a, b)
+        for i, j, n in blocks:
+            assert a[i : i + n] == b[j : j + n]
+        # A longest common subsequence, as computed by dynamic programming
+        lengths = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+        for i in range(len(a) - 1, -1, -1):
+            for j in range(len(b) - 1, -1, -1):
+                lengths[i][j] = (
+                    lengths[i + 1][j + 1] + 1
+                    if a[i] == b[j]
+                    else max(lengths[i + 1][j], lengths[i][j + 1])
+                )
+        assert sum(n for _, _, n in blocks) == lengths[0][0]
+        # The search gives up on sequences more than max_distance edits apart
+        distance = len(a) + len(b) - 2 * lengths[0][0]
+        max_distance = rng.randrange(10)
+        bounded = matching_blocks(a, b, max_distance)
+        assert bounded == (blocks if distance <= max_distance else [])
+
+
+def test_align_control_flow_logs(tmp_path):
+    # the second run branches on "a" once more in the first item, and its
+    # second item branches on "(" instead of "b"
+    second_cflog = list(CFLOG)
+    second_cflog[4:4] = [(BRANCH, 2, 2)]
+    second_cflog[8] = (BRANCH, 2, 1)
+    first_path = write_trace(tmp_path).rename(tmp_path / "first.tdag")
+    second_path = write_trace(tmp_path, second_cflog)
+    names = ["main", "parse", "item"]
+    with open(first_path, "rb") as f:
+        first = ControlFlowLogEncoding(TDFile(f), names, chunk_size=3)
+    with open(second_path, "rb") as f:
+        second = ControlFlowLogEncoding(TDFile(f), names, chunk_size=5)
+    divergences = [
+        (
+            d.first_begin,
+            d.first_end,
+            d.second_begin,
+            d.second_end,
+            d.first_callstack,
+            d.second_callstack,
+        )
+        for d in align_control_flow_logs(first, second, window=6, sync=2)
+    ]
+    assert divergences == [
+        (5, 5, 5, 6, ("main", "parse", "item"), ("main", "parse", "item")),
+        (7, 8, 8, 9, ("main", "parse", "item"), ("main", "parse", "item")),
+    ]
+    assert list(align_control_flow_logs(first, first)) == []
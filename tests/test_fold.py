@@ -0,0 +1,127 @@
+import random
+from typing import List
+
+import numpy as np
+import pytest
+
+from polytracker.taint_dag import (
+    LabelFold,
+    TDFile,
+    TDLabelArrays,
+    fold_labels,
+    label_depths,
+    max_source_offsets,
+    min_source_offsets,
+    source_counts,
+)
+
+from .tdag_builders import LABELS, source, union, write_tdag
+
+
+class DepthFold(LabelFold[int]):
+    def __init__(self):
+        super().__init__(0)
+
+    def source(self, label: int, index: int, offset: int) -> int:
+        return 0
+
+    def union(self, label: int, left: int, right: int) -> int:
+        return max(left, right) + 1
+
+    def range(self, label: int, values: List[int]) -> int:
+        return max(values) + 1
+
+
+class NoRangeFold(LabelFold[int]):
+    def __init__(self):
+        super().__init__(0)
+
+    def source(self, label: int, index: int, offset: int) -> int:
+        return 0
+
+    def union(self, label: int, left: int, right: int) -> int:
+        return max(left, right) + 1
+
+
+def test_label_fold_is_abstract():
+    # An incomplete fold fails before it reads any label
+    with pytest.raises(TypeError, match="range"):
+        NoRangeFold()
+
+
+def random_labels(count: int, seed: int):
+    rng = random.Random(seed)
+    labels = [0]
+    for label in range(1, count):
+        kind = rng.random()
+        if label < 4 or kind < 0.4:
+            labels.append(source(rng.randrange(2), rng.randrange(1000)))
+        elif kind < 0.8:
+            # Mostly recent labels, so the DAG gets deep
+            right = rng.randrange(max(1, label - 8), label)
+            left = rng.randrange(right + 1, label) if right + 1 < label else None
+            if left is None:
+                labels.append(source(0, rng.randrange(1000)))
+            else:
+                labels.append(union(left, right))
+        else:
+            first = rng.randrange(1, label)
+            last = rng.randrange(first, min(label, first + 20))
+            labels.append(first << 31 | last)
+    return labels
+
+
+def naive(labels, label, leaf, combine, memo):
+    if label not in memo:
+        raw = labels[label]
+        if raw >> 63:
+            memo[label] = leaf(raw)
+        else:
+            v1 = (raw >> 31) & 0x7FFFFFFF
+            v2 = raw & 0x7FFFFFFF
+            children = [v1, v2] if v1 > v2 else list(range(v1, v2 + 1))
+            memo[label] = combine(
+                [naive(labels, c, leaf, combine, memo) for c in children]
+            )
+    return memo[label]
+
+
+def test_fold_labels(tmp_path):
+    path = tmp_path / "trace.tdag"
+    write_tdag(path, LABELS, [])
+    with open(path, "rb") as f:
+        tdfile = TDFile(f)
+        assert fold_labels(tdfile, DepthFold()) == [0, 0, 0, 0, 0, 1, 1, 2, 2]
+        assert source_counts(tdfile) == [0, 1, 1, 1, 1, 2, 2, 3, 3]
+
+        arrays = TDLabelArrays(tdfile)
+        assert arrays.is_union.tolist() == [0, 0, 0, 0, 0, 1, 0, 1, 1]
+        assert arrays.is_range.tolist() == [0, 0, 0, 0, 0, 0, 1, 0, 0]
+        assert arrays.affects_control_flow.tolist() == [0] * 7 + [1, 0]
+        assert label_depths(arrays).tolist() == [0, 0, 0, 0, 0, 1, 1, 2, 2]
+        assert min_source_offsets(arrays).tolist()[1:] == [0, 1, 0, 1, 0, 0, 0, 0]
+        assert max_source_offsets(arrays).tolist() == [-1, 0, 1, 0, 1, 0, 1, 1, 1]
+
+
+def test_reduce_labels_matches_naive(tmp_path):
+    path = tmp_path / "trace.tdag"
+    labels = random_labels(3000, 1)
+    write_tdag(path, labels, [])
+    with open(path, "rb") as f:
+        tdfile = TDFile(f)
+        arrays = TDLabelArrays(tdfile)
+        depths = label_depths(arrays)
+        assert np.array_equal(depths, fold_labels(tdfile, DepthFold()))
+        lows = min_source_offsets(arrays)
+        highs = max_source_offsets(arrays)
+        offset = lambda raw: (raw >> 8) & ((1 << 54) - 1)  # noqa: E731
+        counts = source_counts(tdfile)
+        byte = lambda raw: frozenset([(raw & 0xFF, offset(raw))])  # noqa: E731
+        union_all = lambda v: frozenset().union(*v)  # noqa: E731
+        memos = ({}, {}, {}, {})
+        for label in range(1, len(labels)):
+            depth = naive(labels, label, lambda _: 0, lambda v: max(v) + 1, memos[0])
+            assert depths[label] == depth
+            assert lows[label] == naive(labels, label, offset, min, memos[1])
+            assert highs[label] == naive(labels, label, offset, max, memos[2])
+            assert counts[label] == len(naive(labels, label, byte, union_all, memos[3]))
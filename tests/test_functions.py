@@ -0,0 +1,84 @@
+from polytracker.mapping import FunctionAttribution
+from polytracker.taint_dag import TDFile, TDLabelResolver, merge_source_intervals
+
+from .tdag_builders import LABELS, source, union, write_tdag, write_trace
+
+
+def test_merge_source_intervals():
+    assert merge_source_intervals([(1, 4, 6), (0, 2, 3), (1, 0, 4), (0, 0, 1)]) == (
+        (0, 0, 1),
+        (0, 2, 3),
+        (1, 0, 6),
+    )
+
+
+def test_label_resolver(tmp_path):
+    path = tmp_path / "trace.tdag"
+    write_tdag(path, LABELS, [])
+    with open(path, "rb") as f:
+        resolver = TDLabelResolver(TDFile(f))
+        assert resolver.resolve(0) == ()
+        assert resolver.resolve(8) == ((0, 0, 2), (1, 0, 1))
+        # The labels referenced by 8 were resolved and cached along the way
+        assert resolver.cache[5] == ((0, 0, 1), (1, 0, 1))
+        assert resolver.resolve(7) == ((0, 0, 2), (1, 1, 2))
+        assert resolver.resolve_all([7, 8]) == ((0, 0, 2), (1, 0, 2))
+
+
+def test_bounded_label_resolver(tmp_path):
+    path = tmp_path / "trace.tdag"
+    write_tdag(path, LABELS, [])
+    with open(path, "rb") as f:
+        tdfile = TDFile(f)
+        unbounded = TDLabelResolver(tdfile, max_intervals=None)
+        # Too small to even hold every label referenced by a single label
+        bounded = TDLabelResolver(tdfile, max_intervals=4)
+        for label in range(len(LABELS)):
+            assert bounded.resolve(label) == unbounded.resolve(label)
+            assert bounded.cache.total_cost <= 4 or len(bounded.cache) == 1
+        # The least recently used labels are evicted first
+        assert len(LABELS) - 1 in bounded.cache
+        assert 1 not in bounded.cache
+        assert tdfile.resolver is tdfile.resolver
+
+
+def test_deep_label_resolver(tmp_path):
+    # Every label is referenced by two later labels, and the closure of the last
+    # label is the whole trace
+    labels = [0] + [source(0, offset) for offset in range(4)]
+    labels += [union(i - 1, i - 4) for i in range(5, 3000)]
+    path = tmp_path / "trace.tdag"
+    write_tdag(path, labels, [])
+    with open(path, "rb") as f:
+        resolver = TDLabelResolver(TDFile(f), max_intervals=4)
+        assert resolver.resolve(len(labels) - 1) == ((0, 0, 4),)
+        assert resolver.resolve(6) == ((0, 0, 2), (0, 3, 4))
+
+
+def test_function_attribution(tmp_path):
+    path = write_trace(tmp_path)
+    input_path = str(tmp_path / "input.txt")
+    with open(path, "rb") as f:
+        attribution = FunctionAttribution(TDFile(f), ["main", "parse", "item"])
+        functions = attribution.functions()
+        assert set(functions) == {"parse", "item"}
+        assert [(str(p), i.tolist()) for p, i in functions["parse"].items()] == [
+            (input_path, [[0, 1], [3, 4]])
+        ]
+        assert [(str(p), i.tolist()) for p, i in functions["item"].items()] == [
+            (input_path, [[1, 3]])
+        ]
+
+        callstacks = attribution.callstacks()
+        assert set(callstacks) == {("main", "parse"), ("main", "parse", "item")}
+        assert [i.tolist() for i in callstacks[("main", "parse", "item")].values()] == [
+            [[1, 3]]
+        ]
+
+        infos = {info.name: info for info in attribution.function_infos()}
+        item = infos["item"]
+        assert item.called_from == {"parse"}
+        assert list(item.cmp_chunks()) == [(input_path, (1, 3))]
+        assert item.cmp_bytes == {input_path: [1, 2]}
+        assert item.input_bytes == item.cmp_bytes
+        assert list(item.taint_sources) == [input_path]
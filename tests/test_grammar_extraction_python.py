@@ -1,5 +1,6 @@
 from abc import ABC
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import pytest
@@ -13,9 +14,18 @@ from polytracker import (
     Taints,
     TaintOutput,
 )
-from polytracker.grammars import Grammar, parse_tree_to_grammar
+from polytracker.grammars import (
+    Grammar,
+    merge_grammars,
+    parse_tree_to_grammar,
+)
 from polytracker.inputs import Input
-from polytracker.parsing import NonGeneralizedParseTree, trace_to_non_generalized_tree
+from polytracker.parsing import (
+    NonGeneralizedParseTree,
+    Terminal,
+    TerminalTrie,
+    trace_to_non_generalized_tree,
+)
 from polytracker.tracing import (
     BasicBlockEntry,
     FunctionEntry,
@@ -461,3 +471,148 @@ def test_grammar_simplification(simple_grammar: GrammarTestCase):
     m = simple_grammar.simplified_grammar.match(simple_grammar.input_string)
     assert bool(m)
     # print(m.parse_tree.to_dag().to_dot(labeler=lambda t: repr(str(t.value))))
+
+
+def test_compiled_grammar_matching(simple_grammar: GrammarTestCase):
+    for grammar in (simple_grammar.grammar, simple_grammar.simplified_grammar):
+        m = grammar.match(simple_grammar.input_string, compiled=True)
+        assert bool(m)
+        tree = m.parse_tree
+        assert tree is not None
+        assert (
+            b"".join(
+                leaf.value.terminal
+                for leaf in tree.leaves()
+                if isinstance(leaf.value, Terminal)
+            )
+            == simple_grammar.input_string
+        )
+        assert not grammar.match(b'(1, 2, ("foo", 5, "bar"), 3, 4', compiled=True)
+
+
+def test_compiled_grammar_nullable_and_recursive():
+    grammar = Grammar()
+    grammar.load(
+        {
+            "<START>": [["<LIST>"]],
+            "<LIST>": [["<LIST>", "<ITEM>"], []],
+            "<ITEM>": [["<WS>", "a"], ["<WS>", "bc"], ["<LIST>", "<LIST>", "d"]],
+            "<WS>": [[" "], []],
+        }
+    )
+    grammar.start = grammar["<START>"]
+    compiled = grammar.compile()
+    assert compiled.nullable[compiled.production_index["<LIST>"]]
+    assert not compiled.nullable[compiled.production_index["<ITEM>"]]
+    for sentence in (b"", b"a", b" a bc", b"abcd a", b"dddd"):
+        m = compiled.match(sentence)
+        assert bool(m)
+        tree = m.parse_tree
+        assert tree is not None
+        assert (
+            b"".join(
+                leaf.value.terminal
+                for leaf in tree.leaves()
+                if isinstance(leaf.value, Terminal)
+            )
+            == sentence
+        )
+    with pytest.raises(ValueError):
+        compiled.match(b"ab").parse_tree
+
+
+def test_terminal_trie():
+    trie = TerminalTrie([b"a", b"ab", b"abc", b"b", Terminal("bcd")])
+    assert trie.add(b"ab") == 1
+    assert len(trie) == 5
+    assert trie.matches(b"abcd") == [0, 1, 2]
+    assert trie.prefixes(b"abcd", 1) == {b"b", b"bcd"}
+    assert trie.prefixes(b"abcd", 2) == set()
+    assert trie.prefixes(b"abcd", 4) == set()
+
+
+def test_partial_match(simple_grammar: GrammarTestCase):
+    trees = list(simple_grammar.grammar.find_partial_trees(b"(1, 2"))
+    assert trees
+    for tree in trees:
+        assert (
+            b"".join(
+                leaf.value.terminal
+                for leaf in tree.leaves()
+                if isinstance(leaf.value, Terminal)
+            )
+            == b"(1, 2"
+        )
+
+
+def test_grammar_simplification_fixed_point():
+    grammar = Grammar()
+    grammar.load(
+        {
+            "<START>": [["<A>"]],
+            "<A>": [["<B>", "<C>"], ["<B>", "<D>"]],
+            "<B>": [["<E>"]],
+            "<C>": [["c", "<EMPTY>"]],
+            # inlining <E> into <D> makes both of its rules "x", leaving a single rule
+            "<D>": [["<E>"], ["x"]],
+            "<E>": [["x"]],
+            "<EMPTY>": [["<EMPTY>"], []],
+        }
+    )
+    grammar.start = grammar["<START>"]
+    grammar["<START>"].removable = False
+    sentences = [b"xc", b"xx"]
+    assert all(grammar.match(s, compiled=True) for s in sentences)
+
+    assert grammar.simplify()
+    grammar.verify()
+    assert set(p.name for p in grammar) == {"<START>", "<A>"}
+    assert set(map(str, grammar["<A>"].rules)) == {'"xc"', '"xx"'}
+    assert all(grammar.match(s, compiled=True) for s in sentences)
+    assert not grammar.simplify()
+
+
+def test_grammar_merge_and_deduplicate():
+    first = Grammar()
+    first.load({"<START>": [["<A>"]], "<A>": [["a"]], "<B>": [["b"]]})
+    first.start = first["<START>"]
+    second = Grammar()
+    second.load({"<START>": [["<A>"], ["<C>", "<B>"]], "<A>": [["a"], ["b"]]})
+    second.load({"<C>": [["a"], ["b"]], "<B>": [["b"]]})
+    second.start = second["<START>"]
+    for grammar in (first, second):
+        grammar["<START>"].removable = False
+
+    merged = merge_grammars([first, second])
+    merged.verify()
+    assert merged.start is merged["<START>"]
+    assert not merged["<START>"].removable
+    assert set(map(str, merged["<A>"].rules)) == {'"a"', '"b"'}
+    assert all(rule.grammar is merged for prod in merged for rule in prod)
+
+    # <A> and <C> now have the same rules
+    assert merged.deduplicate()
+    merged.verify()
+    assert "<C>" not in merged
+    assert set(map(str, merged["<START>"].rules)) == {"<A>", "<A> <B>"}
+    assert not merged.deduplicate()
+
+
+def input_grammar(inputstr: bytes) -> Grammar:
+    return parse_tree_to_grammar(trace_to_non_generalized_tree(make_trace(inputstr)[1]))
+
+
+def test_merge_grammars_of_traces():
+    inputs = [b"(1, 2)", b'("foo", (3))', b"()"]
+    grammar = merge_grammars(map(input_grammar, inputs))
+    grammar.verify()
+    for inputstr in inputs:
+        assert grammar.match(inputstr, compiled=True)
+    # the merged grammar generalizes beyond the individual inputs
+    assert grammar.match(b'(1, ("foo"))', compiled=True)
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        parallel = merge_grammars(executor.map(input_grammar, inputs), executor)
+    assert {p.name: set(map(str, p.rules)) for p in parallel} == {
+        p.name: set(map(str, p.rules)) for p in grammar
+    }
@@ -0,0 +1,167 @@
+from argparse import ArgumentParser
+import json
+import os
+import subprocess
+from typing import Optional
+
+import pytest
+
+from polytracker import build
+from polytracker.build import ArtifactCache, InstrumentTargets, _run_stage
+
+
+def test_artifact_cache_key(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache")
+    source = tmp_path / "source.bc"
+    source.write_bytes(b"first")
+    key = cache.key("opt-bc", [source], ["13.0.1"])
+    assert key == cache.key("opt-bc", [source], ["13.0.1"])
+    assert key != cache.key("opt-bc", [source], ["14.0.0"])
+    assert key != cache.key("lower-bc", [source], ["13.0.1"])
+    source.write_bytes(b"second")
+    assert key != cache.key("opt-bc", [source], ["13.0.1"])
+
+    output = tmp_path / "output.bc"
+    assert not cache.fetch(key, output)
+    output.write_bytes(b"artifact")
+    cache.store(key, output)
+    output.unlink()
+    assert cache.fetch(key, output)
+    assert output.read_bytes() == b"artifact"
+
+
+def test_run_stage(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache")
+    source = tmp_path / "source.bc"
+    source.write_bytes(b"bitcode")
+    output = tmp_path / "source.cflog.bc"
+    function_ids = tmp_path / "source.functionid.json"
+    builds = []
+
+    def stage(extra_outputs):
+        def build():
+            builds.append(source)
+            output.write_bytes(b"instrumented")
+            function_ids.write_text('["main"]')
+
+        _run_stage(
+            cache, "preopt-instrument-bc", [source], [], output, build, extra_outputs
+        )
+
+    # An artifact stored without the extra output is not a hit
+    stage([])
+    stage([function_ids])
+    assert len(builds) == 2
+
+    output.unlink()
+    function_ids.unlink()
+    stage([function_ids])
+    assert len(builds) == 2
+    assert output.read_bytes() == b"instrumented"
+    assert function_ids.read_text() == '["main"]'
+
+
+@pytest.fixture
+def toolchain(tmp_path, monkeypatch):
+    """Replaces the LLVM tools run by each instrumentation stage, and returns the
+    stages run, as (stage, target) pairs"""
+    abi_lists = tmp_path / "compiler" / "abi_lists"
+    abi_lists.mkdir(parents=True)
+    for name in ("polytracker_abilist.txt", "dfsan_abilist.txt"):
+        (abi_lists / name).write_text("fun:main=uninstrumented\n")
+    (tmp_path / "cxx").mkdir()
+    monkeypatch.setenv("COMPILER_DIR", str(tmp_path / "compiler"))
+    monkeypatch.setenv("CXX_LIB_PATH", str(tmp_path / "cxx"))
+    monkeypatch.delenv("DFSAN_LIB_PATH", raising=False)
+    monkeypatch.setattr(build, "_opt_version", lambda: "LLVM version 13.0.1")
+    monkeypatch.setattr(build, "_executable_digest", lambda name: name)
+
+    stages = []
+
+    def stage(name, output, *inputs):
+        stages.append((name, output.name.split(".")[0]))
+        output.write_bytes(b"".join(path.read_bytes() for path in inputs))
+
+    def extract(binary, output):
+        if binary.name == "broken.bin":
+            raise subprocess.CalledProcessError(1, ["get-bc", str(binary)])
+        stage("extract-bc", output, binary)
+
+    def preopt(bitcode, output, function_ids):
+        stage("preopt-instrument-bc", output, bitcode)
+        function_ids.write_text(json.dumps([bitcode.stem]))
+
+    monkeypatch.setattr(build, "_extract_bitcode", extract)
+    monkeypatch.setattr(build, "_preopt_instrument_bitcode", preopt)
+    monkeypatch.setattr(build, "_optimize_bitcode", lambda i, o: stage("opt-bc", o, i))
+    monkeypatch.setattr(
+        build, "_instrument_bitcode", lambda i, o, *_: stage("instrument-bc", o, i)
+    )
+    monkeypatch.setattr(
+        build, "_lower_bitcode", lambda i, o, _: stage("lower-bc", o, i)
+    )
+
+    work = tmp_path / "work"
+    work.mkdir()
+    monkeypatch.chdir(work)
+    with open("blight_journal.jsonl", "w") as journal:
+        for name in ("a.bin", "b.bin", "broken.bin"):
+            (work / name).write_bytes(name.encode())
+            entry = {
+                "FindOutputs": {"outputs": [{"path": str(work / name)}]},
+                "FindInputs": {"inputs": []},
+            }
+            journal.write(json.dumps(entry) + "\n")
+    return stages
+
+
+def instrument(tmp_path, *targets: str) -> Optional[int]:
+    parser = ArgumentParser()
+    command = InstrumentTargets(parser)
+    args = parser.parse_args(
+        [*targets, "--cflog", "--jobs", "2", "--cache-dir", str(tmp_path / "cache")]
+    )
+    return command.run(args)
+
+
+def test_instrument_targets(tmp_path, toolchain, capsys):
+    # A failing target is reported, and the others are still instrumented
+    assert instrument(tmp_path, "a.bin", "broken.bin", "b.bin") == 1
+    out, err = capsys.readouterr()
+    assert "Instrumented a.bin: a.instrumented" in out
+    assert "Instrumented b.bin: b.instrumented" in out
+    assert "Failed to instrument broken.bin" in err
+    assert json.loads(open("a.functionid.json").read()) == ["a"]
+    assert json.loads(open("b.functionid.json").read()) == ["b"]
+    assert len(toolchain) == 10
+
+    # Every stage is restored from the cache, along with its function ids
+    toolchain.clear()
+    for path in ("a.instrumented", "a.functionid.json"):
+        (tmp_path / "work" / path).unlink()
+    assert not instrument(tmp_path, "a.bin")
+    assert toolchain == []
+    assert (tmp_path / "work" / "a.instrumented").read_bytes() == b"a.bin"
+    assert json.loads(open("a.functionid.json").read()) == ["a"]
+    # A single target also gets its function ids as functionid.json
+    assert json.loads(open("functionid.json").read()) == ["a"]
+
+    # Changing an ABI list passed to every target runs instrumentation again
+    abi_list = tmp_path / "compiler" / "abi_lists" / "dfsan_abilist.txt"
+    abi_list.write_text("fun:main=discard\n")
+    assert not instrument(tmp_path, "a.bin")
+    # The fake instrumentation output did not change, so it is lowered from the cache
+    assert toolchain == [("instrument-bc", "a")]
+
+
+def test_toolchain_fingerprint(tmp_path, toolchain):
+    library = tmp_path / "compiler" / "lib" / "libPolytracker.a"
+    library.parent.mkdir()
+    library.write_bytes(b"runtime")
+    fingerprint = build._toolchain_fingerprint()
+    assert ("opt", "LLVM version 13.0.1") in fingerprint
+    # Only the contents of a library identify it
+    os.utime(library, (0, 0))
+    assert build._toolchain_fingerprint() == fingerprint
+    library.write_bytes(b"patched")
+    assert build._toolchain_fingerprint() != fingerprint
@@ -1,6 +1,9 @@
+from pathlib import Path
 from polytracker import plugins
 import pytest
 import logging
+import subprocess
+import sys
 
 logger = logging.getLogger("test_plugins:")
 
@@ -100,3 +103,55 @@ def test_subcommand_assignment():
 
         def run(self, args):
             pass
+
+
+def test_command_manifest():
+    plugins.load_all_commands()
+    for name, lazy in plugins.COMMAND_MANIFEST.items():
+        assert name in plugins.COMMANDS
+        assert plugins.COMMANDS[name].__module__ == lazy.module
+        assert plugins.COMMANDS[name].help == lazy.help
+    builtin = {
+        name
+        for name, command in plugins.COMMANDS.items()
+        if command.__module__.startswith("polytracker.")
+    }
+    assert builtin == plugins.COMMAND_MANIFEST.keys()
+
+
+SLOW_IMPORTS = (
+    "docker",
+    "graphviz",
+    "networkx",
+    "PIL",
+    "prompt_toolkit",
+    "pygments",
+)
+
+
+@pytest.mark.parametrize(
+    "argv", [["--help"], ["info", "--help"], ["cavities", "--help"]]
+)
+def test_lazy_command_imports(argv):
+    """Dispatching a command must not import the dependencies of unrelated commands"""
+    script = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "from polytracker.__main__ import main\n"
+        f"sys.argv = ['polytracker', *{argv!r}]\n"
+        "try:\n"
+        "    main()\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "sys.stderr.write(f'{time.perf_counter() - start:.3f}\\n')\n"
+        f"sys.exit(len([m for m in {SLOW_IMPORTS!r} if m in sys.modules]))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=Path(__file__).parent.parent,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    logger.info(f"polytracker {' '.join(argv)} started in {result.stderr.strip()}s")
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,57 @@
+from argparse import ArgumentParser
+import json
+import pstats
+
+from polytracker.mapping import FileCavities, MapInputsToOutputs
+from polytracker.profiling import METRICS
+
+from .tdag_builders import LABELS, write_tdag
+
+SINKS = [(0, 8, 0), (1, 7, 0), (2, 7, 0), (3, 3, 1)]
+
+
+def run(command_type, *argv):
+    parser = ArgumentParser()
+    command = command_type(parser)
+    return command.run(parser.parse_args(list(map(str, argv))))
+
+
+def test_timings(tmp_path, capsys):
+    trace = tmp_path / "trace.tdag"
+    write_tdag(trace, LABELS, SINKS)
+    timings = tmp_path / "timings.json"
+    assert run(FileCavities, trace, "--timings", timings) is None
+    assert capsys.readouterr().out
+
+    report = json.loads(timings.read_text())
+    assert report["command"] == "cavities"
+    assert report["wall_seconds"] > 0 and report["peak_rss"] > 0
+    for name in (
+        "cavities.index_sources",
+        "cavities.walk_sinks",
+        "cavities.merge_markers",
+        "cavities.output",
+    ):
+        assert report["phases"][name]["calls"] == 1
+    counters = report["counters"]
+    assert counters["tdag.bytes_mapped"] == trace.stat().st_size
+    assert counters["cavities.input_labels"] == 4
+    assert counters["tdag.labels_decoded"] > 0
+
+    # Timings are only collected while a command runs with --timings
+    assert not METRICS.enabled
+    METRICS.reset()
+    assert run(FileCavities, trace) is None
+    assert not METRICS.phases and not METRICS.counters
+
+
+def test_profile(tmp_path, capsys):
+    trace = tmp_path / "trace.tdag"
+    write_tdag(trace, LABELS, SINKS)
+    stats = tmp_path / "mapping.prof"
+    run(MapInputsToOutputs, trace, "--profile", stats)
+    functions = {name for _, _, name in pstats.Stats(str(stats)).stats}
+    assert "mapping" in functions
+
+    run(MapInputsToOutputs, trace, "--profile", "-")
+    assert "cumulative" in capsys.readouterr().err
@@ -0,0 +1,114 @@
+from argparse import ArgumentParser
+from ctypes import sizeof
+
+from polytracker.taint_dag import (
+    compact,
+    read_section_headers,
+    slice_tdag,
+    TDFile,
+    TDFileWriter,
+    TDInfo,
+    TDFileMeta,
+    TDRuntimeStats,
+    TDSectionMeta,
+    TDSectionUsage,
+)
+
+from .tdag_builders import LABELS, write_tdag
+
+SINKS = [(0, 8, 0), (1, 7, 0)]
+
+STATS = TDRuntimeStats(
+    start_time_ns=1_700_000_000_000_000_000,
+    duration_ns=2_500_000_000,
+    unions_requested=10,
+    unions_identical=1,
+    unions_short_circuited=4,
+    unions_deduplicated=2,
+    unions_created=3,
+    section_count=2,
+)
+USAGE = [TDSectionUsage(2, 0, 80, 800), TDSectionUsage(10, 0, 0, 1024)]
+
+
+def add_runtime_stats(path):
+    """Rewrites the trace at `path` with a runtime statistics section"""
+    with open(path, "rb") as f:
+        contents = f.read()
+    _, headers = read_section_headers(contents)
+    writer = TDFileWriter()
+    for hdr in headers:
+        writer.add_section(
+            hdr.tag, hdr.align, contents[hdr.offset : hdr.offset + hdr.size]
+        )
+    writer.add_section(10, 8, bytes(STATS) + b"".join(bytes(usage) for usage in USAGE))
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def test_runtime_stats(tmp_path, capsys):
+    trace = tmp_path / "trace.tdag"
+    write_tdag(trace, LABELS, SINKS)
+    with open(trace, "rb") as f:
+        tdfile = TDFile(f)
+        assert tdfile.runtime_stats is None
+        assert tdfile.section_usage == []
+
+    add_runtime_stats(trace)
+    with open(trace, "rb") as f:
+        tdfile = TDFile(f)
+        stats = tdfile.runtime_stats
+        assert stats is not None
+        assert bytes(stats) == bytes(STATS)
+        assert [bytes(usage) for usage in tdfile.section_usage] == list(
+            map(bytes, USAGE)
+        )
+
+    parser = ArgumentParser()
+    info = TDInfo(parser)
+    info.run(parser.parse_args([str(trace), "--print-runtime-stats"]))
+    out = capsys.readouterr().out
+    assert "Run started: 2023-11-14T22:13:20+00:00" in out
+    assert "Run duration: 2.500s" in out
+    assert "short-circuited: 4 (40.0%)" in out
+    assert "labels: 80 of 800 bytes (10.0%)" in out
+
+    # The statistics are kept by compaction, but a slice does not describe a run
+    compacted = tmp_path / "compacted.tdag"
+    with open(trace, "rb") as src, open(compacted, "wb") as dst:
+        compact(src, dst)
+    sliced = tmp_path / "sliced.tdag"
+    with open(trace, "rb") as src, open(sliced, "wb") as dst:
+        slice_tdag(TDFile(src), dst, sink_offsets=[0])
+    with open(compacted, "rb") as f:
+        assert bytes(TDFile(f).runtime_stats) == bytes(STATS)
+    with open(sliced, "rb") as f:
+        assert TDFile(f).runtime_stats is None
+
+
+def test_runtime_stats_layout():
+    # Must match RuntimeStatsHeader and SectionUsage in runtime_stats.h
+    assert sizeof(TDRuntimeStats) == 64
+    assert sizeof(TDSectionUsage) == 24
+    # Must match SectionMeta in outputfile.h
+    assert sizeof(TDSectionMeta) == 32
+
+
+def test_section_capacities_without_stats(tmp_path, capsys):
+    trace = tmp_path / "trace.tdag"
+    write_tdag(trace, LABELS, SINKS)
+    # As written by a run that aborted: the capacities are recorded up front,
+    # but no section was ever given its size
+    with open(trace, "r+b") as f:
+        _, headers = read_section_headers(f.read())
+        f.seek(sizeof(TDFileMeta))
+        for hdr in headers:
+            hdr.capacity, hdr.size = 1 << 20, 0
+            f.write(bytes(hdr))
+
+    parser = ArgumentParser()
+    info = TDInfo(parser)
+    info.run(parser.parse_args([str(trace), "--print-runtime-stats"]))
+    out = capsys.readouterr().out
+    assert "No runtime statistics were recorded" in out
+    assert "labels: 1048576 bytes" in out
@@ -0,0 +1,169 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import socket
+from threading import Thread
+
+import pytest
+
+from polytracker.server import (
+    make_server,
+    QUERIES,
+    QueryError,
+    TraceClient,
+    TraceServer,
+)
+
+from .tdag_builders import LABELS, write_tdag
+
+SINKS = [(0, 8, 0), (1, 7, 0), (2, 7, 0), (3, 3, 1)]
+
+
+@contextmanager
+def serve(unix_socket, workers=4, **kwargs):
+    server = make_server(TraceServer(max_traces=2), workers, unix_socket, **kwargs)
+    server.quiet = True
+    thread = Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield unix_socket
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@pytest.fixture
+def server(tmp_path):
+    with serve(tmp_path / "serve.sock") as unix_socket:
+        yield unix_socket
+
+
+def test_serve_queries(tmp_path, server):
+    trace = tmp_path / "trace.tdag"
+    write_tdag(trace, LABELS, SINKS)
+    client = TraceClient(server)
+
+    info = client.query("info", trace)
+    assert info["labels"] == len(LABELS)
+    assert info["fds"] == ["a.bin", "b.bin"]
+    assert info["functions"] == ["main"]
+    assert info["sink_bytes"] == 4
+
+    assert client.query("backward", trace, sink="a.bin", offsets=[1]) == {
+        "sources": {"a.bin": [[0, 2]], "b.bin": [[1, 2]]}
+    }
+    assert client.query("backward", trace, labels=[3, 8]) == {
+        "sources": {"a.bin": [[0, 2]], "b.bin": [[0, 1]]}
+    }
+    assert client.query("forward", trace, source="a.bin", offsets=[1]) == {
+        "labels": 4,
+        "sinks": {"a.bin": [[0, 3]]},
+    }
+    assert client.query("forward", trace, source="b.bin", offsets=[0]) == {
+        "labels": 3,
+        "sinks": {"a.bin": [[0, 1]], "b.bin": [[3, 4]]},
+    }
+    assert client.query("sinks", trace, sources=True) == {
+        "sinks": {"a.bin": [[0, 3]], "b.bin": [[3, 4]]},
+        "sources": {"a.bin": [[0, 2]], "b.bin": [[0, 2]]},
+    }
+    mapping = client.query("mapping", trace)["mapping"]
+    assert {"input": ["b.bin", 0], "outputs": [["a.bin", 0], ["b.bin", 3]]} in mapping
+
+    with pytest.raises(QueryError, match="unknown query"):
+        client.query("nonexistent", trace)
+    with pytest.raises(QueryError, match="is not a source or sink"):
+        client.query("forward", trace, source="c.bin")
+    with pytest.raises(QueryError, match="No such file"):
+        client.query("info", tmp_path / "missing.tdag")
+
+    # A trace that changed on disk is reopened
+    write_tdag(trace, LABELS, SINKS[:1])
+    assert client.query("info", trace)["sink_bytes"] == 1
+    client.close()
+
+
+def test_serve_concurrent_clients(tmp_path, server):
+    traces = []
+    for i in range(3):
+        traces.append(tmp_path / f"trace{i}.tdag")
+        write_tdag(traces[-1], LABELS, SINKS[: i + 1])
+
+    def query(i):
+        client = TraceClient(server)
+        try:
+            return [
+                client.query("info", traces[(i + j) % 3])["sink_bytes"]
+                for j in range(10)
+            ]
+        finally:
+            client.close()
+
+    with ThreadPoolExecutor(8) as executor:
+        for i, results in enumerate(executor.map(query, range(8))):
+            assert results == [(i + j) % 3 + 1 for j in range(10)]
+
+
+def test_serve_idle_connections(tmp_path):
+    trace = tmp_path / "trace.tdag"
+    write_tdag(trace, LABELS, SINKS)
+    with serve(tmp_path / "serve.sock", workers=1, timeout=0.5) as unix_socket:
+        # Idle keep-alive connections do not hold the only worker
+        clients = [TraceClient(unix_socket) for _ in range(3)]
+        for _ in range(2):
+            for client in clients:
+                assert client.query("info", trace)["sink_bytes"] == 4
+
+        # A client that stalls in the middle of a request is disconnected
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.connect(str(unix_socket))
+        stalled.sendall(b"POST /info HTTP/1.1\r\nContent-Length: 100\r\n\r\n{")
+        stalled.settimeout(5)
+        assert clients[0].query("info", trace)["sink_bytes"] == 4
+        response = b""
+        received = stalled.recv(4096)
+        while received:
+            response += received
+            received = stalled.recv(4096)
+        assert response.startswith(b"HTTP/1.1 408")
+        stalled.close()
+
+        # Requests that arrive along with the previous one are answered too
+        pipelined = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        pipelined.connect(str(unix_socket))
+        body = f'{{"trace": "{trace}"}}'.encode()
+        request = b"POST /info HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (
+            len(body),
+            body,
+        )
+        pipelined.sendall(request * 2)
+        pipelined.settimeout(5)
+        responses = b""
+        while responses.count(b'"sink_bytes": 4') < 2:
+            received = pipelined.recv(4096)
+            assert received
+            responses += received
+        pipelined.close()
+
+        # Idle connections are eventually closed, and reopened by the client
+        for client in clients:
+            assert client.query("info", trace)["sink_bytes"] == 4
+            client.close()
+
+
+def test_serve_errors(tmp_path, server, monkeypatch):
+    trace = tmp_path / "trace.tdag"
+    write_tdag(trace, LABELS, SINKS)
+    client = TraceClient(server)
+
+    def fail(trace, query):
+        raise RuntimeError("analysis failed")
+
+    monkeypatch.setitem(QUERIES, "fail", fail)
+    with pytest.raises(QueryError, match="RuntimeError: analysis failed"):
+        client.query("fail", trace)
+    with pytest.raises(QueryError, match="Is a directory"):
+        client.query("info", tmp_path)
+    # The connection is still usable after an error
+    assert client.query("info", trace)["sink_bytes"] == 4
+    client.close()
@@ -0,0 +1,63 @@
+from polytracker.taint_dag import (
+    compact,
+    read_section_headers,
+    slice_tdag,
+    TDFile,
+    TDFileWriter,
+    TDSinkRun,
+)
+
+from .tdag_builders import LABELS, write_tdag
+
+# (offset, length, first_label, stride, fdidx)
+RUNS = [(0, 1, 8, 0, 0), (1, 2, 7, 0, 0), (3, 1, 3, 0, 1), (4, 2, 1, 1, 0)]
+
+
+def write_extents(path):
+    """Rewrites the sinks of the trace at `path` as run encoded sinks, with the
+    runs split over a section and two extents the way the runtime writes a sink
+    section that outgrew its reserved memory"""
+    with open(path, "rb") as f:
+        contents = f.read()
+    _, headers = read_section_headers(contents)
+    writer = TDFileWriter()
+    for hdr in headers:
+        if hdr.tag == 4:
+            writer.add_section(9, 8, bytes(TDSinkRun(*RUNS[0])))
+        else:
+            writer.add_section(
+                hdr.tag, hdr.align, contents[hdr.offset : hdr.offset + hdr.size]
+            )
+    writer.add_section(9, 8, b"".join(bytes(TDSinkRun(*run)) for run in RUNS[1:3]))
+    writer.add_section(9, 8, bytes(TDSinkRun(*RUNS[3])))
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def test_sink_extents(tmp_path):
+    trace = tmp_path / "trace.tdag"
+    write_tdag(trace, LABELS, [])
+    write_extents(trace)
+    expected = [(0, 8, 0), (1, 7, 0), (2, 7, 0), (3, 3, 1), (4, 1, 0), (5, 2, 0)]
+
+    with open(trace, "rb") as f:
+        tdfile = TDFile(f)
+        assert [(s.offset, s.label, s.fdidx) for s in tdfile.sinks] == expected
+        assert len(list(tdfile.sink_runs)) == len(RUNS)
+        # Extents are part of the sink section, not sections of their own
+        assert len(tdfile.sections) == len(tdfile.section_headers) - 2
+
+    compacted = tmp_path / "compacted.tdag"
+    with open(trace, "rb") as src, open(compacted, "wb") as dst:
+        compact(src, dst)
+    with open(compacted, "rb") as f:
+        assert [(s.offset, s.label, s.fdidx) for s in TDFile(f).sinks] == expected
+
+    # A slice holds all selected sinks in a single section
+    sliced = tmp_path / "sliced.tdag"
+    with open(trace, "rb") as src, open(sliced, "wb") as dst:
+        slice_tdag(TDFile(src), dst, sink_offsets=[0, 5])
+    with open(sliced, "rb") as f:
+        tdfile = TDFile(f)
+        assert [hdr.tag for hdr in tdfile.section_headers].count(9) == 1
+        assert [s.offset for s in tdfile.sinks] == [0, 5]
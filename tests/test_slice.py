@@ -0,0 +1,81 @@
+from polytracker.taint_dag import (
+    TDFile,
+    TDRangeNode,
+    TDSourceNode,
+    TDUnionNode,
+    backward_closure,
+    slice_tdag,
+)
+
+from .tdag_builders import LABELS, write_tdag
+
+
+def test_backward_closure(tmp_path):
+    path = tmp_path / "trace.tdag"
+    write_tdag(path, LABELS, [])
+    with open(path, "rb") as f:
+        tdfile = TDFile(f)
+        assert [i for i, m in enumerate(backward_closure(tdfile, [7])) if m] == [
+            1,
+            2,
+            4,
+            6,
+            7,
+        ]
+        assert [i for i, m in enumerate(backward_closure(tdfile, [5, 2])) if m] == [
+            1,
+            2,
+            3,
+            5,
+        ]
+
+
+def test_slice(tmp_path):
+    path = tmp_path / "trace.tdag"
+    sliced = tmp_path / "sliced.tdag"
+    # (offset, label, fdidx)
+    write_tdag(path, LABELS, [(0, 8, 0), (1, 7, 0), (2, 7, 0), (3, 3, 1)])
+    with open(path, "rb") as src, open(sliced, "wb") as dst:
+        slice_tdag(TDFile(src), dst, sink_offsets=[1, 2])
+    assert sliced.stat().st_size < path.stat().st_size
+
+    with open(sliced, "rb") as f:
+        tdfile = TDFile(f)
+        # Labels 1, 2, 4, 6 and 7 are renumbered to 1..5
+        assert tdfile.label_count == 6
+        assert [str(p) for p, _ in tdfile.fd_headers] == ["a.bin", "b.bin"]
+        assert list(tdfile.input_labels()) == [1, 2, 3]
+
+        n3 = tdfile.decode_node(3)
+        assert isinstance(n3, TDSourceNode)
+        assert (n3.idx, n3.offset) == (1, 1)
+        n4 = tdfile.decode_node(4)
+        assert isinstance(n4, TDRangeNode)
+        assert (n4.first, n4.last) == (1, 2)
+        n5 = tdfile.decode_node(5)
+        assert isinstance(n5, TDUnionNode)
+        assert (n5.left, n5.right) == (4, 3)
+        assert n5.affects_control_flow
+
+        assert [(s.offset, s.label, s.fdidx) for s in tdfile.sinks] == [
+            (1, 5, 0),
+            (2, 5, 0),
+        ]
+        assert len(list(tdfile.sink_runs)) == 1
+
+
+def test_slice_drops_unused_sources(tmp_path):
+    path = tmp_path / "trace.tdag"
+    sliced = tmp_path / "sliced.tdag"
+    write_tdag(path, LABELS, [(3, 3, 1)])
+    with open(path, "rb") as src, open(sliced, "wb") as dst:
+        slice_tdag(TDFile(src), dst, labels=[3])
+
+    with open(sliced, "rb") as f:
+        tdfile = TDFile(f)
+        assert tdfile.label_count == 2
+        assert [str(p) for p, _ in tdfile.fd_headers] == ["b.bin"]
+        n1 = tdfile.decode_node(1)
+        assert isinstance(n1, TDSourceNode)
+        assert (n1.idx, n1.offset) == (0, 0)
+        assert [(s.offset, s.label, s.fdidx) for s in tdfile.sinks] == [(3, 1, 0)]
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from polytracker.synthetic import encode_varints, SyntheticTrace
+from polytracker.taint_dag import (
+    backward_closure,
+    label_depths,
+    reachable_labels,
+    TDControlFlowLogSection,
+    TDFile,
+    TDLabelArrays,
+    TDSinkRunSection,
+    TDSinkSection,
+)
+
+from .tdag_builders import varint
+
+
+def test_encode_varints():
+    values = [0, 1, 127, 128, 300, (1 << 31) - 1, 1 << 40]
+    assert encode_varints(np.array(values)) == b"".join(map(varint, values))
+
+
+@pytest.mark.parametrize("run_encoded_sinks", [False, True])
+def test_synthetic_trace(tmp_path, monkeypatch, run_encoded_sinks):
+    # Generate several chunks of every section
+    monkeypatch.setattr(SyntheticTrace, "CHUNK_SIZE", 256)
+    synthetic = SyntheticTrace(
+        labels=3000,
+        sources=3,
+        window=32,
+        sinks=500,
+        sink_run_length=7,
+        run_encoded_sinks=run_encoded_sinks,
+        control_flow_records=2000,
+        seed=1,
+    )
+    path = tmp_path / "synthetic.tdag"
+    with open(path, "wb") as f:
+        size = synthetic.write(f)
+    assert path.stat().st_size == size
+
+    with open(path, "rb") as f:
+        tdfile = TDFile(f)
+        assert tdfile.label_count == 3000
+        assert isinstance(
+            tdfile.sections_by_type[TDSinkSection],
+            TDSinkRunSection if run_encoded_sinks else TDSinkSection,
+        )
+
+        arrays = TDLabelArrays(tdfile)
+        sources = np.flatnonzero(arrays.is_source)
+        assert len(sources) == synthetic.source_label_count
+        assert sorted(tdfile.input_labels()) == sources.tolist()
+        for idx, (_, header) in enumerate(tdfile.fd_headers[:3]):
+            offsets = arrays.source_offset[sources][arrays.source_index[sources] == idx]
+            assert sorted(offsets.tolist()) == list(range(header.size))
+        # Every derived label only references smaller labels
+        assert label_depths(arrays).max() > 10
+
+        sinks = list(tdfile.sinks)
+        assert [s.offset for s in sinks] == list(range(500))
+        assert all(0 < s.label < 3000 and s.fdidx == 3 for s in sinks)
+        assert len(list(tdfile.sink_runs)) == 500 // 7 + 1
+        labels = {s.label for s in sinks}
+        closure = backward_closure(tdfile, labels)
+        assert (reachable_labels(arrays, labels) == np.array(closure, bool)).all()
+
+        cflog = tdfile._get_section(TDControlFlowLogSection)
+        records = list(cflog.records())
+        assert len(records) == 2 + (2000 - 2) // 6 * 6
+        depth = 0
+        for event, function_id, label in records:
+            if event == TDControlFlowLogSection.ENTER_FUNCTION:
+                depth += 1
+            elif event == TDControlFlowLogSection.LEAVE_FUNCTION:
+                depth -= 1
+            else:
+                assert 0 < label < 3000
+            assert depth >= 0 and function_id < len(tdfile.fn_headers)
+        assert depth == 0
+
+    # The same seed generates the same trace
+    copy = tmp_path / "copy.tdag"
+    with open(copy, "wb") as f:
+        synthetic.write(f)
+    assert copy.read_bytes() == path.read_bytes()
@@ -0,0 +1,73 @@
+import random
+
+from polytracker.inputs import Input
+from polytracker.tracing import ByteOffset, TaintedRegion, Taints
+
+SOURCE = Input(0, "input.txt", 100)
+OTHER = Input(1, "other.txt", 100)
+
+
+def byte_taints(source: Input, offsets) -> Taints:
+    return Taints(ByteOffset(source, offset) for offset in offsets)
+
+
+def test_taint_regions():
+    taints = Taints(
+        [
+            ByteOffset(OTHER, 5),
+            ByteOffset(SOURCE, 3),
+            TaintedRegion(SOURCE, 0, 3),
+            TaintedRegion(SOURCE, 10, 5),
+            ByteOffset(SOURCE, 12),
+        ]
+    )
+    assert len(taints) == 10
+    assert [(r.source, r.offset, r.length) for r in taints.regions()] == [
+        (SOURCE, 0, 4),
+        (SOURCE, 10, 5),
+        (OTHER, 5, 1),
+    ]
+    assert taints.intervals(SOURCE).tolist() == [[0, 4], [10, 15]]
+    assert [b.offset for b in taints.from_source(OTHER)] == [5]
+    assert taints.includes(SOURCE, 14)
+    assert not taints.includes(SOURCE, 15)
+    assert not taints.includes(Input(2, "unknown", 1), 0)
+    assert taints.bitmap(SOURCE, 12).nonzero()[0].tolist() == [0, 1, 2, 3, 10, 11]
+    assert not taints.bitmap(Input(2, "unknown", 1), 4).any()
+    assert taints == byte_taints(SOURCE, [0, 1, 2, 3, 10, 11, 12, 13, 14]) | Taints(
+        [ByteOffset(OTHER, 5)]
+    )
+    assert not Taints(())
+    # Equal collections hash equally, however they were built
+    assert hash(taints) == hash(Taints(list(taints)))
+    # Inputs are only unique per trace, so the order of sources with the same uid
+    # depends on how the collection was built
+    first, second = Input(0, "a.bin", 10), Input(0, "b.bin", 10)
+    ab = Taints([ByteOffset(first, 0), ByteOffset(second, 1)])
+    ba = Taints([ByteOffset(second, 1), ByteOffset(first, 0)])
+    assert ab == ba
+    assert hash(ab) == hash(ba)
+    assert len({Taints(()), Taints(())}) == 1
+
+
+def test_taint_set_operations():
+    rng = random.Random(0)
+    for _ in range(50):
+        first = {rng.randrange(64) for _ in range(rng.randrange(40))}
+        second = {rng.randrange(64) for _ in range(rng.randrange(40))}
+        a = byte_taints(SOURCE, first)
+        b = byte_taints(SOURCE, second)
+        assert {o.offset for o in a | b} == first | second
+        assert {o.offset for o in a & b} == first & second
+        assert {o.offset for o in a - b} == first - second
+        assert len(a.union(b, byte_taints(OTHER, first))) == len(first | second) + len(
+            first
+        )
+
+
+def test_taint_diff():
+    diff = byte_taints(SOURCE, range(0, 10)).diff(byte_taints(SOURCE, range(5, 12)))
+    assert diff
+    assert [(r.offset, r.length) for r in diff.regions_only_in_first] == [(0, 5)]
+    assert [(r.offset, r.length) for r in diff.regions_only_in_second] == [(10, 2)]
+    assert not byte_taints(SOURCE, [1, 2]).diff(byte_taints(SOURCE, [2, 1]))
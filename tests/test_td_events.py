@@ -0,0 +1,113 @@
+import pytest
+
+from polytracker.grammars import extract
+from polytracker.taint_dag import (
+    TDBasicBlockEntry,
+    TDControlFlowLogSection,
+    TDEvent,
+    TDEventIndex,
+    TDFunctionEntry,
+    TDFunctionReturn,
+    TDProgramTrace,
+    TDTaintedControlFlow,
+)
+
+from .tdag_builders import BRANCH, ENTER, LEAVE, write_trace
+
+
+def test_event_index(tmp_path):
+    trace = TDProgramTrace.load(write_trace(tmp_path))
+    cflog = trace.tdfile._get_section(TDControlFlowLogSection)
+    cflog.function_id_mapping(["main", "parse", "item"])
+
+    assert len(trace) == 19
+    assert trace.num_accesses == 4
+    events = list(trace)
+    assert [type(e) for e in events[:5]] == [
+        TDFunctionEntry,
+        TDBasicBlockEntry,
+        TDFunctionEntry,
+        TDBasicBlockEntry,
+        TDTaintedControlFlow,
+    ]
+    assert trace[18] == events[18]
+    assert 19 not in trace
+    with pytest.raises(KeyError):
+        trace.get_event(19)
+
+    assert [f.name for f in trace.functions] == ["main", "parse", "item"]
+    parse = trace.get_function("parse")
+    assert {f.name for f in parse.calls_to()} == {"item"}
+    assert {f.name for f in parse.called_from()} == {"main"}
+    assert [r.offset for r in parse.taints().regions()] == [0, 3]
+    assert [str(bb) for bb in trace.basic_blocks] == [
+        "main@0",
+        "main@2",
+        "parse@0",
+        "parse@3",
+        "item@0",
+    ]
+
+    entry = trace.entrypoint
+    assert entry is not None
+    assert entry.function.name == "main"
+    assert entry.function_return == events[18]
+    calls = list(next(entry.calls()).calls())
+    assert [c.uid for c in calls] == [5, 10]
+    ret = calls[1].function_return
+    assert isinstance(ret, TDFunctionReturn)
+    assert ret.returning_from.name == "item"
+    assert ret.function.name == "parse"
+    assert str(ret.returning_to) == "parse@3#1"
+    assert [bytes(r) for r in ret.returning_to.taints().regions()] == [b")"]
+
+    accesses = list(trace.access_sequence())
+    assert [a.label for a in accesses] == [1, 2, 3, 4]
+    assert [bytes(r) for r in accesses[1].taints().regions()] == [b"a"]
+    assert str(accesses[1].event.basic_block) == "item@0"
+
+
+def test_event_index_aligns_callstack():
+    index = TDEventIndex(
+        [(ENTER, 0, 0), (ENTER, 1, 0), (BRANCH, 0, 7), (LEAVE, 5, 0), (ENTER, 1, 0)]
+    )
+    kinds = list(index.kinds)
+    # The missing return from 1 is synthesized before the branch in 0, leaving
+    # function 5 is ignored and the open frames are closed at the end of the log
+    assert kinds == [
+        TDEventIndex.FUNCTION_ENTRY,
+        TDEventIndex.BASIC_BLOCK_ENTRY,
+        TDEventIndex.FUNCTION_ENTRY,
+        TDEventIndex.BASIC_BLOCK_ENTRY,
+        TDEventIndex.FUNCTION_RETURN,
+        TDEventIndex.BASIC_BLOCK_ENTRY,
+        TDEventIndex.TAINTED_CONTROL_FLOW,
+        TDEventIndex.FUNCTION_ENTRY,
+        TDEventIndex.BASIC_BLOCK_ENTRY,
+        TDEventIndex.FUNCTION_RETURN,
+        TDEventIndex.BASIC_BLOCK_ENTRY,
+        TDEventIndex.FUNCTION_RETURN,
+    ]
+    assert index.values[6] == 7
+    assert index.frames[6] == 0
+    assert index.values[0] == 11
+    assert index.values[2] == 4
+    assert index.entry_counts[10] == 1
+
+
+def test_function_trace_fallback(tmp_path):
+    entry, exit = TDEvent.Kind.ENTRY.value, TDEvent.Kind.EXIT.value
+    trace = TDProgramTrace.load(
+        write_trace(tmp_path, cflog=[], events=[(entry, 0), (entry, 1), (exit, 1)])
+    )
+    assert [f.name for f in trace.functions] == ["main", "parse"]
+    assert trace.num_accesses == 0
+    assert len(trace) == 7
+
+
+def test_extract_tdag_grammar(tmp_path):
+    path = write_trace(tmp_path)
+    grammar = extract([path])
+    grammar.verify()
+    assert grammar.match(b"(ab)", compiled=True)
+    assert grammar.match(b"(ba)", compiled=True)
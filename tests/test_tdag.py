@@ -169,6 +169,84 @@ def test_output_taints(input_file: Path, program_trace: ProgramTrace):
     assert outputs[5].label == 5
 
 
+@pytest.mark.program_trace("test_tdag.cpp")
+def test_sink_runs(input_file: Path, program_trace: ProgramTrace):
+    assert isinstance(program_trace, taint_dag.TDProgramTrace)
+
+    runs = list(program_trace.tdfile.sink_runs)
+    # One run per write: r2, eq and data[4]
+    assert len(runs) == 3
+
+    # All four bytes of r2 share the same label
+    assert runs[0].offset == 0
+    assert runs[0].length == 4
+    assert runs[0].first_label == 12
+    assert runs[0].stride == 0
+    assert list(runs[0].labels()) == [12]
+
+    assert runs[1].offset == 4
+    assert runs[1].length == 1
+    assert runs[1].first_label == 13
+
+    assert runs[2].offset == 5
+    assert runs[2].length == 1
+    assert runs[2].first_label == 5
+
+    # Expanding the runs yields the individual sink entries
+    sinks = list(program_trace.tdfile.sinks)
+    assert [(s.offset, s.label) for s in sinks] == [
+        (0, 12),
+        (1, 12),
+        (2, 12),
+        (3, 12),
+        (4, 13),
+        (5, 5),
+    ]
+
+
+@pytest.mark.program_trace("test_tdag.cpp")
+def test_compact(tmp_path: Path, trace_file: Path, program_trace: ProgramTrace):
+    assert isinstance(program_trace, taint_dag.TDProgramTrace)
+
+    compacted = tmp_path / "compacted.tdag"
+    with open(trace_file, "rb") as src, open(compacted, "wb") as dst:
+        size = taint_dag.compact(src, dst)
+    assert size == compacted.stat().st_size
+    assert size < trace_file.stat().st_size
+
+    original = program_trace.tdfile
+    with open(compacted, "rb") as f:
+        tdfile = taint_dag.TDFile(f)
+        assert tdfile.label_count == original.label_count
+        assert [tdfile.read_node(lbl) for lbl in range(tdfile.label_count)] == [
+            original.read_node(lbl) for lbl in range(original.label_count)
+        ]
+        assert [str(s) for s in tdfile.sinks] == [str(s) for s in original.sinks]
+        assert [p for p, _ in tdfile.fd_headers] == [p for p, _ in original.fd_headers]
+        assert list(tdfile.input_labels()) == list(original.input_labels())
+
+
+@pytest.mark.program_trace("test_tdag.cpp")
+def test_archive(tmp_path: Path, trace_file: Path, program_trace: ProgramTrace):
+    assert isinstance(program_trace, taint_dag.TDProgramTrace)
+
+    archived = tmp_path / "trace.tdaz"
+    with open(trace_file, "rb") as src, open(archived, "wb") as dst:
+        taint_dag.archive(src, dst)
+
+    original = program_trace.tdfile
+    with open(archived, "rb") as f:
+        tdfile = taint_dag.TDFile(f)
+        assert tdfile.archive is not None
+        assert [tdfile.read_node(lbl) for lbl in range(tdfile.label_count)] == [
+            original.read_node(lbl) for lbl in range(original.label_count)
+        ]
+        assert [str(s) for s in tdfile.sink_runs] == [
+            str(s) for s in original.sink_runs
+        ]
+        assert [p for p, _ in tdfile.fd_headers] == [p for p, _ in original.fd_headers]
+
+
 @pytest.mark.program_trace("test_tdag.cpp")
 def test_inputs_affecting_control_flow(input_file: Path, program_trace: ProgramTrace):
     assert isinstance(program_trace, taint_dag.TDProgramTrace)
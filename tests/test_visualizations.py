@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+from polytracker.inputs import Input
+from polytracker.visualizations import file_diff, temporal_animation
+
+FIRST = np.array([True, True, False, False, True, False, True])
+SECOND = np.array([True, False, True, False, False, True, True])
+
+
+def test_file_diff():
+    image = file_diff(len(FIRST), FIRST, SECOND)
+    assert image.mode == "RGB"
+    width, height = image.size
+    assert width * height >= len(FIRST)
+    pixels = np.asarray(image).reshape(-1, 3)
+    assert pixels[: len(FIRST)].tolist() == [
+        [255, 255, 255],
+        [0, 0, 255],
+        [255, 0, 0],
+        [0, 0, 0],
+        [0, 0, 255],
+        [255, 0, 0],
+        [255, 255, 255],
+    ]
+    # Pixels beyond the end of the file are white
+    assert (pixels[len(FIRST) :] == 255).all()
+
+    # Predicates render the same image
+    predicates = file_diff(
+        len(FIRST), lambda i: bool(FIRST[i]), lambda i: bool(SECOND[i])
+    )
+    assert np.array_equal(np.asarray(predicates), np.asarray(image))
+
+
+def test_temporal_animation(tmp_path):
+    accesses = [[2], [0, 3], [1], [2, 5]]
+    trace = SimpleNamespace(
+        inputs=[Input(0, "input.bin", 6)],
+        num_accesses=len(accesses),
+        access_sequence=lambda: (
+            SimpleNamespace(
+                get_taints=lambda offsets=offsets: [
+                    SimpleNamespace(offset=offset) for offset in offsets
+                ]
+            )
+            for offsets in accesses
+        ),
+    )
+    output = tmp_path / "animation.gif"
+    temporal_animation(str(output), trace)
+
+    # Each frame shows the bytes accessed up to and including its access
+    accessed = np.zeros(6, dtype=bool)
+    with Image.open(output) as gif:
+        for i, offsets in enumerate(accesses):
+            gif.seek(i)
+            accessed[offsets] = True
+            frame = np.asarray(gif.convert("L")).reshape(-1)[:6]
+            assert (frame == 0).tolist() == accessed.tolist()
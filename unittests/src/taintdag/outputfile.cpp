@@ -0,0 +1,95 @@
+/*
+ * Copyright (c) 2022-present, Trail of Bits, Inc.
+ * All rights reserved.
+ *
+ * This source code is licensed in accordance with the terms specified in
+ * the LICENSE file found in the root directory of this source tree.
+ */
+
+#include <catch2/catch.hpp>
+
+#include <cstdint>
+#include <cstdio>
+#include <cstring>
+#include <fstream>
+#include <iterator>
+#include <string>
+#include <vector>
+
+#include "taintdag/labels.h"
+#include "taintdag/outputfile.h"
+#include "taintdag/string_table.h"
+
+namespace td = taintdag;
+
+TEST_CASE("Sections default to their allocation size") {
+  td::OutputFile<td::StringTable, td::Labels> of{std::tmpnam(nullptr)};
+  REQUIRE(of.section_capacity<td::StringTable>() ==
+          td::StringTable::allocation_size);
+  REQUIRE(of.section_capacity<td::Labels>() == td::Labels::allocation_size);
+}
+
+TEST_CASE("Section capacities can be overridden") {
+  td::SectionCapacities capacities{};
+  // Not a multiple of the entry size, rounded down
+  capacities[td::Labels::tag] = 4 * sizeof(td::storage_t) + 3;
+  // Misaligns the following section
+  capacities[td::StringTable::tag] = 66;
+
+  td::OutputFile<td::StringTable, td::Labels> of{std::tmpnam(nullptr), false,
+                                                 capacities};
+  REQUIRE(of.section_capacity<td::StringTable>() == 66);
+  REQUIRE(of.section_capacity<td::Labels>() == 4 * sizeof(td::storage_t));
+
+  SECTION("Following sections are aligned") {
+    auto &labels{of.section<td::Labels>()};
+    auto addr = reinterpret_cast<uintptr_t>(&*labels.begin());
+    REQUIRE(addr % td::Labels::align_of == 0);
+  }
+
+  SECTION("Capacities are reported per section") {
+    size_t n = 0;
+    of.for_each_section([&](uint8_t tag, size_t, size_t capacity) {
+      REQUIRE(capacity == (tag == td::Labels::tag ? 4 * sizeof(td::storage_t)
+                                                  : 66));
+      ++n;
+    });
+    REQUIRE(n == 2);
+  }
+
+  SECTION("Writes beyond the capacity fail") {
+    auto &st{of.section<td::StringTable>()};
+    REQUIRE(st.add_string(std::string(32, 'a')));
+    REQUIRE(!st.add_string(std::string(32, 'b')));
+  }
+}
+
+TEST_CASE("Section capacities are limited to what can be addressed") {
+  td::SectionCapacities capacities{};
+  capacities[td::Labels::tag] = td::Labels::max_allocation_size * 2;
+  td::OutputFile<td::Labels> of{std::tmpnam(nullptr), false, capacities};
+  REQUIRE(of.section_capacity<td::Labels>() ==
+          td::Labels::max_allocation_size);
+}
+
+TEST_CASE("Section capacities are recorded in the file header") {
+  using File = td::OutputFile<td::StringTable, td::Labels>;
+  td::SectionCapacities capacities{};
+  capacities[td::Labels::tag] = 4 * sizeof(td::storage_t);
+  auto path = std::filesystem::path{std::tmpnam(nullptr)};
+  File of{path, false, capacities};
+
+  // Read while the file is still open, as after an aborted run
+  std::ifstream f{path, std::ios::binary};
+  std::vector<char> contents{std::istreambuf_iterator<char>{f}, {}};
+  File::FileHeader header;
+  REQUIRE(contents.size() >= sizeof(header));
+  std::memcpy(&header, contents.data(), sizeof(header));
+  REQUIRE(header.meta.section_count == 2);
+  REQUIRE(header.sections[0].tag == td::StringTable::tag);
+  REQUIRE(header.sections[0].capacity == td::StringTable::allocation_size);
+  REQUIRE(header.sections[1].tag == td::Labels::tag);
+  REQUIRE(header.sections[1].capacity == 4 * sizeof(td::storage_t));
+  REQUIRE(header.sections[1].size == 0);
+  std::filesystem::remove(path);
+}
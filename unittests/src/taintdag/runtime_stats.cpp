@@ -0,0 +1,76 @@
+/*
+ * Copyright (c) 2022-present, Trail of Bits, Inc.
+ * All rights reserved.
+ *
+ * This source code is licensed in accordance with the terms specified in
+ * the LICENSE file found in the root directory of this source tree.
+ */
+
+#include <catch2/catch.hpp>
+
+#include <array>
+#include <cstdio>
+
+#include "taintdag/labels.h"
+#include "taintdag/outputfile.h"
+#include "taintdag/runtime_stats.h"
+
+namespace td = taintdag;
+
+TEST_CASE("Union outcomes are counted") {
+  td::OutputFile<td::Labels> of{std::tmpnam(nullptr)};
+  auto &labels{of.section<td::Labels>()};
+  auto &counters{labels.union_counters};
+  auto [first, last] = labels.create_source_labels(0, 0, 4);
+
+  labels.union_taint(first, first);
+  REQUIRE(counters.identical == 1);
+
+  // Creates a new union, and then finds it among the recent labels
+  auto u = labels.union_taint(first, first + 2);
+  REQUIRE(counters.created == 1);
+  REQUIRE(labels.union_taint(first + 2, first) == u);
+  REQUIRE(counters.deduplicated == 1);
+
+  // The union already includes first
+  REQUIRE(labels.union_taint(u, first) == u);
+  REQUIRE(counters.short_circuited == 1);
+
+  REQUIRE(counters.requested == 4);
+}
+
+TEST_CASE("Runtime stats are recorded with section usage") {
+  td::OutputFile<td::Labels, td::RuntimeStats> of{std::tmpnam(nullptr)};
+  auto &labels{of.section<td::Labels>()};
+  auto &stats{of.section<td::RuntimeStats>()};
+  REQUIRE(stats.header() == nullptr);
+  REQUIRE(stats.sections().empty());
+
+  labels.create_source_labels(0, 0, 4);
+  std::array<td::SectionUsage, 2> usage;
+  size_t n = 0;
+  of.for_each_section([&](uint8_t tag, size_t used, size_t capacity) {
+    usage[n++] =
+        td::SectionUsage{.tag = tag, .used = used, .capacity = capacity};
+  });
+  REQUIRE(n == 2);
+
+  stats.record(
+      td::RuntimeStatsHeader{.duration_ns = 17, .unions_requested = 3}, usage);
+  REQUIRE(stats.size() == sizeof(td::RuntimeStatsHeader) +
+                              2 * sizeof(td::SectionUsage));
+  auto header = stats.header();
+  REQUIRE(header != nullptr);
+  REQUIRE(header->duration_ns == 17);
+  REQUIRE(header->unions_requested == 3);
+  REQUIRE(header->section_count == 2);
+
+  auto sections = stats.sections();
+  REQUIRE(sections.size() == 2);
+  REQUIRE(sections[0].tag == td::Labels::tag);
+  // The zero label and four source labels
+  REQUIRE(sections[0].used == 5 * sizeof(td::storage_t));
+  REQUIRE(sections[0].capacity == td::Labels::allocation_size);
+  REQUIRE(sections[1].tag == td::RuntimeStats::tag);
+  REQUIRE(sections[1].used == 0);
+}
@@ -0,0 +1,169 @@
+/*
+ * Copyright (c) 2022-present, Trail of Bits, Inc.
+ * All rights reserved.
+ *
+ * This source code is licensed in accordance with the terms specified in
+ * the LICENSE file found in the root directory of this source tree.
+ */
+
+#include "taintdag/sink.h"
+
+#include <catch2/catch.hpp>
+
+#include <cstring>
+#include <filesystem>
+#include <fstream>
+#include <iterator>
+#include <vector>
+
+#include "taintdag/outputfile.h"
+
+TEST_CASE("Test sink run encoding") {
+  namespace td = taintdag;
+  td::OutputFile<td::TaintSinkRuns> of{std::tmpnam(nullptr)};
+  auto &sink{of.section<td::TaintSinkRuns>()};
+
+  SECTION("Bytes sharing a label are a single run") {
+    {
+      td::SinkRunEncoder<td::TaintSinkRuns> enc{sink, 1};
+      for (td::sink_offset_t i = 0; i < 4; i++)
+        enc.add(i, 12);
+    }
+    REQUIRE(sink.count() == 1);
+    auto run = *sink.begin();
+    REQUIRE(run.offset == 0);
+    REQUIRE(run.length == 4);
+    REQUIRE(run.first_label == 12);
+    REQUIRE(run.stride == 0);
+    REQUIRE(run.sink == 1);
+  }
+
+  SECTION("Bytes with consecutive labels are a single run") {
+    {
+      td::SinkRunEncoder<td::TaintSinkRuns> enc{sink, 0};
+      for (td::sink_offset_t i = 0; i < 100; i++)
+        enc.add(10 + i, 5 + i);
+    }
+    REQUIRE(sink.count() == 1);
+    auto run = *sink.begin();
+    REQUIRE(run.offset == 10);
+    REQUIRE(run.length == 100);
+    REQUIRE(run.first_label == 5);
+    REQUIRE(run.stride == 1);
+  }
+
+  SECTION("Untainted bytes and label changes split runs") {
+    {
+      td::SinkRunEncoder<td::TaintSinkRuns> enc{sink, 0};
+      enc.add(0, 3);
+      enc.add(1, 3);
+      enc.add(2, 0);
+      enc.add(3, 7);
+      enc.add(4, 5);
+      enc.add(5, 3);
+      enc.add(6, 9);
+    }
+    REQUIRE(sink.count() == 3);
+    auto it = sink.begin();
+    REQUIRE(it->offset == 0);
+    REQUIRE(it->length == 2);
+    REQUIRE(it->stride == 0);
+    ++it;
+    REQUIRE(it->offset == 3);
+    REQUIRE(it->length == 3);
+    REQUIRE(it->first_label == 7);
+    REQUIRE(it->stride == -2);
+    ++it;
+    REQUIRE(it->offset == 6);
+    REQUIRE(it->length == 1);
+    REQUIRE(it->first_label == 9);
+  }
+
+  SECTION("Repeated labels are logged without iterating the bytes") {
+    {
+      td::SinkRunEncoder<td::TaintSinkRuns> enc{sink, 2};
+      enc.add_repeated(100, 4, 1000);
+    }
+    REQUIRE(sink.count() == 1);
+    REQUIRE(sink.begin()->length == 1000);
+    REQUIRE(sink.begin()->first_label == 4);
+  }
+}
+
+namespace {
+namespace td = taintdag;
+
+using SinkFile = td::OutputFile<td::TaintSinkRuns>;
+
+// Returns the sum of the lengths of the runs in all sink sections of the file
+// at `path`
+uint64_t logged_bytes(std::filesystem::path const &path) {
+  std::ifstream f{path, std::ios::binary};
+  std::vector<char> contents{std::istreambuf_iterator<char>{f}, {}};
+  SinkFile::FileHeader header;
+  std::memcpy(&header, contents.data(), sizeof(header));
+  uint64_t bytes = 0;
+  for (size_t i = 0; i < header.meta.section_count; ++i) {
+    auto const &section = header.sections[i];
+    REQUIRE(section.tag == td::TaintSinkRuns::tag);
+    for (auto offset = section.offset; offset < section.offset + section.size;
+         offset += sizeof(td::SinkRunEntry)) {
+      td::SinkRunEntry run;
+      std::memcpy(&run, contents.data() + offset, sizeof(run));
+      bytes += run.length;
+    }
+  }
+  return bytes;
+}
+} // namespace
+
+TEST_CASE("Sinks grow beyond their reserved capacity") {
+  td::SectionCapacities capacities{};
+  capacities[td::TaintSinkRuns::tag] = 2 * sizeof(td::SinkRunEntry);
+  auto path = std::filesystem::path{std::tmpnam(nullptr)};
+  {
+    SinkFile of{path, false, capacities};
+    auto &sink{of.section<td::TaintSinkRuns>()};
+    for (td::sink_offset_t i = 0; i < 5; i++) {
+      sink.log_run(i, 1, i + 1, 0, 0);
+    }
+    REQUIRE(sink.count() == 2);
+    REQUIRE(sink.extents.count() == 3);
+    std::vector<td::label_t> labels;
+    sink.extents.for_each([&](td::SinkRunEntry const &run) {
+      labels.push_back(run.first_label);
+    });
+    REQUIRE(labels == std::vector<td::label_t>{3, 4, 5});
+
+    of.for_each_section([](uint8_t, size_t used, size_t capacity) {
+      REQUIRE(used == 5 * sizeof(td::SinkRunEntry));
+      REQUIRE(capacity ==
+              2 * sizeof(td::SinkRunEntry) +
+                  td::SinkExtents<td::SinkRunEntry>::min_extent_size);
+    });
+  }
+  REQUIRE(logged_bytes(path) == 5);
+}
+
+TEST_CASE("A gigabyte of tainted output is logged") {
+  constexpr uint64_t output_size = uint64_t{1} << 30;
+  constexpr uint32_t write_size = 0x1000;
+  td::SectionCapacities capacities{};
+  capacities[td::TaintSinkRuns::tag] = 16 * sizeof(td::SinkRunEntry);
+  auto path = std::filesystem::path{std::tmpnam(nullptr)};
+  {
+    SinkFile of{path, true, capacities};
+    auto &sink{of.section<td::TaintSinkRuns>()};
+    // Each write carries its own label, so it is logged as a separate run
+    for (uint64_t offset = 0; offset < output_size; offset += write_size) {
+      td::SinkRunEncoder<td::TaintSinkRuns> enc{sink, 0};
+      enc.add_repeated(offset, offset / write_size + 1, write_size);
+    }
+    REQUIRE(sink.count() + sink.extents.count() == output_size / write_size);
+  }
+  // The compacted file only holds the logged runs
+  REQUIRE(std::filesystem::file_size(path) <
+          sizeof(SinkFile::FileHeader) +
+              output_size / write_size * sizeof(td::SinkRunEntry) + 0x1000);
+  REQUIRE(logged_bytes(path) == output_size);
+}